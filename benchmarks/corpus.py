@@ -0,0 +1,56 @@
+import os
+import random
+
+import bencoder
+
+PIECE_HASH_SIZE = 20
+
+
+def generate_torrent(filepath: str, pieces_size: int, source: bytes = b"RED", seed: int = 0) -> str:
+  """
+  Writes a synthetic single-directory torrent whose `pieces` blob is roughly `pieces_size` bytes.
+  """
+
+  rng = random.Random(seed)
+  piece_count = max(1, pieces_size // PIECE_HASH_SIZE)
+  torrent_data = {
+    b"announce": b"https://flacsfor.me/abcdef/announce",
+    b"comment": b"https://redacted.ch/torrents.php?torrentid=1",
+    b"created by": b"fertilizer-benchmarks",
+    b"creation date": 1700000000 + seed,
+    b"info": {
+      b"files": [{b"length": rng.randint(1, 1 << 30), b"path": [f"{i:02d} - track.flac".encode()]} for i in range(12)],
+      b"name": f"Synthetic Release {seed}".encode(),
+      b"piece length": 1 << 18,
+      b"pieces": rng.randbytes(piece_count * PIECE_HASH_SIZE),
+      b"private": 1,
+      b"source": source,
+    },
+  }
+
+  with open(filepath, "wb") as f:
+    f.write(bencoder.encode(torrent_data))
+
+  return filepath
+
+
+def generate_corpus(directory: str, count: int, min_size: int, max_size: int, seed: int = 0) -> list[str]:
+  """
+  Fills `directory` with `count` synthetic torrents whose `pieces` sizes are spread between `min_size` and `max_size`.
+  Existing files with matching names are reused so repeated runs don't regenerate the corpus.
+  """
+
+  os.makedirs(directory, exist_ok=True)
+  rng = random.Random(seed)
+  filepaths = []
+
+  for i in range(count):
+    pieces_size = rng.randint(min_size, max_size)
+    filepath = os.path.join(directory, f"synthetic-{seed}-{i}-{pieces_size}.torrent")
+
+    if not os.path.exists(filepath):
+      generate_torrent(filepath, pieces_size, seed=seed + i)
+
+    filepaths.append(filepath)
+
+  return filepaths
@@ -0,0 +1,55 @@
+"""
+Measures how building the infohash index scales with the number of worker processes.
+
+Usage (from the repository root):
+  python -m benchmarks.index_builder [--count 5000] [--pieces-kb 200] [--max-workers N] [--corpus /tmp/...]
+
+Every run is checked against the serial index, so a parallel result that differs from it fails the benchmark.
+The corpus is read once up front so every run works against a warm page cache.
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.corpus import generate_corpus
+from src.index import CHUNK_SIZE, build_infohash_index
+
+KILOBYTE = 1024
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--count", type=int, default=5000)
+  parser.add_argument("--pieces-kb", type=float, default=200)
+  parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+  parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+  parser.add_argument("--corpus", type=str, default="/tmp/fertilizer-bench/index")
+  args = parser.parse_args()
+
+  pieces_size = int(args.pieces_kb * KILOBYTE)
+  filepaths = generate_corpus(args.corpus, args.count, pieces_size, pieces_size)
+  for filepath in filepaths:
+    with open(filepath, "rb") as f:
+      f.read()
+
+  serial_index = None
+  serial_elapsed = None
+  print(f"{len(filepaths)} torrents, chunk size {args.chunk_size}\n")
+  print(f"{'workers':<9}{'seconds':>10}{'torrents/s':>13}{'speedup':>10}")
+
+  for workers in range(1, args.max_workers + 1):
+    started_at = time.perf_counter()
+    index = build_infohash_index(filepaths, workers=workers, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - started_at
+
+    if serial_index is None:
+      serial_index, serial_elapsed = index, elapsed
+    elif index != serial_index:
+      raise AssertionError(f"Index built with {workers} workers differs from the serial index")
+
+    print(f"{workers:<9}{elapsed:>10.3f}{len(filepaths) / elapsed:>13.0f}{serial_elapsed / elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,98 @@
+"""
+Compares the regular read path against memory-mapped loading when hashing and inspecting large torrents.
+
+Usage (from the repository root):
+  python -m benchmarks.mmap_loading [--count 20] [--min-mb 5] [--max-mb 50] [--corpus /tmp/fertilizer-bench]
+
+Each mode runs in a fresh process so peak RSS is measured independently. Peak RSS includes file-backed pages
+of mapped files, which are shared through the page cache, so the private (anonymous) RSS is reported separately
+on Linux. The corpus is read once up front so both modes run against a warm page cache.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+import tracemalloc
+
+from benchmarks.corpus import generate_corpus
+from src.bencode import LazyDict
+from src.parser import SourceVariantHasher, get_origin_tracker, read_torrent_buffer
+
+MODES = {"read": None, "mmap": 0}
+MEGABYTE = 1024 * 1024
+
+
+def private_rss() -> int:
+  try:
+    with open("/proc/self/status") as f:
+      for line in f:
+        if line.startswith("RssAnon:"):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+
+  return 0
+
+
+def process_file(filepath: str, mmap_threshold: int | None) -> int:
+  data = read_torrent_buffer(filepath, mmap_threshold=mmap_threshold)
+  lazy_data = LazyDict(data)
+  get_origin_tracker(lazy_data)
+  lazy_data[b"info"][b"name"]
+  SourceVariantHasher.from_buffer(data).infohashes_for_sources([b"OPS", b"APL", b""])
+
+  return private_rss()
+
+
+def run_mode(filepaths: list[str], mmap_threshold: int | None, queue):
+  started_at = time.perf_counter()
+  peak_private = 0
+  for filepath in filepaths:
+    peak_private = max(peak_private, process_file(filepath, mmap_threshold))
+  elapsed = time.perf_counter() - started_at
+  peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+  tracemalloc.start()
+  for filepath in filepaths:
+    process_file(filepath, mmap_threshold)
+  _, peak_heap = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  queue.put((elapsed, peak_rss, peak_private, peak_heap))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--count", type=int, default=20)
+  parser.add_argument("--min-mb", type=float, default=5)
+  parser.add_argument("--max-mb", type=float, default=50)
+  parser.add_argument("--corpus", type=str, default="/tmp/fertilizer-bench/mmap")
+  args = parser.parse_args()
+
+  filepaths = generate_corpus(args.corpus, args.count, int(args.min_mb * MEGABYTE), int(args.max_mb * MEGABYTE))
+  total_size = 0
+  for filepath in filepaths:
+    with open(filepath, "rb") as f:
+      total_size += len(f.read())
+
+  context = multiprocessing.get_context("spawn")
+  print(f"{len(filepaths)} torrents, {total_size / MEGABYTE:.1f} MB total\n")
+  print(f"{'mode':<6}{'seconds':>10}{'MB/s':>10}{'peak RSS MB':>14}{'private RSS MB':>17}{'peak heap MB':>15}")
+
+  for mode, mmap_threshold in MODES.items():
+    queue = context.Queue()
+    process = context.Process(target=run_mode, args=(filepaths, mmap_threshold, queue))
+    process.start()
+    elapsed, peak_rss, peak_private, peak_heap = queue.get()
+    process.join()
+
+    throughput = total_size / MEGABYTE / elapsed
+    print(
+      f"{mode:<6}{elapsed:>10.3f}{throughput:>10.1f}{peak_rss / MEGABYTE:>14.1f}"
+      f"{peak_private / MEGABYTE:>17.1f}{peak_heap / MEGABYTE:>15.1f}"
+    )
+
+
+if __name__ == "__main__":
+  main()
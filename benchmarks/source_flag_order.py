@@ -0,0 +1,113 @@
+"""
+Replays recorded lookups to compare how many API calls per torrent the fixed source flag order and the learned
+order (see `SourceFlagStats`) cost.
+
+Usage (from the repository root):
+  python -m benchmarks.source_flag_order [--dataset lookups.jsonl] [--count 10000] [--seed 0]
+
+A dataset has one JSON object per line: `{"tracker": "OPS", "created_at": 1490916601, "source_flag": "APL"}`,
+where `tracker` is the tracker the torrent was looked up on, `created_at` its creation date (or `null`) and
+`source_flag` the flag it was found under (or `null` if it wasn't found). Lookups are replayed in order, with the
+learned order only knowing about the lookups before each one. Without a dataset, a synthetic one is generated.
+"""
+
+import argparse
+import json
+import random
+
+from src.database import Database
+from src.source_flags import SourceFlagStats
+from src.trackers import RedTracker, OpsTracker
+
+TRACKERS = {tracker.site_shortname(): tracker for tracker in (RedTracker, OpsTracker)}
+
+# 2017-11-01, roughly when PTH and APL became RED and OPS
+RENAMED_AT = 1509494400
+
+
+def load_dataset(filepath: str) -> list[tuple]:
+  lookups = []
+
+  with open(filepath) as f:
+    for line in f:
+      if line.strip():
+        lookup = json.loads(line)
+        source_flag = lookup["source_flag"]
+        lookups.append(
+          (
+            TRACKERS[lookup["tracker"]],
+            lookup["created_at"],
+            source_flag.encode() if source_flag is not None else None,
+          )
+        )
+
+  return lookups
+
+
+def generate_dataset(count: int, seed: int = 0) -> list[tuple]:
+  """
+  Generates lookups where torrents from before the trackers were renamed are mostly found under the old flag,
+  newer ones under the current flag, some under no flag at all and a third aren't found.
+  """
+
+  rng = random.Random(seed)
+  lookups = []
+
+  for _ in range(count):
+    tracker = rng.choice(list(TRACKERS.values()))
+    created_at = rng.randint(RENAMED_AT - 4 * 365 * 86400, RENAMED_AT + 6 * 365 * 86400)
+    current_flag, old_flag, no_flag = tracker.source_flags_for_creation()
+
+    if rng.random() < 1 / 3:
+      source_flag = None
+    elif rng.random() < 0.15:
+      source_flag = no_flag
+    else:
+      source_flag = old_flag if created_at < RENAMED_AT else current_flag
+
+    lookups.append((tracker, created_at, source_flag))
+
+  return lookups
+
+
+def api_calls(source_flags: list[bytes], found_flag: bytes | None) -> int:
+  if found_flag is None:
+    return len(source_flags)
+
+  return source_flags.index(found_flag) + 1
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--dataset", type=str, default=None)
+  parser.add_argument("--count", type=int, default=10000)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  lookups = load_dataset(args.dataset) if args.dataset else generate_dataset(args.count, args.seed)
+  stats = SourceFlagStats(Database(":memory:"))
+  fixed_calls = 0
+  learned_calls = 0
+  hits = 0
+
+  for tracker, created_at, found_flag in lookups:
+    fixed_calls += api_calls(tracker.source_flags_for_creation(), found_flag)
+    learned_calls += api_calls(stats.order(tracker, created_at), found_flag)
+
+    if found_flag is not None:
+      hits += 1
+      stats.record_hit(tracker, created_at, found_flag)
+
+  # Misses cost the same in either order, so they're left out of the cost per hit
+  misses = sum(len(tracker.source_flags_for_creation()) for tracker, _, found_flag in lookups if found_flag is None)
+
+  print(f"{len(lookups)} lookups, {hits} found\n")
+  print(f"{'order':<9}{'API calls':>11}{'per torrent':>13}{'per hit':>10}")
+
+  for name, calls in [("fixed", fixed_calls), ("learned", learned_calls)]:
+    per_hit = (calls - misses) / hits if hits else 0
+    print(f"{name:<9}{calls:>11}{calls / len(lookups):>13.3f}{per_hit:>10.3f}")
+
+
+if __name__ == "__main__":
+  main()
@@ -1,4 +1,5 @@
 import os
+import signal
 import sys
 import traceback
 
@@ -7,15 +8,21 @@ from colorama import Fore
 from src.args import parse_args
 from src.config import Config
 from src.injection import Injection
-from src.scanner import scan_torrent_directory, scan_torrent_file
+from src.pipeline import ScanBudget
+from src.scanner import scan_torrent_directory, scan_torrent_file, watch_torrent_directory
 from src.config_validator import ConfigValidator
+from src.database import Database, database_path_for_config
+from src.hash_cache import InfohashCache
+from src.lookup_cache import LookupCache
+from src.scan_state import DAY, RecheckPolicy, ScanState
+from src.source_flags import SourceFlagStats
 from src.webserver import run_webserver
 
 
 def cli_entrypoint(args):
   try:
     # using input_file means this is probably running as a script and extra printing wouldn't be appreciated
-    should_print = args.input_directory or args.server
+    should_print = args.input_directory or args.server or args.watch
     config_dict = Config.build_config_dict(args.config_file, os.environ)
     validator = ConfigValidator(config_dict)
     config = command_log_wrapper("Reading configuration:", should_print, lambda: Config(validator.validate()))
@@ -25,16 +32,75 @@ def cli_entrypoint(args):
     else:
       injector = None
 
+    if args.no_cache:
+      cache, scan_state, source_flag_stats, lookup_cache = None, None, None, None
+    else:
+      database = Database(database_path_for_config(args.config_file))
+      policy = RecheckPolicy(base_interval=args.recheck_after * DAY, max_interval=args.recheck_max * DAY)
+      cache, scan_state = InfohashCache(database), ScanState(database, policy)
+      source_flag_stats, lookup_cache = SourceFlagStats(database), LookupCache(database)
+
     red_api, ops_api = command_log_wrapper(
-      "Verifying API keys:", should_print, lambda: validator.verify_api_keys(config)
+      "Verifying API keys:", should_print, lambda: validator.verify_api_keys(config, lookup_cache)
     )
 
     if args.server:
-      run_webserver(args.input_directory, args.output_directory, red_api, ops_api, injector, port=config.server_port)
+      run_webserver(
+        args.input_directory,
+        args.output_directory,
+        red_api,
+        ops_api,
+        injector,
+        port=config.server_port,
+        cache=cache,
+        workers=args.workers,
+        source_flag_stats=source_flag_stats,
+      )
+    elif args.watch:
+      watch_torrent_directory(
+        args.input_directory,
+        args.output_directory,
+        red_api,
+        ops_api,
+        injector,
+        args.workers,
+        cache=cache,
+        scan_state=scan_state,
+        source_flag_stats=source_flag_stats,
+      )
     elif args.input_file:
-      print(scan_torrent_file(args.input_file, args.output_directory, red_api, ops_api, injector))
+      print(
+        scan_torrent_file(
+          args.input_file,
+          args.output_directory,
+          red_api,
+          ops_api,
+          injector,
+          args.workers,
+          cache=cache,
+          source_flag_stats=source_flag_stats,
+        )
+      )
     elif args.input_directory:
-      print(scan_torrent_directory(args.input_directory, args.output_directory, red_api, ops_api, injector))
+      max_runtime = args.max_runtime * 60 if args.max_runtime is not None else None
+      budget = ScanBudget(max_runtime=max_runtime, max_api_calls=args.max_api_calls)
+
+      print(
+        scan_torrent_directory(
+          args.input_directory,
+          args.output_directory,
+          red_api,
+          ops_api,
+          injector,
+          args.workers,
+          cache=cache,
+          scan_state=scan_state,
+          recheck_budget=args.recheck_budget,
+          budget=budget,
+          shard=args.shard,
+          source_flag_stats=source_flag_stats,
+        )
+      )
   except Exception as e:
     if args.verbose:
       print(traceback.format_exc())
@@ -60,8 +126,14 @@ def command_log_wrapper(label, should_print, func):
     raise e
 
 
+def handle_sigterm(_signum, _frame):
+  # Lets `docker stop` and friends shut down the same way Ctrl+C does, so scans save their progress
+  raise KeyboardInterrupt
+
+
 if __name__ == "__main__":
   args = parse_args()
+  signal.signal(signal.SIGTERM, handle_sigterm)
 
   try:
     cli_entrypoint(args)
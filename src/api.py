@@ -1,10 +1,26 @@
 import json
+from itertools import count
 from math import exp
-from time import time, sleep
 
 import requests
 
-from .errors import AuthenticationError, handle_error
+from .circuit_breaker import CircuitBreaker
+from .errors import AuthenticationError, TrackerUnavailableError, handle_error
+from .rate_limit import create_rate_limiter
+
+# What a single request to the API can fail with
+REQUEST_ERRORS = (requests.exceptions.RequestException, json.JSONDecodeError)
+
+
+def describe_request_error(e: Exception) -> tuple[str, Exception | str]:
+  if isinstance(e, requests.exceptions.Timeout):
+    return "Request timed out", e
+  if isinstance(e, requests.exceptions.ConnectionError):
+    return "Unable to connect", e
+  if isinstance(e, json.JSONDecodeError):
+    return "JSON decoding of response failed", e
+
+  return "Request failed", f"{type(e).__name__}: {e}"
 
 
 class GazelleAPI:
@@ -12,14 +28,33 @@ class GazelleAPI:
   Methods for interacting with Gazelle-based trackers like RED and OPS.
   """
 
-  def __init__(self, site_url, tracker_url, auth_header, rate_limit):
+  def __init__(
+    self,
+    site_url,
+    tracker_url,
+    auth_header,
+    rate_limit,
+    burst=1,
+    shared_rate_limit_directory=None,
+    lookup_cache=None,
+  ):
     self._s = requests.session()
     self._s.headers.update(auth_header)
-    self._rate_limit = rate_limit
+    # One request every `rate_limit` seconds, or up to `burst` at once after being idle. With a shared directory,
+    # that's across every process on the host using the same API key.
+    self.rate_limiter = create_rate_limiter(
+      rate_limit,
+      burst,
+      shared_rate_limit_directory,
+      key=f"{site_url} {json.dumps(auth_header, sort_keys=True)}",
+    )
+    self.lookup_cache = lookup_cache
+    # Stops this tracker's requests while it's down, so lookups on the other tracker can carry on
+    self.circuit_breaker = CircuitBreaker()
     self._timeout = 15
-    self._last_used = 0
+    # Every request made, including retries, so callers can budget API usage
+    self.request_count = 0
 
-    self._max_retries = 20
     self._max_retry_time = 600
     self._retry_wait_time = lambda x: min(int(exp(x)), self._max_retry_time)
 
@@ -40,7 +75,10 @@ class GazelleAPI:
     return r
 
   def find_torrent(self, torrent_hash: str) -> dict:
-    return self.__get("torrent", hash=torrent_hash)
+    if self.lookup_cache is None:
+      return self.__get("torrent", hash=torrent_hash)
+
+    return self.lookup_cache.fetch(self.site_url, torrent_hash, lambda: self.__get("torrent", hash=torrent_hash))
 
   @property
   def announce_url(self) -> str:
@@ -49,39 +87,53 @@ class GazelleAPI:
 
     return self._announce_url
 
+  def check_circuit(self) -> None:
+    """
+    Raises:
+      `TrackerUnavailableError`: if the tracker has failed too often lately to make requests to it.
+    """
+
+    if not self.circuit_breaker.allow_request():
+      retry_in = self.circuit_breaker.seconds_until_probe()
+      raise TrackerUnavailableError(f"{self.sitename} is unavailable; trying again in {retry_in:.0f} seconds")
+
+  def send_request(self, params: dict) -> dict:
+    """
+    Makes a single request to the API, without rate limiting or retrying it (see `AsyncGazelleAPI`).
+
+    Raises:
+      One of `REQUEST_ERRORS` if the request fails.
+    """
+
+    self.request_count += 1
+    response = self._s.get(self.api_url, params=params, timeout=self._timeout)
+
+    return json.loads(response.text)
+
   def __get(self, action, **params):
-    current_retries = 1
-
-    while current_retries <= self._max_retries:
-      now = time()
-      if (now - self._last_used) > self._rate_limit:
-        self._last_used = now
-        params["action"] = action
-
-        try:
-          response = self._s.get(self.api_url, params=params, timeout=self._timeout)
-
-          return json.loads(response.text)
-        except requests.exceptions.Timeout as e:
-          err = "Request timed out", e
-        except requests.exceptions.ConnectionError as e:
-          err = "Unable to connect", e
-        except requests.exceptions.RequestException as e:
-          err = "Request failed", f"{type(e).__name__}: {e}"
-        except json.JSONDecodeError as e:
-          err = "JSON decoding of response failed", e
-
-        handle_error(
-          description=err[0],
-          exception_details=err[1],
-          wait_time=self._retry_wait_time(current_retries),
-          extra_description=f" (attempt {current_retries}/{self._max_retries})",
-        )
-        current_retries += 1
-      else:
-        sleep(0.2)
-
-    handle_error(description="Maximum number of retries reached", should_raise=True)
+    params["action"] = action
+
+    # Failed requests are retried with a growing wait until the circuit breaker opens, which takes
+    # `circuit_breaker.failure_threshold` failures in a row at most. From then on requests fail fast.
+    for attempt in count(1):
+      self.check_circuit()
+
+      try:
+        with self.circuit_breaker.request():
+          self.rate_limiter.acquire()
+          return self.send_request(params)
+      except REQUEST_ERRORS as e:
+        description, exception_details = describe_request_error(e)
+
+      if self.circuit_breaker.is_open:
+        raise TrackerUnavailableError(f"{self.sitename} is unavailable: {description}")
+
+      handle_error(
+        description=description,
+        exception_details=exception_details,
+        wait_time=self._retry_wait_time(attempt),
+        extra_description=f" (attempt {attempt})",
+      )
 
   def __get_announce_url(self):
     try:
@@ -94,24 +146,30 @@ class GazelleAPI:
 
 
 class OpsAPI(GazelleAPI):
-  def __init__(self, api_key, delay_in_seconds=2):
+  def __init__(self, api_key, delay_in_seconds=2, burst=1, shared_rate_limit_directory=None, lookup_cache=None):
     super().__init__(
       site_url="https://orpheus.network",
       tracker_url="https://home.opsfet.ch",
       auth_header={"Authorization": f"token {api_key}"},
       rate_limit=delay_in_seconds,
+      burst=burst,
+      shared_rate_limit_directory=shared_rate_limit_directory,
+      lookup_cache=lookup_cache,
     )
 
     self.sitename = "OPS"
 
 
 class RedAPI(GazelleAPI):
-  def __init__(self, api_key, delay_in_seconds=2):
+  def __init__(self, api_key, delay_in_seconds=2, burst=1, shared_rate_limit_directory=None, lookup_cache=None):
     super().__init__(
       site_url="https://redacted.ch",
       tracker_url="https://flacsfor.me",
       auth_header={"Authorization": api_key},
       rate_limit=delay_in_seconds,
+      burst=burst,
+      shared_rate_limit_directory=shared_rate_limit_directory,
+      lookup_cache=lookup_cache,
     )
 
     self.sitename = "RED"
@@ -1,6 +1,10 @@
 import argparse
+import os
 import sys
 
+from .pipeline import LOOKUP_API_CALLS
+from .sharding import Shard
+
 
 def parse_args(args=None):
   args = sys.argv[1:] if args is None else args
@@ -55,6 +59,76 @@ def parse_args(args=None):
     default=False,
   )
 
+  options.add_argument(
+    "--watch",
+    action="store_true",
+    help="keeps running and scans new .torrent files as they're added to the input directory. Requires -i/--input-directory",
+    default=False,
+  )
+
+  options.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="number of processes used to hash torrents when indexing directories (default: number of CPUs)",
+    default=os.cpu_count() or 1,
+  )
+
+  options.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="don't read or write the infohash cache and scan history that are kept next to the config file",
+    default=False,
+  )
+
+  options.add_argument(
+    "--recheck-after",
+    type=float,
+    metavar="DAYS",
+    help="days to wait before looking up a torrent that wasn't found again, doubling after each miss (default: 1)",
+    default=1,
+  )
+
+  options.add_argument(
+    "--recheck-max",
+    type=float,
+    metavar="DAYS",
+    help="the longest to ever wait before looking up a torrent that wasn't found again (default: 30)",
+    default=30,
+  )
+
+  options.add_argument(
+    "--recheck-budget",
+    type=int,
+    metavar="CALLS",
+    help="the most API calls to spend per run on torrents that weren't found before (default: no limit)",
+    default=None,
+  )
+
+  options.add_argument(
+    "--max-runtime",
+    type=float,
+    metavar="MINUTES",
+    help="stops a directory scan after this many minutes; the next scan resumes where it stopped (default: no limit)",
+    default=None,
+  )
+
+  options.add_argument(
+    "--max-api-calls",
+    type=int,
+    metavar="CALLS",
+    help="stops a directory scan after this many API calls; the next scan resumes where it stopped (default: no limit)",
+    default=None,
+  )
+
+  options.add_argument(
+    "--shard",
+    type=str,
+    metavar="I/N",
+    help="only scans the I-th of N disjoint slices of the input directory, e.g. 1/3, so N processes can share a scan",
+    default=None,
+  )
+
   options.add_argument(
     "-v",
     "--verbose",
@@ -76,4 +150,32 @@ def parse_args(args=None):
   if parsed.server and not parsed.input_directory:
     parser.error("--server requires --input-directory")
 
+  if parsed.watch and not parsed.input_directory:
+    parser.error("--watch requires --input-directory")
+
+  if parsed.watch and parsed.server:
+    parser.error("--watch can't be used with --server")
+
+  if parsed.workers < 1:
+    parser.error("--workers must be at least 1")
+
+  if parsed.recheck_after <= 0 or parsed.recheck_max < parsed.recheck_after:
+    parser.error("--recheck-after must be positive and no greater than --recheck-max")
+
+  if parsed.recheck_budget is not None and parsed.recheck_budget < 0:
+    parser.error("--recheck-budget can't be negative")
+
+  if parsed.max_runtime is not None and parsed.max_runtime <= 0:
+    parser.error("--max-runtime must be positive")
+
+  # Each lookup reserves as many calls as it can make, so a smaller budget couldn't look up anything
+  if parsed.max_api_calls is not None and parsed.max_api_calls < LOOKUP_API_CALLS:
+    parser.error(f"--max-api-calls must be at least {LOOKUP_API_CALLS}")
+
+  if parsed.shard is not None:
+    try:
+      parsed.shard = Shard.parse(parsed.shard)
+    except ValueError as e:
+      parser.error(str(e))
+
   return parsed
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from requests.adapters import HTTPAdapter
+
+from .api import REQUEST_ERRORS, GazelleAPI, describe_request_error
+from .errors import AuthenticationError, TrackerUnavailableError, handle_error_async
+
+# How many requests (to trackers and the torrent client together) may be in progress at once
+MAX_CONNECTIONS = 16
+
+
+class EventLoopThread:
+  """
+  An event loop running in a background thread, which any thread can hand coroutines to with `run`. Sharing one
+  loop lets many pending lookups wait on rate limits and retries as cheap coroutines instead of blocked threads.
+
+  The HTTP requests themselves are still made with `requests`, in a pool of `max_connections` worker threads that
+  also bounds how many connections are open at once.
+  """
+
+  def __init__(self, max_connections: int = MAX_CONNECTIONS):
+    self.max_connections = max_connections
+    self.loop = asyncio.new_event_loop()
+    # `asyncio.to_thread` uses the loop's default executor
+    self.loop.set_default_executor(ThreadPoolExecutor(max_connections, thread_name_prefix="fertilizer-io"))
+    self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+    self._thread.start()
+
+  def run(self, coroutine, timeout: float | None = None):
+    """
+    Runs `coroutine` on the loop and waits for its result. Must not be called from the loop's own thread.
+    """
+
+    return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+  def close(self) -> None:
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self._thread.join()
+    self.loop.run_until_complete(self.loop.shutdown_default_executor())
+    self.loop.close()
+
+
+class AsyncGazelleAPI:
+  """
+  An async front for a `GazelleAPI` that shares its session, rate limiter, lookup cache and request count, so sync
+  and async callers together stay within the same limits. Waiting for the rate limiter and before retries doesn't
+  block the event loop, and lookups of an infohash that's already being looked up wait for that lookup instead of
+  making another request. Must only be used from a single event loop (see `EventLoopThread`).
+  """
+
+  def __init__(self, api: GazelleAPI, max_connections: int = MAX_CONNECTIONS):
+    self.api = api
+    self.sitename = api.sitename
+    self.site_url = api.site_url
+    self._in_flight = {}
+
+    # Lets every worker thread keep its connection open instead of requests' default of 10 per host
+    adapter = HTTPAdapter(pool_maxsize=max_connections)
+    api._s.mount("https://", adapter)
+    api._s.mount("http://", adapter)
+
+  @property
+  def request_count(self) -> int:
+    return self.api.request_count
+
+  @property
+  def announce_url(self) -> str:
+    """
+    The announce URL, which has to have been loaded with `load_announce_url` first.
+    """
+
+    return self.api.announce_url
+
+  async def load_announce_url(self) -> str:
+    # Fetched at most once, and usually before the server starts (see `ConfigValidator.verify_api_keys`)
+    return await asyncio.to_thread(lambda: self.api.announce_url)
+
+  async def get_account_info(self) -> dict:
+    r = await self.__get("index")
+    if r["status"] != "success":
+      raise AuthenticationError(r["error"])
+    return r
+
+  async def find_torrent(self, torrent_hash: str) -> dict:
+    key = torrent_hash.upper()
+    lookup_cache = self.api.lookup_cache
+
+    if lookup_cache:
+      cached = await asyncio.to_thread(lookup_cache.get, self.site_url, key)
+      if cached:
+        return cached
+
+    if key in self._in_flight:
+      return await asyncio.shield(self._in_flight[key])
+
+    flight = self._in_flight[key] = asyncio.get_running_loop().create_future()
+    try:
+      response = await self.__get("torrent", hash=torrent_hash)
+      if lookup_cache:
+        await asyncio.to_thread(lookup_cache.put, self.site_url, key, response)
+
+      flight.set_result(response)
+      return response
+    except BaseException as e:
+      flight.set_exception(e)
+      # Marks the exception as retrieved, since there may not have been anyone else waiting for it
+      flight.exception()
+      raise
+    finally:
+      del self._in_flight[key]
+
+  async def __get(self, action, **params):
+    params["action"] = action
+
+    # Retried until the circuit breaker opens, the same as `GazelleAPI`
+    for attempt in count(1):
+      self.api.check_circuit()
+
+      try:
+        with self.api.circuit_breaker.request():
+          await self.api.rate_limiter.acquire_async()
+          return await asyncio.to_thread(self.api.send_request, params)
+      except REQUEST_ERRORS as e:
+        description, exception_details = describe_request_error(e)
+
+      if self.api.circuit_breaker.is_open:
+        raise TrackerUnavailableError(f"{self.sitename} is unavailable: {description}")
+
+      await handle_error_async(
+        description=description,
+        exception_details=exception_details,
+        wait_time=self.api._retry_wait_time(attempt),
+        extra_description=f" (attempt {attempt})",
+      )
+
+
+class AsyncInjection:
+  """
+  An async front for an `Injection` that runs its calls to the torrent client in a worker thread. Calls are made
+  one at a time, since the clients keep per-session state (e.g. Deluge's cookie and request IDs).
+  """
+
+  def __init__(self, injection):
+    self.injection = injection
+    self._lock = asyncio.Lock()
+
+  async def inject_torrent(self, *args, **kwargs):
+    async with self._lock:
+      return await asyncio.to_thread(self.injection.inject_torrent, *args, **kwargs)
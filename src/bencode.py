@@ -0,0 +1,246 @@
+from collections.abc import Mapping
+
+import bencoder
+
+from .errors import TorrentDecodingError
+
+# These helpers walk bencoded data in place instead of decoding it into Python objects. They accept
+# any buffer that supports indexing, slicing and `find` (e.g. `bytes` or `mmap`) and work in terms of
+# byte offsets, so large values like `pieces` are skipped over by their length prefix rather than copied.
+
+INT_TOKEN = ord("i")
+LIST_TOKEN = ord("l")
+DICT_TOKEN = ord("d")
+END_TOKEN = ord("e")
+ZERO = ord("0")
+NINE = ord("9")
+
+
+def value_end(data, start: int) -> int:
+  """
+  Returns the offset just past the bencoded value that begins at `start`.
+
+  Raises:
+    `TorrentDecodingError`: if the data is malformed or truncated.
+  """
+
+  token = __token_at(data, start)
+
+  if token == INT_TOKEN:
+    end = data.find(b"e", start)
+    if end == -1:
+      raise TorrentDecodingError("Unexpected end of bencoded data")
+
+    return end + 1
+
+  if token == LIST_TOKEN or token == DICT_TOKEN:
+    pos = start + 1
+    while __token_at(data, pos) != END_TOKEN:
+      pos = value_end(data, pos)
+
+    return pos + 1
+
+  if ZERO <= token <= NINE:
+    colon = data.find(b":", start)
+    if colon == -1:
+      raise TorrentDecodingError("Unexpected end of bencoded data")
+
+    try:
+      end = colon + 1 + int(data[start:colon])
+    except ValueError:
+      raise TorrentDecodingError(f"Invalid string length at offset {start}")
+
+    if end > len(data):
+      raise TorrentDecodingError("Unexpected end of bencoded data")
+
+    return end
+
+  raise TorrentDecodingError(f"Invalid bencode token at offset {start}")
+
+
+def string_value(data, start: int, end: int) -> bytes:
+  """
+  Returns the contents of the bencoded string spanning `start` to `end`.
+  """
+
+  return bytes(data[data.find(b":", start, end) + 1 : end])
+
+
+def iter_dict(data, start: int):
+  """
+  Yields a `(key, value_start, value_end)` tuple for every item of the bencoded dict that begins at `start`.
+
+  Raises:
+    `TorrentDecodingError`: if the value at `start` is not a dict or the data is malformed.
+  """
+
+  if __token_at(data, start) != DICT_TOKEN:
+    raise TorrentDecodingError(f"Expected a dict at offset {start}")
+
+  pos = start + 1
+  while __token_at(data, pos) != END_TOKEN:
+    key_end = value_end(data, pos)
+    item_end = value_end(data, key_end)
+
+    yield string_value(data, pos, key_end), key_end, item_end
+    pos = item_end
+
+
+def dict_value_span(data, start: int, key: bytes) -> tuple[int, int] | None:
+  """
+  Returns the `(start, end)` offsets of the value stored under `key` in the bencoded dict that begins at `start`,
+  or `None` if the dict has no such key.
+  """
+
+  for item_key, item_start, item_end in iter_dict(data, start):
+    if item_key == key:
+      return item_start, item_end
+
+  return None
+
+
+def dict_item_span(data, start: int, key: bytes) -> tuple[int, int]:
+  """
+  Returns the `(start, end)` offsets of the encoded `key` and its value in the bencoded dict that begins at `start`.
+  If the dict has no such key, returns an empty span at the offset where the key would be inserted
+  to keep the dict's keys sorted.
+  """
+
+  pos = start + 1
+  insert_at = None
+  for item_key, _value_start, item_end in iter_dict(data, start):
+    if item_key == key:
+      return pos, item_end
+    if item_key > key and insert_at is None:
+      insert_at = pos
+
+    pos = item_end
+
+  insert_at = pos if insert_at is None else insert_at
+  return insert_at, insert_at
+
+
+def encode_item(key: bytes, value) -> bytes:
+  return bencoder.encode(key) + bencoder.encode(value)
+
+
+def dict_splices(data, start: int, items: dict) -> list[tuple[int, int, bytes]]:
+  """
+  Returns `(start, end, replacement)` splices that set each key of `items` to its value in the bencoded dict
+  that begins at `start`. Existing items are replaced in place, missing ones are inserted at their sorted position
+  and items whose value is `None` are removed.
+  """
+
+  splices = []
+  for key in sorted(items):
+    value = items[key]
+    replacement = b"" if value is None else encode_item(key, value)
+    splices.append((*dict_item_span(data, start, key), replacement))
+
+  return splices
+
+
+def splice_segments(data, start: int, end: int, splices: list[tuple[int, int, bytes]]) -> list:
+  """
+  Applies `splices` to the bytes between `start` and `end` and returns the result as a list of segments.
+  Untouched regions are returned as memoryviews of `data` rather than copies.
+  """
+
+  view = memoryview(data)
+  segments = []
+  pos = start
+
+  # Sorting is stable, so splices inserted at the same offset keep their (sorted) key order
+  for splice_start, splice_end, replacement in sorted(splices, key=lambda splice: splice[0]):
+    segments.append(view[pos:splice_start])
+    segments.append(replacement)
+    pos = splice_end
+
+  segments.append(view[pos:end])
+  return [segment for segment in segments if len(segment)]
+
+
+def lazy_value(data, start: int, end: int):
+  """
+  Returns the bencoded value spanning `start` to `end`. Dicts are returned as `LazyDict` views,
+  lists as Python lists of lazy values, and strings and ints are decoded as usual.
+  """
+
+  token = __token_at(data, start)
+
+  if token == DICT_TOKEN:
+    return LazyDict(data, start)
+
+  if token == LIST_TOKEN:
+    items = []
+    pos = start + 1
+    while __token_at(data, pos) != END_TOKEN:
+      item_end = value_end(data, pos)
+      items.append(lazy_value(data, pos, item_end))
+      pos = item_end
+
+    return items
+
+  if token == INT_TOKEN:
+    return int(data[start + 1 : end - 1])
+
+  return string_value(data, start, end)
+
+
+class LazyDict(Mapping):
+  """
+  A read-only view of a bencoded dict that decodes values only when they are looked up.
+
+  Keys are indexed on first access, so values that are never read (like the multi-megabyte `pieces`)
+  stay as offsets into the underlying buffer.
+  """
+
+  def __init__(self, data, start: int = 0):
+    self.buffer = data
+    self.start = start
+    self._spans = None
+    self._end = None
+
+  @property
+  def end(self) -> int:
+    self.__index()
+    return self._end
+
+  def span(self, key: bytes) -> tuple[int, int]:
+    """
+    Returns the `(start, end)` offsets of the value stored under `key`.
+    """
+
+    self.__index()
+    return self._spans[key]
+
+  def __getitem__(self, key: bytes):
+    return lazy_value(self.buffer, *self.span(key))
+
+  def __iter__(self):
+    self.__index()
+    return iter(self._spans)
+
+  def __len__(self) -> int:
+    self.__index()
+    return len(self._spans)
+
+  def __index(self):
+    if self._spans is not None:
+      return
+
+    spans = {}
+    end = self.start + 1
+    for key, item_start, item_end in iter_dict(self.buffer, self.start):
+      spans[key] = (item_start, item_end)
+      end = item_end
+
+    self._spans = spans
+    self._end = end + 1
+
+
+def __token_at(data, pos: int) -> int:
+  try:
+    return data[pos]
+  except IndexError:
+    raise TorrentDecodingError("Unexpected end of bencoded data")
@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+  """
+  Stops requests to a service that keeps failing, so callers fail fast instead of waiting out retries.
+
+  After `failure_threshold` failures in a row the circuit opens and `allow_request` turns requests away. Once
+  `reset_timeout` seconds have passed, a single probe request is let through (the circuit is half open): if it
+  succeeds the circuit closes again, and if it fails the circuit opens for twice as long as before, up to
+  `max_reset_timeout` seconds. Every request that's let through must be wrapped in `request` (or followed by
+  `record_success` or `record_failure`). Thread-safe.
+  """
+
+  def __init__(
+    self,
+    failure_threshold: int = 3,
+    reset_timeout: float = 60.0,
+    max_reset_timeout: float = 600.0,
+    clock=monotonic,
+  ):
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self.max_reset_timeout = max_reset_timeout
+    self.state = CLOSED
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._failures = 0
+    self._open_for = reset_timeout
+    self._probe_at = 0.0
+
+  @property
+  def is_open(self) -> bool:
+    return self.state == OPEN
+
+  def allow_request(self) -> bool:
+    with self._lock:
+      if self.state == CLOSED:
+        return True
+
+      # Only one probe at a time, so a half-open circuit turns everything else away until it's settled
+      if self.state == OPEN and self._clock() >= self._probe_at:
+        self.state = HALF_OPEN
+        return True
+
+      return False
+
+  @contextmanager
+  def request(self):
+    """
+    Records the outcome of a request that `allow_request` let through: a success if the block finishes and a
+    failure if it raises anything at all, so a probe can't leave the circuit half open for good.
+    """
+
+    try:
+      yield
+    except BaseException:
+      self.record_failure()
+      raise
+
+    self.record_success()
+
+  def record_success(self) -> None:
+    with self._lock:
+      self.state = CLOSED
+      self._failures = 0
+      self._open_for = self.reset_timeout
+
+  def record_failure(self) -> None:
+    with self._lock:
+      self._failures += 1
+
+      if self.state == HALF_OPEN:
+        self._open_for = min(self._open_for * 2, self.max_reset_timeout)
+        self.__open()
+      elif self.state == CLOSED and self._failures >= self.failure_threshold:
+        self.__open()
+
+  def seconds_until_probe(self) -> float:
+    with self._lock:
+      if self.state != OPEN:
+        return 0.0
+
+      return max(self._probe_at - self._clock(), 0.0)
+
+  def __open(self):
+    self.state = OPEN
+    self._probe_at = self._clock() + self._open_for
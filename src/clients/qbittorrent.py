@@ -4,7 +4,7 @@ from pathlib import Path
 from requests.structures import CaseInsensitiveDict
 
 from ..utils import url_join
-from ..parser import get_bencoded_data, calculate_infohash
+from ..parser import calculate_infohash_from_file
 from ..errors import TorrentClientError, TorrentClientAuthenticationError, TorrentExistsInClientError
 from .torrent_client import TorrentClient
 
@@ -42,7 +42,7 @@ class Qbittorrent(TorrentClient):
 
   def inject_torrent(self, source_torrent_infohash, new_torrent_filepath, save_path_override=None):
     source_torrent_info = self.get_torrent_info(source_torrent_infohash)
-    new_torrent_infohash = calculate_infohash(get_bencoded_data(new_torrent_filepath)).lower()
+    new_torrent_infohash = calculate_infohash_from_file(new_torrent_filepath).lower()
     new_torrent_already_exists = self.__does_torrent_exist_in_client(new_torrent_infohash)
 
     if new_torrent_already_exists:
@@ -1,8 +1,15 @@
 import re
+from math import ceil
 from urllib.parse import urlparse
 
 from .api import RedAPI, OpsAPI
+from .errors import TrackerUnavailableError, handle_error
 from .filesystem import assert_path_exists
+from .rate_limit import SHARED_RATE_LIMIT_DIRECTORY
+
+# How many times checking the API keys waits for an unavailable tracker's circuit to let another probe through
+# before giving up. With `CircuitBreaker`'s default backoff, that's about 25 minutes of waiting.
+STARTUP_PROBES = 5
 
 
 class ConfigValidator:
@@ -22,17 +29,30 @@ class ConfigValidator:
     }
 
   @staticmethod
-  def verify_api_keys(config):
-    red_api = RedAPI(config.red_key)
-    ops_api = OpsAPI(config.ops_key)
+  def verify_api_keys(config, lookup_cache=None):
+    # Other fertilizer processes (e.g. started by a torrent client's on-complete hook) share the same rate limits
+    red_api = RedAPI(config.red_key, shared_rate_limit_directory=SHARED_RATE_LIMIT_DIRECTORY, lookup_cache=lookup_cache)
+    ops_api = OpsAPI(config.ops_key, shared_rate_limit_directory=SHARED_RATE_LIMIT_DIRECTORY, lookup_cache=lookup_cache)
 
     # This will perform a lookup with the API and raise if there was a failure.
     # Also caches the announce URL for future use which is a nice bonus
-    red_api.announce_url
-    ops_api.announce_url
+    ConfigValidator.__load_announce_url(red_api)
+    ConfigValidator.__load_announce_url(ops_api)
 
     return red_api, ops_api
 
+  @staticmethod
+  def __load_announce_url(api):
+    # Nothing can be done without the announce URL, so a tracker that's down at startup is waited out for a while
+    # rather than failing as soon as its circuit opens
+    for _ in range(STARTUP_PROBES):
+      try:
+        return api.announce_url
+      except TrackerUnavailableError as e:
+        handle_error(description=str(e), wait_time=ceil(api.circuit_breaker.seconds_until_probe()))
+
+    return api.announce_url
+
   def validate(self):
     presence_errors = self.__validate_key_presence()
     validation_errors, validated_values = self.__validate_attributes(presence_errors)
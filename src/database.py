@@ -0,0 +1,41 @@
+import os
+import sqlite3
+import threading
+
+DATABASE_FILENAME = "fertilizer.sqlite3"
+
+
+def database_path_for_config(config_filepath: str) -> str:
+  """
+  Returns the path of the database that lives next to the given config file.
+  """
+
+  return os.path.join(os.path.dirname(os.path.abspath(config_filepath)), DATABASE_FILENAME)
+
+
+class Database:
+  """
+  A thread-safe wrapper around the SQLite database that fertilizer's persistent caches are stored in.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    self._lock = threading.RLock()
+    self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+    if path != ":memory:":
+      # WAL lets concurrent fertilizer processes read while another one is writing
+      self.execute("PRAGMA journal_mode=WAL")
+      self.execute("PRAGMA synchronous=NORMAL")
+
+  def execute(self, sql: str, parameters=()) -> list:
+    with self._lock, self._connection:
+      return self._connection.execute(sql, parameters).fetchall()
+
+  def executemany(self, sql: str, rows) -> None:
+    with self._lock, self._connection:
+      self._connection.executemany(sql, rows)
+
+  def close(self) -> None:
+    with self._lock:
+      self._connection.close()
@@ -1,3 +1,4 @@
+import asyncio
 from time import sleep
 
 from colorama import Fore
@@ -10,17 +11,43 @@ def handle_error(
   extra_description: str = "",
   should_raise: bool = False,
 ) -> None:
-  action = "" if should_raise else "Retrying"
-  action += f" in {wait_time} seconds..." if wait_time else ""
-  exception_message = f"\n{Fore.LIGHTBLACK_EX}{exception_details}" if exception_details is not None else ""
+  message = __error_message(description, exception_details, wait_time, extra_description, should_raise)
 
   if should_raise:
-    raise Exception(f"{description}{extra_description}. {action}{exception_message}{Fore.RESET}")
+    raise Exception(message)
   else:
-    print(f"{Fore.RED}Error: {description}{extra_description}. {action}{exception_message}{Fore.RESET}")
+    print(f"{Fore.RED}Error: {message}")
     sleep(wait_time)
 
 
+async def handle_error_async(
+  description: str,
+  exception_details: (str | None) = None,
+  wait_time: int = 0,
+  extra_description: str = "",
+  should_raise: bool = False,
+) -> None:
+  """
+  Like `handle_error`, but waits before retrying without blocking the event loop.
+  """
+
+  message = __error_message(description, exception_details, wait_time, extra_description, should_raise)
+
+  if should_raise:
+    raise Exception(message)
+  else:
+    print(f"{Fore.RED}Error: {message}")
+    await asyncio.sleep(wait_time)
+
+
+def __error_message(description, exception_details, wait_time, extra_description, should_raise) -> str:
+  action = "" if should_raise else "Retrying"
+  action += f" in {wait_time} seconds..." if wait_time else ""
+  exception_message = f"\n{Fore.LIGHTBLACK_EX}{exception_details}" if exception_details is not None else ""
+
+  return f"{description}{extra_description}. {action}{exception_message}{Fore.RESET}"
+
+
 class AuthenticationError(Exception):
   pass
 
@@ -37,6 +64,10 @@ class TorrentNotFoundError(Exception):
   pass
 
 
+class TrackerUnavailableError(Exception):
+  pass
+
+
 class TorrentAlreadyExistsError(Exception):
   pass
 
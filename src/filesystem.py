@@ -1,4 +1,5 @@
 import os
+from collections.abc import Iterator
 
 
 def sane_join(*args: str) -> str:
@@ -22,10 +23,29 @@ def assert_path_exists(path: str) -> str:
   return path
 
 
-def list_files_of_extension(input_directory: str, extension: str = ".torrent") -> list[str]:
-  return [
-    os.path.join(input_directory, filename) for filename in os.listdir(input_directory) if filename.endswith(extension)
-  ]
+def scan_files_of_extension(directory: str, extension: str = ".torrent", max_depth: int = 0) -> Iterator[os.DirEntry]:
+  """
+  Lazily yields an `os.DirEntry` for every file ending in `extension` in `directory` and, up to `max_depth` levels
+  down, its subdirectories. Entries cache their `stat` results, so callers can check a file's size or mtime
+  without another system call on platforms that support it. Symlinked directories aren't followed.
+  """
+
+  pending = [(directory, 0)]
+
+  while pending:
+    current_directory, depth = pending.pop()
+
+    with os.scandir(current_directory) as entries:
+      for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+          if depth < max_depth:
+            pending.append((entry.path, depth + 1))
+        elif entry.name.endswith(extension):
+          yield entry
+
+
+def list_files_of_extension(input_directory: str, extension: str = ".torrent", max_depth: int = 0) -> list[str]:
+  return [entry.path for entry in scan_files_of_extension(input_directory, extension, max_depth)]
 
 
 def replace_extension(filepath: str, new_extension: str) -> str:
@@ -0,0 +1,107 @@
+import os
+
+import bencoder
+
+from .database import Database
+
+# Keeps `IN (...)` queries under SQLite's limit on the number of parameters in a statement
+QUERY_BATCH_SIZE = 500
+
+
+class InfohashCache:
+  """
+  A persistent cache of torrent infohashes and source-variant hashes.
+
+  Entries are keyed by a file's path along with its inode, size and modification time, so a file is only
+  opened and hashed again once it has changed. Looking entries up only needs a `stat` of each file.
+  """
+
+  def __init__(self, database: Database):
+    self._db = database
+    self._db.execute(
+      """
+      CREATE TABLE IF NOT EXISTS infohashes (
+        path TEXT PRIMARY KEY,
+        inode INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        infohash BLOB NOT NULL,
+        variant_hashes BLOB
+      )
+      """
+    )
+
+  def get(self, filepath: str) -> tuple[bytes, dict[bytes, bytes]] | None:
+    """
+    Returns the cached `(infohash, variant_hashes)` of an unchanged file, or `None` if there's no usable entry.
+    `variant_hashes` maps each source flag to the 20-byte infohash the torrent would have with that source.
+    """
+
+    return self.get_many([filepath]).get(filepath)
+
+  def get_many(self, filepaths: list[str | os.DirEntry]) -> dict[str, tuple[bytes, dict[bytes, bytes]]]:
+    """
+    Like `get`, but for many files at once. Files without a usable entry are left out of the result.
+    `os.DirEntry` objects may be passed instead of paths to reuse their cached `stat` results.
+    """
+
+    file_keys = {}
+    for filepath in filepaths:
+      try:
+        file_keys[os.fspath(filepath)] = self.__file_key(filepath)
+      except OSError:
+        continue
+
+    paths = list(file_keys)
+    entries = {}
+
+    for i in range(0, len(paths), QUERY_BATCH_SIZE):
+      batch = paths[i : i + QUERY_BATCH_SIZE]
+      placeholders = ", ".join("?" * len(batch))
+      rows = self._db.execute(f"SELECT * FROM infohashes WHERE path IN ({placeholders})", batch)
+
+      for path, inode, size, mtime_ns, infohash, variant_hashes in rows:
+        if file_keys[path] == (inode, size, mtime_ns):
+          entries[path] = (infohash, bencoder.decode(variant_hashes) if variant_hashes else {})
+
+    return entries
+
+  def put(self, filepath: str, infohash: bytes, variant_hashes: dict[bytes, bytes] | None = None) -> None:
+    self.put_many([(filepath, infohash, variant_hashes)])
+
+  def put_many(self, entries: list[tuple[str | os.DirEntry, bytes, dict[bytes, bytes] | None]]) -> None:
+    rows = []
+    for filepath, infohash, variant_hashes in entries:
+      try:
+        inode, size, mtime_ns = self.__file_key(filepath)
+      except OSError:
+        continue
+
+      encoded_variant_hashes = bencoder.encode(variant_hashes) if variant_hashes else None
+      rows.append((os.fspath(filepath), inode, size, mtime_ns, infohash, encoded_variant_hashes))
+
+    self._db.executemany("INSERT OR REPLACE INTO infohashes VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+  def forget_missing(self, directory: str) -> None:
+    """
+    Drops entries for files inside `directory` that don't exist anymore.
+    """
+
+    prefix = os.path.join(directory, "")
+    stale = [
+      (path,)
+      for (path,) in self._db.execute("SELECT path FROM infohashes")
+      if path.startswith(prefix) and not os.path.exists(path)
+    ]
+
+    self._db.executemany("DELETE FROM infohashes WHERE path = ?", stale)
+
+  @staticmethod
+  def __file_key(filepath: str | os.DirEntry) -> tuple[int, int, int]:
+    if isinstance(filepath, os.DirEntry):
+      # `DirEntry.stat` leaves `st_ino` unset on Windows, but `inode` always fills it in
+      stat = filepath.stat()
+      return filepath.inode(), stat.st_size, stat.st_mtime_ns
+
+    stat = os.stat(filepath)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
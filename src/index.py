@@ -0,0 +1,204 @@
+import os
+import threading
+from collections.abc import Iterable, MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+
+from .filesystem import scan_files_of_extension
+from .hash_cache import InfohashCache
+from .parser import calculate_infohash_digest_from_file
+
+# Files are handed to worker processes in chunks so that IPC overhead is paid per chunk rather than per file
+CHUNK_SIZE = 256
+
+# Generated torrents are saved in a subfolder per tracker (e.g. `output/OPS/`), so the output directory is indexed
+# one level deep
+OUTPUT_DIRECTORY_DEPTH = 1
+
+# How often a long-lived `OutputIndex` re-lists its directory to catch torrents added or removed by something else
+OUTPUT_INDEX_RECONCILE_INTERVAL = 300
+
+
+def build_infohash_index(
+  filepaths: Iterable[str | os.DirEntry],
+  workers: int = 1,
+  chunk_size: int = CHUNK_SIZE,
+  cache: InfohashCache | None = None,
+  infohashes_by_path: dict[str, str] | None = None,
+) -> dict[str, str]:
+  """
+  Builds a dictionary of infohashes and the filenames they came from, skipping files that can't be decoded.
+
+  Args:
+    `filepaths` (`Iterable[str | os.DirEntry]`): The torrent files to index. This can be a generator (e.g. from
+      `scan_files_of_extension`), which is consumed in batches rather than all at once.
+    `workers` (`int`, optional): The number of processes to hash files with. Defaults to 1 (no process pool).
+    `chunk_size` (`int`, optional): The number of files handed to a worker process at once.
+    `cache` (`InfohashCache`, optional): A persistent cache to take unchanged files' infohashes from without opening
+      them. Newly hashed files are added to it.
+    `infohashes_by_path` (`dict`, optional): If given, every indexed file's infohash is also stored in it by path,
+      including copies that share an infohash with a later file.
+  Returns:
+    A dictionary of uppercase hex infohashes to filepaths. If several files share an infohash, the last one wins,
+    the same as when indexing serially.
+  """
+
+  index = {}
+  pool = None
+
+  try:
+    for batch in __batches(filepaths, chunk_size * workers):
+      cached = {path: infohash for path, (infohash, _) in cache.get_many(batch).items()} if cache else {}
+      misses = [os.fspath(filepath) for filepath in batch if os.fspath(filepath) not in cached]
+
+      if workers > 1 and len(misses) > chunk_size:
+        pool = pool or ProcessPoolExecutor(max_workers=workers)
+        hashed = dict(__hash_in_pool(pool, misses, chunk_size))
+      else:
+        hashed = dict(__hash_files(misses))
+
+      if cache:
+        cache.put_many([(filepath, digest, None) for filepath, digest in hashed.items()])
+
+      for filepath in map(os.fspath, batch):
+        digest = cached.get(filepath) or hashed.get(filepath)
+
+        if digest:
+          index[digest.hex().upper()] = filepath
+          if infohashes_by_path is not None:
+            infohashes_by_path[filepath] = digest.hex().upper()
+  finally:
+    if pool:
+      pool.shutdown()
+
+  return index
+
+
+class OutputIndex(MutableMapping):
+  """
+  A long-lived, thread-safe index of the infohashes of the .torrent files in an output directory.
+
+  It's built once and then kept up to date as new torrents are generated (`generate_new_torrent_from_file` adds
+  the files it writes), so server mode doesn't have to list and hash the whole output directory on every webhook.
+  `reconcile` re-lists the directory to pick up changes made by anything else, and `start_reconciling` does that
+  periodically in the background. Entries whose file has since been deleted are dropped when they're looked up.
+  """
+
+  def __init__(self, directory: str, workers: int = 1, cache: InfohashCache | None = None):
+    self.directory = directory
+    self.workers = workers
+    self.cache = cache
+    self._lock = threading.Lock()
+    self._infohashes = {}
+    self._added_while_reconciling = None
+    self._stop_reconciling = threading.Event()
+
+    self.reconcile()
+
+  def reconcile(self) -> None:
+    """
+    Rebuilds the index from the files currently in the directory.
+    """
+
+    with self._lock:
+      self._added_while_reconciling = {}
+
+    try:
+      filepaths = scan_files_of_extension(self.directory, ".torrent", OUTPUT_DIRECTORY_DEPTH)
+      infohashes = build_infohash_index(filepaths, self.workers, cache=self.cache)
+    finally:
+      with self._lock:
+        added, self._added_while_reconciling = self._added_while_reconciling, None
+
+    with self._lock:
+      # Files written after the directory was listed wouldn't be in the new index yet
+      infohashes.update(added)
+      self._infohashes = infohashes
+
+  def start_reconciling(self, interval: float) -> threading.Thread:
+    """
+    Starts a daemon thread that calls `reconcile` every `interval` seconds until `stop_reconciling` is called.
+    """
+
+    thread = threading.Thread(target=self.__reconcile_periodically, args=(interval,), daemon=True)
+    thread.start()
+
+    return thread
+
+  def stop_reconciling(self) -> None:
+    self._stop_reconciling.set()
+
+  def __getitem__(self, infohash: str) -> str:
+    with self._lock:
+      filepath = self._infohashes[infohash]
+
+    if not os.path.exists(filepath):
+      with self._lock:
+        if self._infohashes.get(infohash) == filepath:
+          del self._infohashes[infohash]
+
+      raise KeyError(infohash)
+
+    return filepath
+
+  def __setitem__(self, infohash: str, filepath: str) -> None:
+    with self._lock:
+      self._infohashes[infohash] = filepath
+
+      if self._added_while_reconciling is not None:
+        self._added_while_reconciling[infohash] = filepath
+
+  def __delitem__(self, infohash: str) -> None:
+    with self._lock:
+      del self._infohashes[infohash]
+
+  def __iter__(self):
+    with self._lock:
+      return iter(list(self._infohashes))
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._infohashes)
+
+  def __reconcile_periodically(self, interval: float) -> None:
+    while not self._stop_reconciling.wait(interval):
+      try:
+        self.reconcile()
+      except Exception:
+        continue
+
+
+def __batches(filepaths: Iterable, batch_size: int):
+  batch = []
+
+  for filepath in filepaths:
+    batch.append(filepath)
+
+    if len(batch) >= batch_size:
+      yield batch
+      batch = []
+
+  if batch:
+    yield batch
+
+
+def __hash_in_pool(pool: ProcessPoolExecutor, filepaths: list[str], chunk_size: int) -> list[tuple[str, bytes]]:
+  pairs = []
+  chunks = [filepaths[i : i + chunk_size] for i in range(0, len(filepaths), chunk_size)]
+
+  for chunk_pairs in pool.map(__hash_files, chunks):
+    pairs.extend(chunk_pairs)
+
+  return pairs
+
+
+def __hash_files(filepaths: list[str]) -> list[tuple[str, bytes]]:
+  # Runs in worker processes, so only compact (path, digest) pairs are sent back to the parent
+  pairs = []
+
+  for filepath in filepaths:
+    try:
+      pairs.append((filepath, calculate_infohash_digest_from_file(filepath)))
+    except Exception:
+      continue
+
+  return pairs
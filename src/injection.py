@@ -5,7 +5,7 @@ from .clients.deluge import Deluge
 from .clients.qbittorrent import Qbittorrent
 from .config import Config
 from .errors import TorrentInjectionError
-from .parser import calculate_infohash, get_bencoded_data
+from .metadata import TorrentMeta, load_torrent_meta
 
 
 class Injection:
@@ -18,15 +18,24 @@ class Injection:
     self.client.setup()
     return self
 
-  def inject_torrent(self, source_torrent_filepath, new_torrent_filepath, new_tracker):
-    source_torrent_data = get_bencoded_data(source_torrent_filepath)
-    source_torrent_file_or_dir = self.__determine_source_torrent_data_location(source_torrent_data)
+  def inject_torrent(
+    self,
+    source_torrent_filepath,
+    new_torrent_filepath,
+    new_tracker,
+    source_torrent_meta: TorrentMeta | None = None,
+  ):
+    if source_torrent_meta is None:
+      source_torrent_meta = load_torrent_meta(source_torrent_filepath)
+
+    source_torrent_infohash = source_torrent_meta.infohash_hex
+    source_torrent_file_or_dir = self.__determine_source_torrent_data_location(source_torrent_infohash)
     output_location = self.__determine_output_location(source_torrent_file_or_dir, new_tracker)
     self.__link_files_to_output_location(source_torrent_file_or_dir, output_location)
     output_parent_directory = os.path.dirname(os.path.normpath(output_location))
 
     return self.client.inject_torrent(
-      calculate_infohash(source_torrent_data),
+      source_torrent_infohash,
       new_torrent_filepath,
       save_path_override=output_parent_directory,
     )
@@ -53,7 +62,7 @@ class Injection:
 
   # If the torrent is a single bare file, this returns the path _to that file_
   # If the torrent is one or many files in a directory, this returns the topmost directory path
-  def __determine_source_torrent_data_location(self, torrent_data):
+  def __determine_source_torrent_data_location(self, infohash):
     # Note on torrent file structures:
     # --------
     # From my testing, all torrents have a `name` stored at `[b"info"][b"name"]`. This appears to always
@@ -73,7 +82,6 @@ class Injection:
     # directory (which in our case is the `name`).
     #
     # See also: https://en.wikipedia.org/wiki/Torrent_file#File_struct
-    infohash = calculate_infohash(torrent_data)
     torrent_info_from_client = self.client.get_torrent_info(infohash)
     proposed_torrent_data_location = torrent_info_from_client["content_path"]
 
@@ -0,0 +1,161 @@
+import threading
+from concurrent.futures import Future
+from time import time
+from typing import Callable
+
+from .database import Database
+
+HOUR = 60 * 60
+
+# API errors that mean the torrent isn't on the tracker, as opposed to the lookup itself failing
+NOT_FOUND_ERRORS = ("bad hash parameter", "bad parameters")
+
+
+class LookupCache:
+  """
+  A persistent cache of `find_torrent` responses, keyed by the tracker's site URL and the infohash looked up.
+
+  Only the fields fertilizer uses are kept: whether the torrent was found, the error if it wasn't, and the file path
+  and ID if it was. Hits are kept for `hit_ttl` seconds and misses for `miss_ttl`, which is shorter so torrents
+  uploaded since get found (and should stay shorter than `RecheckPolicy`'s interval, or rechecks would only ever see
+  the cached miss). Responses to lookups that failed for any other reason aren't cached. Once there are more than
+  `max_entries` entries, the least recently used ones are evicted. Counting the entries means scanning the table,
+  so that's only checked every `max_entries // 100` stores, which lets the cache run about 1% over before evicting.
+
+  Lookups of the same infohash that are running at the same time in one process share a single API call, and
+  processes sharing the database reuse each other's responses once they're stored.
+  """
+
+  def __init__(
+    self,
+    database: Database,
+    hit_ttl: float = 30 * 24 * HOUR,
+    miss_ttl: float = 6 * HOUR,
+    max_entries: int = 100_000,
+  ):
+    self.hit_ttl = hit_ttl
+    self.miss_ttl = miss_ttl
+    self.max_entries = max_entries
+    self._db = database
+    self._db.execute(
+      """
+      CREATE TABLE IF NOT EXISTS lookups (
+        site TEXT NOT NULL,
+        infohash TEXT NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        file_path TEXT,
+        torrent_id INTEGER,
+        fetched_at REAL NOT NULL,
+        used_at REAL NOT NULL,
+        PRIMARY KEY (site, infohash)
+      )
+      """
+    )
+    self._db.execute("CREATE INDEX IF NOT EXISTS lookups_used_at ON lookups (used_at)")
+    self._lock = threading.Lock()
+    # Lookups in progress, so concurrent ones for the same infohash can wait for them instead
+    self._in_flight = {}
+    self._eviction_interval = max(max_entries // 100, 1)
+    self._stores_since_eviction = 0
+
+  def get(self, site: str, infohash: str) -> dict | None:
+    """
+    Returns the cached response for `infohash` on `site`, or `None` if there isn't one or it has expired.
+    """
+
+    infohash = infohash.upper()
+    rows = self._db.execute(
+      "SELECT status, error, file_path, torrent_id, fetched_at FROM lookups WHERE site = ? AND infohash = ?",
+      (site, infohash),
+    )
+    if not rows:
+      return None
+
+    now = time()
+    status, error, file_path, torrent_id, fetched_at = rows[0]
+    ttl = self.hit_ttl if status == "success" else self.miss_ttl
+    if now - fetched_at >= ttl:
+      return None
+
+    self._db.execute("UPDATE lookups SET used_at = ? WHERE site = ? AND infohash = ?", (now, site, infohash))
+
+    if status == "success":
+      return {"status": status, "response": {"torrent": {"filePath": file_path, "id": torrent_id}}}
+
+    return {"status": status, "error": error}
+
+  def put(self, site: str, infohash: str, response: dict) -> None:
+    """
+    Stores `response` to a lookup of `infohash` on `site`, unless it's neither a hit nor a miss.
+    """
+
+    if response.get("status") == "success":
+      torrent = response["response"]["torrent"]
+      values = ("success", None, torrent["filePath"], torrent["id"])
+    elif response.get("error") in NOT_FOUND_ERRORS:
+      values = (response["status"], response["error"], None, None)
+    else:
+      return
+
+    now = time()
+    self._db.execute(
+      "INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+      (site, infohash.upper(), *values, now, now),
+    )
+
+    with self._lock:
+      self._stores_since_eviction += 1
+      is_eviction_due = self._stores_since_eviction >= self._eviction_interval
+      if is_eviction_due:
+        self._stores_since_eviction = 0
+
+    if is_eviction_due:
+      self.__evict()
+
+  def fetch(self, site: str, infohash: str, look_up: Callable[[], dict]) -> dict:
+    """
+    Returns the cached response for `infohash` on `site`, or calls `look_up` to get one and caches it. If the same
+    lookup is already in progress in another thread, waits for it and returns its response instead.
+    """
+
+    key = (site, infohash.upper())
+    cached = self.get(*key)
+    if cached:
+      return cached
+
+    with self._lock:
+      flight = self._in_flight.get(key)
+      is_leader = flight is None
+      if is_leader:
+        flight = self._in_flight[key] = Future()
+
+    if not is_leader:
+      return flight.result()
+
+    try:
+      # The previous lookup may have finished between checking the cache and getting here
+      response = self.get(*key)
+      if not response:
+        response = look_up()
+        self.put(*key, response)
+
+      flight.set_result(response)
+
+      return response
+    except BaseException as e:
+      flight.set_exception(e)
+      raise
+    finally:
+      with self._lock:
+        del self._in_flight[key]
+
+  def __evict(self):
+    [(count,)] = self._db.execute("SELECT COUNT(*) FROM lookups")
+    if count <= self.max_entries:
+      return
+
+    self._db.execute(
+      "DELETE FROM lookups WHERE rowid IN (SELECT rowid FROM lookups ORDER BY used_at LIMIT ?)",
+      (count - self.max_entries,),
+    )
@@ -0,0 +1,137 @@
+from hashlib import sha1
+from typing import Type
+
+from .bencode import LazyDict
+from .errors import TorrentDecodingError
+from .filesystem import replace_extension
+from .parser import SourceVariantHasher, get_lazy_bencoded_data, get_origin_tracker
+from .trackers import RedTracker, OpsTracker
+
+
+class TorrentMeta:
+  """
+  A compact record of what fertilizer needs to know about a torrent file, computed once when it's loaded
+  so that later stages (hashing, lookups, writing and injection) don't have to re-read or re-decode it.
+  """
+
+  __slots__ = (
+    "filepath",
+    "buffer",
+    "info_span",
+    "files_span",
+    "infohash",
+    "origin_tracker",
+    "source",
+    "name",
+    "total_size",
+    "variant_hashes",
+    "_variant_hasher",
+  )
+
+  def __init__(
+    self,
+    filepath: str,
+    buffer,
+    info_span: tuple[int, int],
+    files_span: tuple[int, int] | None,
+    infohash: bytes,
+    origin_tracker: Type[RedTracker] | Type[OpsTracker] | None,
+    source: bytes | None,
+    name: bytes | None,
+    total_size: int,
+  ):
+    self.filepath = filepath
+    self.buffer = buffer
+    self.info_span = info_span
+    self.files_span = files_span
+    self.infohash = infohash
+    self.origin_tracker = origin_tracker
+    self.source = source
+    self.name = name
+    self.total_size = total_size
+    self.variant_hashes = {}
+    self._variant_hasher = None
+
+  @property
+  def infohash_hex(self) -> str:
+    return self.infohash.hex().upper()
+
+  @property
+  def data(self) -> LazyDict:
+    return LazyDict(self.buffer)
+
+  @property
+  def creation_date(self) -> int | None:
+    creation_date = self.data.get(b"creation date")
+    return creation_date if isinstance(creation_date, int) else None
+
+  @property
+  def variant_hasher(self) -> SourceVariantHasher:
+    if self._variant_hasher is None:
+      self._variant_hasher = SourceVariantHasher(self.buffer, *self.info_span)
+
+    return self._variant_hasher
+
+  def infohashes_for_sources(self, new_sources: list[bytes]) -> list[str]:
+    """
+    Returns the infohashes this torrent would have with each of `new_sources` as its source. Hashes already in
+    `variant_hashes` (e.g. loaded from a cache) are reused and any others are calculated and added to it.
+    """
+
+    for new_source in new_sources:
+      if new_source not in self.variant_hashes:
+        self.variant_hashes[new_source] = bytes.fromhex(self.variant_hasher.infohash_for_source(new_source))
+
+    return [self.variant_hashes[new_source].hex().upper() for new_source in new_sources]
+
+
+def load_torrent_meta(filepath: str) -> TorrentMeta:
+  """
+  Loads a torrent file into a `TorrentMeta`.
+
+  Raises:
+    `TorrentDecodingError`: if the torrent file could not be decoded or has no `info` dict.
+  """
+
+  torrent_data = get_lazy_bencoded_data(filepath)
+  info = torrent_data.get(b"info") if torrent_data else None
+
+  if not isinstance(info, LazyDict) or not info:
+    raise TorrentDecodingError("Error decoding torrent file")
+
+  info_span = torrent_data.span(b"info")
+  files = info.get(b"files")
+
+  if files is None:
+    files_span = None
+    total_size = info.get(b"length", 0)
+  else:
+    files_span = info.span(b"files")
+    total_size = sum(file.get(b"length", 0) for file in files)
+
+  return TorrentMeta(
+    filepath=filepath,
+    buffer=torrent_data.buffer,
+    info_span=info_span,
+    files_span=files_span,
+    infohash=sha1(memoryview(torrent_data.buffer)[info_span[0] : info_span[1]]).digest(),
+    origin_tracker=__get_origin_tracker_with_fastresume(filepath, torrent_data),
+    source=info.get(b"source"),
+    name=info.get(b"name"),
+    total_size=total_size,
+  )
+
+
+def __get_origin_tracker_with_fastresume(filepath: str, torrent_data: LazyDict):
+  # The fastresume stuff is to support qBittorrent since it doesn't store
+  # announce URLs in the torrent file IFF we're taking the file from `BT_backup`.
+  #
+  # qbit stores that information in a sidecar file that has the exact same name
+  # as the torrent file but with a `.fastresume` extension instead. It's also stored
+  # in a list of lists called `trackers` in this `.fastresume` file instead of `announce`.
+  torrent_tracker = get_origin_tracker(torrent_data)
+  if torrent_tracker:
+    return torrent_tracker
+
+  fastresume_data = get_lazy_bencoded_data(replace_extension(filepath, ".fastresume"))
+  return get_origin_tracker(fastresume_data) if fastresume_data else None
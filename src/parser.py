@@ -1,14 +1,28 @@
-import copy
+import mmap
 import os
+import threading
 from hashlib import sha1
 from typing import Type
 
-import bencoder
-
+from .bencode import (
+  DICT_TOKEN,
+  END_TOKEN,
+  LazyDict,
+  dict_item_span,
+  dict_splices,
+  dict_value_span,
+  encode_item,
+  splice_segments,
+  string_value,
+  value_end,
+)
 from .errors import TorrentDecodingError
 from .trackers import RedTracker, OpsTracker
 from .utils import flatten
 
+SNIFF_READ_SIZE = 16 * 1024
+MMAP_THRESHOLD = 1024 * 1024
+
 
 def is_valid_infohash(infohash: str) -> bool:
   if not isinstance(infohash, str) or len(infohash) != 40:
@@ -58,36 +72,243 @@ def get_origin_tracker(torrent_data: dict) -> Type[RedTracker] | Type[OpsTracker
   return None
 
 
-def calculate_infohash(torrent_data: dict) -> str:
-  try:
-    return sha1(bencoder.encode(torrent_data[b"info"])).hexdigest().upper()
-  except KeyError:
+def calculate_infohash_from_buffer(data) -> str:
+  """
+  Calculates the infohash of an encoded torrent by hashing the `info` dict's byte span in place,
+  without decoding or re-encoding anything.
+  """
+
+  return calculate_infohash_digest_from_buffer(data).hex().upper()
+
+
+def calculate_infohash_digest_from_buffer(data) -> bytes:
+  """
+  Like `calculate_infohash_from_buffer`, but returns the raw 20-byte digest.
+  """
+
+  info_start, info_end = get_info_span(data)
+
+  return sha1(memoryview(data)[info_start:info_end]).digest()
+
+
+def calculate_infohash_from_file(filepath: str) -> str:
+  return calculate_infohash_from_buffer(read_torrent_buffer(filepath))
+
+
+def calculate_infohash_digest_from_file(filepath: str) -> bytes:
+  return calculate_infohash_digest_from_buffer(read_torrent_buffer(filepath))
+
+
+def get_info_span(data) -> tuple[int, int]:
+  info_span = dict_value_span(data, 0, b"info")
+
+  if info_span is None or data[info_span[0]] != DICT_TOKEN:
     raise TorrentDecodingError("Torrent data does not contain 'info' key")
 
+  return info_span
+
 
-def recalculate_hash_for_new_source(torrent_data: dict, new_source: (bytes | str)) -> str:
-  torrent_data = copy.deepcopy(torrent_data)
-  torrent_data[b"info"][b"source"] = new_source
+class SourceVariantHasher:
+  """
+  Calculates the infohashes a torrent would have with different `source` values.
 
-  return calculate_infohash(torrent_data)
+  The encoded `info` dict is kept once and each variant is produced by splicing only the `source` item
+  into it, with every variant's SHA1 continuing from a shared hash of the bytes that precede `source`.
+  """
 
+  def __init__(self, data, info_start: int = 0, info_end: int | None = None):
+    info_end = len(data) if info_end is None else info_end
+    source_start, source_end = dict_item_span(data, info_start, b"source")
+    view = memoryview(data)
+
+    self._prefix_hash = sha1(view[info_start:source_start])
+    self._suffix = view[source_end:info_end]
+
+  @classmethod
+  def from_buffer(cls, data):
+    return cls(data, *get_info_span(data))
+
+  def infohash_for_source(self, new_source: (bytes | str | None)) -> str:
+    """
+    Returns the infohash with `source` set to `new_source`, or with `source` removed entirely if `new_source` is `None`.
+    """
+
+    variant_hash = self._prefix_hash.copy()
+    if new_source is not None:
+      variant_hash.update(encode_item(b"source", new_source))
+    variant_hash.update(self._suffix)
+
+    return variant_hash.hexdigest().upper()
+
+  def infohashes_for_sources(self, new_sources: list[bytes | str | None]) -> list[str]:
+    return [self.infohash_for_source(new_source) for new_source in new_sources]
+
+
+def read_torrent_buffer(filename: str, mmap_threshold: int | None = MMAP_THRESHOLD):
+  """
+  Returns the raw contents of a torrent or fastresume file for the `bencode` helpers and hashers to work on.
+
+  Files of at least `mmap_threshold` bytes are memory-mapped read-only instead of being copied into a new `bytes`
+  object, so pages are only loaded when touched and are shared through the page cache between processes
+  reading the same file. Pass `None` to always read the file into memory.
+  """
+
+  with open(filename, "rb") as f:
+    size = os.fstat(f.fileno()).st_size
+
+    # Empty files can't be mapped, and small ones are cheaper to read than to map
+    if mmap_threshold is not None and size and size >= mmap_threshold:
+      return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return f.read()
+
+
+def get_lazy_bencoded_data(filename: str) -> LazyDict | None:
+  """
+  Returns a `LazyDict` view of a torrent file that only decodes the values a caller looks up, or `None` if the file
+  couldn't be read or isn't a valid torrent.
+  """
 
-def get_bencoded_data(filename: str) -> dict | None:
   try:
-    with open(filename, "rb") as f:
-      data = bencoder.decode(f.read())
+    data = LazyDict(read_torrent_buffer(filename))
+
+    # Indexing the top-level keys walks the whole structure, so malformed files are still rejected up front
+    if data.end != len(data.buffer):
+      raise TorrentDecodingError("Unexpected data after the end of the torrent")
 
     return data
   except Exception:
     return None
 
 
-def save_bencoded_data(filepath: str, torrent_data: dict) -> str:
+def splice_torrent(data, top_level_items: dict, info_items: dict) -> list:
+  """
+  Rewrites an encoded torrent by splicing new values for `top_level_items` and `info_items` into the original bytes
+  (see `dict_splices`). Everything else, including `pieces`, is returned as memoryviews of `data` without being
+  decoded or copied.
+
+  Returns:
+    A list of segments that make up the new torrent, suitable for `save_spliced_data`.
+  """
+
+  info_start, _ = get_info_span(data)
+  splices = dict_splices(data, 0, top_level_items) + dict_splices(data, info_start, info_items)
+
+  return splice_segments(data, 0, len(data), splices)
+
+
+def save_spliced_data(filepath: str, segments: list) -> str:
+  """
+  Writes `segments` to `filepath` atomically: they're written to a temporary file in the same directory, which is
+  then renamed into place. Anything else watching or indexing the directory (e.g. another fertilizer process sharing
+  the output directory) sees either no file or the complete one, never a partially written torrent.
+  """
+
   parent_dir = os.path.dirname(filepath)
   if parent_dir:
     os.makedirs(parent_dir, exist_ok=True)
 
-  with open(filepath, "wb") as f:
-    f.write(bencoder.encode(torrent_data))
+  # Doesn't end in .torrent, so it's never picked up as a torrent while it's being written
+  temp_filepath = os.path.join(parent_dir, f".{os.path.basename(filepath)}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+  try:
+    with open(temp_filepath, "wb", buffering=0) as f:
+      if hasattr(os, "writev"):
+        __writev_all(f.fileno(), segments)
+      else:
+        for segment in segments:
+          f.write(segment)
+
+    os.replace(temp_filepath, filepath)
+  except BaseException:
+    if os.path.exists(temp_filepath):
+      os.remove(temp_filepath)
+    raise
 
   return filepath
+
+
+def get_torrent_skeleton(filename: str, read_size: int = SNIFF_READ_SIZE) -> LazyDict:
+  """
+  Reads everything in a torrent file except the contents of `pieces`, which is replaced with an empty string.
+
+  Keys are sorted in bencoded dicts, so `announce` and the file list come before `pieces` and the rest of `info`
+  (including `source`) comes right after it. This takes one read from the start of the file up to `pieces`
+  and one read from the end of `pieces` to the end of the file, no matter how large `pieces` is.
+
+  Raises:
+    `TorrentDecodingError`: if the torrent couldn't be read within `read_size` bytes on either side of `pieces`.
+  """
+
+  with open(filename, "rb") as f:
+    head = f.read(read_size)
+    pieces_start, pieces_end = __find_pieces_span(head)
+    f.seek(pieces_end)
+    tail = f.read(read_size + 1)
+
+  if len(tail) > read_size:
+    raise TorrentDecodingError("Torrent is too large to read without its pieces")
+
+  data = LazyDict(head[:pieces_start] + b"0:" + tail)
+  if data.end != len(data.buffer):
+    raise TorrentDecodingError("Unexpected data after the end of the torrent")
+
+  return data
+
+
+def sniff_origin_tracker(filename: str, read_size: int = SNIFF_READ_SIZE) -> Type[RedTracker] | Type[OpsTracker] | None:
+  """
+  Determines the origin tracker of a torrent from `get_torrent_skeleton` without reading the whole file.
+
+  Raises:
+    `TorrentDecodingError`: if the tracker couldn't be determined from a partial read, in which case the torrent
+    should be fully parsed instead.
+  """
+
+  return get_origin_tracker(get_torrent_skeleton(filename, read_size))
+
+
+def __find_pieces_span(data) -> tuple[int, int]:
+  # This can't use `iter_dict` since `data` is usually truncated partway through `pieces`
+  # and only the length prefix of `pieces` is needed to know where it ends.
+  try:
+    if data[0] != DICT_TOKEN:
+      raise TorrentDecodingError("Torrent data is not a dict")
+
+    pos = 1
+    while data[pos] != END_TOKEN:
+      key_end = value_end(data, pos)
+
+      if string_value(data, pos, key_end) == b"info" and data[key_end] == DICT_TOKEN:
+        info_pos = key_end + 1
+        while data[info_pos] != END_TOKEN:
+          info_key_end = value_end(data, info_pos)
+
+          if string_value(data, info_pos, info_key_end) == b"pieces":
+            colon = data.find(b":", info_key_end)
+            if colon == -1:
+              raise TorrentDecodingError("Unexpected end of bencoded data")
+
+            return info_key_end, colon + 1 + int(data[info_key_end:colon])
+
+          info_pos = value_end(data, info_key_end)
+
+      pos = value_end(data, key_end)
+  except (IndexError, ValueError):
+    raise TorrentDecodingError("Unexpected end of bencoded data")
+
+  raise TorrentDecodingError("Torrent data does not contain 'pieces' key")
+
+
+def __writev_all(fd: int, segments: list):
+  # `writev` may write fewer bytes than asked for, so keep going from wherever it stopped
+  pending = [memoryview(segment) for segment in segments]
+  while pending:
+    written = os.writev(fd, pending)
+
+    while pending and written >= len(pending[0]):
+      written -= len(pending[0])
+      pending.pop(0)
+
+    if pending and written:
+      pending[0] = pending[0][written:]
@@ -0,0 +1,509 @@
+import os
+import threading
+from time import monotonic, sleep
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue
+
+from .api import RedAPI, OpsAPI
+from .errors import (
+  UnknownTrackerError,
+  TorrentNotFoundError,
+  TorrentAlreadyExistsError,
+  TorrentExistsInClientError,
+  TrackerUnavailableError,
+)
+from .hash_cache import InfohashCache
+from .injection import Injection
+from .scan_state import SETTLED_STATUSES, ScanState
+from .source_flags import SourceFlagStats
+from .torrent import generate_new_torrent_from_file, load_source_torrent
+from .trackers import RedTracker, OpsTracker
+
+# How many torrents each stage may get ahead of the next one. This bounds memory (loaded torrents hold their
+# file's contents) while keeping enough work queued that the API stage never waits on local work.
+QUEUE_SIZE = 64
+
+# The most API calls a single lookup can make, i.e. what rechecking a torrent that still isn't found costs
+LOOKUP_API_CALLS = max(len(tracker.source_flags_for_creation()) for tracker in (RedTracker, OpsTracker))
+
+# Marks the end of the input in each queue
+END_OF_INPUT = object()
+
+# The status of jobs that weren't scanned because the `ScanBudget` ran out
+UNSCANNED = "unscanned"
+
+
+class ScanBudget:
+  """
+  Limits how long a scan may run and how many API calls it may make. Before each lookup the pipeline reserves
+  as many calls as a lookup can make and refunds what it didn't use, so the call limit is never exceeded even with
+  several lanes looking up at once (retries after failed requests aside).
+  """
+
+  def __init__(self, max_runtime: float | None = None, max_api_calls: int | None = None):
+    self.deadline = monotonic() + max_runtime if max_runtime is not None else None
+    self.max_api_calls = max_api_calls
+    self.api_calls = 0
+    self._lock = threading.Lock()
+
+  def exhausted(self) -> bool:
+    with self._lock:
+      return self.__is_exhausted(0)
+
+  def reserve(self, api_calls: int) -> bool:
+    with self._lock:
+      if self.__is_exhausted(api_calls):
+        return False
+
+      self.api_calls += api_calls
+      return True
+
+  def refund(self, api_calls: int) -> None:
+    with self._lock:
+      self.api_calls -= api_calls
+
+  def __is_exhausted(self, api_calls: int) -> bool:
+    if self.deadline is not None and monotonic() >= self.deadline:
+      return True
+
+    # With nothing to reserve, the budget is exhausted once not even a single call is left
+    return self.max_api_calls is not None and self.api_calls + max(api_calls, 1) > self.max_api_calls
+
+
+class ScanJob:
+  """
+  A single torrent's trip through the `ScanPipeline`. Once a stage sets `status`, later stages pass the job along
+  untouched. `status` names the `Progress` counter the result belongs to and `message` is what gets printed for it.
+  """
+
+  __slots__ = (
+    "index",
+    "filepath",
+    "source_infohash",
+    "meta",
+    "new_tracker",
+    "new_torrent_filepath",
+    "was_previously_generated",
+    "status",
+    "message",
+    "from_scan_state",
+  )
+
+  def __init__(self, index: int, filepath: str):
+    self.index = index
+    self.filepath = filepath
+    self.source_infohash = None
+    self.meta = None
+    self.new_tracker = None
+    self.new_torrent_filepath = None
+    self.was_previously_generated = False
+    self.status = None
+    self.message = None
+    self.from_scan_state = False
+
+  def finish(self, status: str, message: str) -> None:
+    self.status = status
+    self.message = message
+
+  def fail(self, e: Exception) -> None:
+    if isinstance(e, UnknownTrackerError):
+      self.finish("skipped", str(e))
+    elif isinstance(e, (TorrentAlreadyExistsError, TorrentExistsInClientError)):
+      self.finish("already_exists", str(e))
+    elif isinstance(e, TorrentNotFoundError):
+      self.finish("not_found", str(e))
+    else:
+      self.finish("error", str(e))
+
+
+class ScanPipeline:
+  """
+  Runs the steps of a directory scan as concurrent stages connected by bounded queues:
+
+    load (`workers` threads) -> route -> lookup and write (1 thread per tracker) -> inject (1 thread) -> caller
+
+  Loading (decoding and hashing) runs ahead of the tracker lookups, so the lookup stage spends its time making
+  API calls as fast as the rate limit allows instead of waiting on local work, and injecting one torrent no longer
+  delays looking up the next. Each torrent is routed to the lane of the tracker it'll be looked up on, and since
+  RED and OPS have separate rate limits, both lanes make API calls at the same time. Within a lane lookups run one
+  at a time and in input order. Results are put back into input order before they're handed to the caller.
+
+  With a `scan_state`, torrents that a previous scan settled (see `ScanState.settled_result`) are finished
+  without being loaded or looked up, and the outcomes of the others are recorded for the next scan. With an
+  `injector`, previously generated torrents are still loaded and injected, since an earlier scan may have generated
+  them without one. Torrents are recognized by path through `source_infohashes` (see `build_infohash_index`'s
+  `infohashes_by_path`), which has to include every copy of a torrent for all of them to be settled. Torrents that weren't found are looked up again when their recheck is due, but if
+  `recheck_budget` is set, only as many as that many API calls allow are, starting with the most promising ones.
+
+  Copies of the same release (e.g. a client's BT_backup copy and a watch folder copy of one torrent) would become
+  the same new torrent, so they're grouped by the infohashes their variants for the reciprocal tracker would have.
+  Only the first torrent of each group is looked up and the others share its outcome, found or not.
+
+  When a tracker is unavailable (see `GazelleAPI.circuit_breaker`), its lookups fail fast and the torrents are put
+  in their lane's retry queue instead, so the other lane carries on at full speed. Once the rest of its input is
+  done, the lane waits for the tracker's circuit to let a probe through and retries them. Those that still can't be
+  looked up are finished as errors, which later scans look up again.
+
+  With a `budget`, no new torrents are started once it runs out. Torrents that were already on their way are
+  finished with the `UNSCANNED` status instead of being looked up.
+
+  If a stage fails (e.g. the scan state's database is locked), no new torrents are started either. The stages after it
+  are still ended so everything already on its way drains, and then `run` raises the first error.
+  """
+
+  def __init__(
+    self,
+    output_directory: str,
+    red_api: RedAPI,
+    ops_api: OpsAPI,
+    injector: Injection | None,
+    input_infohashes: dict,
+    output_infohashes: dict,
+    cache: InfohashCache | None = None,
+    workers: int = 1,
+    queue_size: int = QUEUE_SIZE,
+    scan_state: ScanState | None = None,
+    recheck_budget: int | None = None,
+    budget: ScanBudget | None = None,
+    source_flag_stats: SourceFlagStats | None = None,
+    source_infohashes: dict | None = None,
+  ):
+    self.output_directory = output_directory
+    self.red_api = red_api
+    self.ops_api = ops_api
+    self.injector = injector
+    self.input_infohashes = input_infohashes
+    self.output_infohashes = output_infohashes
+    self.cache = cache
+    self.workers = workers
+    self.queue_size = queue_size
+    self.scan_state = scan_state
+    self.recheck_budget = recheck_budget
+    self.budget = budget
+    self.source_flag_stats = source_flag_stats
+    # Lets settled torrents be recognized by their path alone, without loading them. `input_infohashes` only keeps
+    # one path per infohash, so without the full map other copies of a torrent are always loaded and looked up.
+    if source_infohashes is None:
+      source_infohashes = {filepath: infohash for infohash, filepath in input_infohashes.items()}
+    self.source_infohashes = source_infohashes
+    # The outcome of looking up each group of copies this run, keyed by the group's variant infohashes
+    self.lookup_outcomes = {}
+    # The first error a stage failed with this run
+    self.error = None
+    self._error_lock = threading.Lock()
+
+  def run(self, filepaths: list[str]):
+    """
+    Scans `filepaths` and yields a finished `ScanJob` for each of them, in the same order.
+
+    Raises:
+      The first error a stage failed with, once the stages after it have drained.
+    """
+
+    loaded = Queue(self.queue_size)
+    lanes = {tracker: Queue(self.queue_size) for tracker in (RedTracker, OpsTracker)}
+    looked_up = Queue(self.queue_size)
+    finished = Queue(self.queue_size)
+    rechecks = self.__plan_rechecks(filepaths)
+    self.lookup_outcomes = {}
+    self.error = None
+
+    with ThreadPoolExecutor(max_workers=self.workers) as load_pool:
+      stages = [
+        threading.Thread(target=self.__feed, args=(load_pool, filepaths, rechecks, loaded)),
+        threading.Thread(target=self.__route, args=(loaded, lanes, looked_up)),
+        *[threading.Thread(target=self.__run_lane, args=(tracker, lane, looked_up)) for tracker, lane in lanes.items()],
+        threading.Thread(target=self.__run_stage, args=(self.__inject, looked_up, finished, len(lanes))),
+      ]
+
+      for stage in stages:
+        stage.daemon = True
+        stage.start()
+
+      # Lanes finish out of order, so jobs wait here until every job before them is done
+      reorder_buffer = {}
+      next_index = 0
+
+      try:
+        while (job := finished.get()) is not END_OF_INPUT:
+          if self.scan_state and not job.from_scan_state:
+            self.__record(job)
+
+          # The loaded torrent isn't needed anymore and may be holding a large buffer
+          job.meta = None
+          reorder_buffer[job.index] = job
+
+          while next_index in reorder_buffer:
+            yield reorder_buffer.pop(next_index)
+            next_index += 1
+      except Exception as e:
+        self.__fail(e, finished)
+
+    if self.error is not None:
+      raise self.error
+
+  def __plan_rechecks(self, filepaths: list[str]) -> set[str] | None:
+    # Returns the infohashes of the torrents that may be rechecked this run, or `None` if there's no limit
+    if not self.scan_state or self.recheck_budget is None:
+      return None
+
+    infohashes = [self.source_infohashes[filepath] for filepath in filepaths if filepath in self.source_infohashes]
+    return set(self.scan_state.prioritized_rechecks(infohashes)[: self.recheck_budget // LOOKUP_API_CALLS])
+
+  def __feed(
+    self,
+    load_pool: ThreadPoolExecutor,
+    filepaths: list[str],
+    rechecks: set[str] | None,
+    loaded: Queue,
+  ) -> None:
+    # Futures are queued in input order, so jobs are routed in order no matter which load finishes first
+    try:
+      for index, filepath in enumerate(filepaths):
+        if self.error is not None or (self.budget and self.budget.exhausted()):
+          break
+
+        job = ScanJob(index, filepath)
+        job.source_infohash = self.source_infohashes.get(filepath)
+
+        if self.scan_state:
+          recheck = rechecks is None or job.source_infohash in rechecks
+          settled_result = self.scan_state.settled_result(job.source_infohash, recheck)
+        else:
+          settled_result = None
+
+        if settled_result and settled_result[0] == "already_exists" and self.injector:
+          # It may have been generated by a scan without an injector, so it's still injected, just not looked up
+          job.new_torrent_filepath = self.scan_state.get(job.source_infohash)["output_path"]
+          job.was_previously_generated = True
+          loaded.put(load_pool.submit(self.__load, job))
+        elif settled_result:
+          job.finish(*settled_result)
+          job.from_scan_state = True
+          loaded.put(self.__finished_future(job))
+        else:
+          loaded.put(load_pool.submit(self.__load, job))
+    except Exception as e:
+      self.__fail(e)
+    finally:
+      loaded.put(END_OF_INPUT)
+
+  def __route(self, loaded: Queue, lanes: dict[type, Queue], looked_up: Queue) -> None:
+    try:
+      while (future := loaded.get()) is not END_OF_INPUT:
+        job = future.result()
+
+        if job.status is not None:
+          looked_up.put(job)
+        elif job.was_previously_generated:
+          # Settled by an earlier scan, so only injecting it is left (see `__feed`)
+          job.new_tracker = job.meta.origin_tracker.reciprocal_tracker()
+          looked_up.put(job)
+        else:
+          lanes[job.meta.origin_tracker.reciprocal_tracker()].put(job)
+    except Exception as e:
+      self.__fail(e, loaded)
+    finally:
+      for lane in lanes.values():
+        lane.put(END_OF_INPUT)
+
+  def __run_stage(self, step, inbox: Queue, outbox: Queue, producers: int = 1) -> None:
+    try:
+      # Stages fed by several others only finish once all of them have
+      while producers:
+        job = inbox.get()
+
+        if job is END_OF_INPUT:
+          producers -= 1
+          continue
+
+        if job.status is None:
+          try:
+            step(job)
+          except Exception as e:
+            job.fail(e)
+
+        outbox.put(job)
+    except Exception as e:
+      self.__fail(e, inbox, producers)
+    finally:
+      outbox.put(END_OF_INPUT)
+
+  def __run_lane(self, new_tracker: type, inbox: Queue, outbox: Queue) -> None:
+    api = self.red_api if new_tracker == RedTracker else self.ops_api
+    retry_queue = []
+    producers = 1
+
+    try:
+      while (job := inbox.get()) is not END_OF_INPUT:
+        if self.__look_up_or_defer(job):
+          outbox.put(job)
+        else:
+          # Deferred torrents are loaded again when they're retried, rather than held in memory until then
+          job.meta = None
+          retry_queue.append(job)
+
+      producers = 0
+
+      if retry_queue:
+        wait = api.circuit_breaker.seconds_until_probe()
+        # Torrents still waiting once the budget's deadline passes are finished as unscanned anyway
+        if self.budget and self.budget.deadline is not None:
+          wait = min(wait, max(self.budget.deadline - monotonic(), 0))
+
+        sleep(wait)
+
+      for job in retry_queue:
+        self.__load(job)
+        if not self.__look_up_or_defer(job):
+          job.finish("error", f"{api.sitename} is unavailable, so this torrent will be looked up again next scan.")
+
+        outbox.put(job)
+    except Exception as e:
+      self.__fail(e, inbox, producers)
+    finally:
+      outbox.put(END_OF_INPUT)
+
+  def __fail(self, e: Exception, inbox: Queue | None = None, producers: int = 1) -> None:
+    # Keeps the first error for `run` to raise. The failed stage keeps taking its input until the stages before it
+    # have ended (they stop starting new torrents once `error` is set), so none of them blocks on a full queue.
+    with self._error_lock:
+      if self.error is None:
+        self.error = e
+
+    while inbox is not None and producers:
+      if inbox.get() is END_OF_INPUT:
+        producers -= 1
+
+  def __look_up_or_defer(self, job: ScanJob) -> bool:
+    # Returns `False` if the job has to wait because its tracker is unavailable
+    if job.status is None:
+      try:
+        self.__look_up(job)
+      except TrackerUnavailableError:
+        return False
+      except Exception as e:
+        job.fail(e)
+
+    return True
+
+  @staticmethod
+  def __finished_future(job: ScanJob) -> Future:
+    future = Future()
+    future.set_result(job)
+
+    return future
+
+  def __load(self, job: ScanJob) -> ScanJob:
+    try:
+      job.meta = load_source_torrent(job.filepath, self.cache)
+      job.source_infohash = job.meta.infohash_hex
+    except Exception as e:
+      job.fail(e)
+
+    return job
+
+  def __look_up(self, job: ScanJob) -> None:
+    new_tracker = job.meta.origin_tracker.reciprocal_tracker()
+    # Every copy in a group is routed to the same lane and lanes look up in input order, so by the time a later
+    # copy gets here the first one's outcome is known
+    group = tuple(job.meta.infohashes_for_sources(new_tracker.source_flags_for_creation()))
+    if group in self.lookup_outcomes:
+      self.__share_outcome(job, self.lookup_outcomes[group])
+      return
+
+    if self.budget and not self.budget.reserve(LOOKUP_API_CALLS):
+      job.finish(UNSCANNED, "Scan budget reached")
+      return
+
+    api = self.red_api if new_tracker == RedTracker else self.ops_api
+    request_count = api.request_count
+
+    try:
+      job.new_tracker, job.new_torrent_filepath, job.was_previously_generated = generate_new_torrent_from_file(
+        job.filepath,
+        self.output_directory,
+        self.red_api,
+        self.ops_api,
+        self.input_infohashes,
+        self.output_infohashes,
+        source_torrent_meta=job.meta,
+        source_flag_stats=self.source_flag_stats,
+      )
+    except TorrentNotFoundError as e:
+      self.lookup_outcomes[group] = e
+      raise
+    finally:
+      # Each lane is the only user of its tracker's API, so the difference is exactly what this lookup used
+      if self.budget:
+        self.budget.refund(LOOKUP_API_CALLS - (api.request_count - request_count))
+
+    self.lookup_outcomes[group] = (job.new_tracker, job.new_torrent_filepath)
+
+  @staticmethod
+  def __share_outcome(job: ScanJob, outcome) -> None:
+    if isinstance(outcome, TorrentNotFoundError):
+      raise TorrentNotFoundError(str(outcome))
+
+    # The first copy already generated (or found) the new torrent, so for the others it was previously generated
+    job.new_tracker, job.new_torrent_filepath = outcome
+    job.was_previously_generated = True
+
+  def __inject(self, job: ScanJob) -> None:
+    if self.injector:
+      self.injector.inject_torrent(
+        job.filepath,
+        job.new_torrent_filepath,
+        job.new_tracker.site_shortname(),
+        source_torrent_meta=job.meta,
+      )
+
+    self.__finish(job)
+
+  def __finish(self, job: ScanJob) -> None:
+    if job.was_previously_generated:
+      if self.injector:
+        job.finish("already_exists", "Torrent was previously generated but was injected into your torrent client.")
+      else:
+        job.finish("already_exists", "Torrent was previously generated.")
+    else:
+      job.finish(
+        "generated",
+        f"Torrent can be cross-seeded to {job.new_tracker.site_shortname()}; successfully generated as '{job.new_torrent_filepath}'.",
+      )
+
+  def __record(self, job: ScanJob) -> None:
+    if not job.source_infohash:
+      return
+
+    if job.new_torrent_filepath and job.status in ("generated", "already_exists"):
+      self.scan_state.record(
+        job.source_infohash,
+        "generated",
+        job.message,
+        source_flag=self.__new_source_flag(job),
+        output_path=job.new_torrent_filepath,
+      )
+    elif job.status == "not_found":
+      self.scan_state.record(job.source_infohash, job.status, job.message, added_at=self.__created_at(job))
+    elif job.status in SETTLED_STATUSES:
+      self.scan_state.record(job.source_infohash, job.status, job.message)
+
+  @staticmethod
+  def __created_at(job: ScanJob) -> float | None:
+    # When the torrent was made is the best guess at when it was uploaded, falling back to when it was downloaded
+    creation_date = job.meta.creation_date if job.meta else None
+    if creation_date is not None:
+      return float(creation_date)
+
+    try:
+      return os.path.getmtime(job.filepath)
+    except OSError:
+      return None
+
+  def __new_source_flag(self, job: ScanJob) -> bytes | None:
+    for source_flag, infohash in job.meta.variant_hashes.items():
+      if self.output_infohashes.get(infohash.hex().upper()) == job.new_torrent_filepath:
+        return source_flag
+
+    return None
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+from time import monotonic, time
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# Where processes on the same host keep the state of the rate limits they share (see `SharedTokenBucket`). Each
+# user gets their own directory, since the temporary directory is shared with every other user on the host.
+if hasattr(os, "getuid"):
+  SHARED_RATE_LIMIT_DIRECTORY = os.path.join(tempfile.gettempdir(), f"fertilizer-rate-limits-{os.getuid()}")
+else:
+  SHARED_RATE_LIMIT_DIRECTORY = None
+
+# A `SharedTokenBucket`'s state: how many tokens are left and when that was last worked out
+SHARED_STATE = struct.Struct("dd")
+
+
+class RateLimiterMetrics:
+  """
+  How long callers have had to wait for a `TokenBucket`. All times are in seconds.
+  """
+
+  def __init__(self):
+    self.acquired = 0
+    self.waited = 0
+    self.total_wait = 0.0
+    self.max_wait = 0.0
+
+  def record(self, wait: float) -> None:
+    self.acquired += 1
+    if wait > 0:
+      self.waited += 1
+      self.total_wait += wait
+      self.max_wait = max(self.max_wait, wait)
+
+  def snapshot(self) -> dict:
+    return {
+      "acquired": self.acquired,
+      "waited": self.waited,
+      "total_wait": self.total_wait,
+      "average_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+      "max_wait": self.max_wait,
+    }
+
+
+class TokenBucket:
+  """
+  A thread-safe token bucket that allows one request every `interval` seconds on average and bursts of up to
+  `capacity` requests after it's been idle. With a `capacity` of 1, requests are simply spaced `interval` apart.
+
+  Callers that have to wait sleep on a condition variable until exactly when the next token is due, instead of
+  polling, so requests go out at the permitted rate and no sooner. The bucket starts full.
+  """
+
+  def __init__(self, interval: float, capacity: int = 1, clock=monotonic):
+    if interval < 0 or capacity < 1:
+      raise ValueError("A token bucket needs a non-negative interval and a capacity of at least 1")
+
+    self.interval = interval
+    self.capacity = capacity
+    self.metrics = RateLimiterMetrics()
+    self._clock = clock
+    self._tokens = float(capacity)
+    self._updated_at = clock()
+    self._condition = threading.Condition()
+
+  def acquire(self, timeout: float | None = None) -> bool:
+    """
+    Takes a token, waiting for one if needed. Returns `False` if none became available within `timeout` seconds.
+    """
+
+    started_at = self._clock()
+    waited = False
+
+    with self._condition:
+      while (delay := self._take_or_delay()) > 0:
+        if timeout is not None:
+          remaining = started_at + timeout - self._clock()
+          if remaining < delay:
+            return False
+
+        self._condition.wait(delay)
+        waited = True
+
+      self.metrics.record(self._clock() - started_at if waited else 0.0)
+
+    return True
+
+  def try_acquire(self) -> bool:
+    """
+    Takes a token if one is available right now, without waiting.
+    """
+
+    with self._condition:
+      if self._take_or_delay() > 0:
+        return False
+
+      self.metrics.record(0.0)
+      return True
+
+  async def acquire_async(self) -> None:
+    """
+    Like `acquire`, but waits without blocking the event loop.
+    """
+
+    started_at = self._clock()
+    waited = False
+
+    while True:
+      with self._condition:
+        delay = self._take_or_delay()
+        if delay <= 0:
+          self.metrics.record(self._clock() - started_at if waited else 0.0)
+          return
+
+      await asyncio.sleep(delay)
+      waited = True
+
+  def _take_or_delay(self) -> float:
+    # Must hold `_condition`. Takes a token and returns 0, or returns how long until the next one is due.
+    now = self._clock()
+    self._tokens, delay = self._take(self._tokens, self._updated_at, now)
+    self._updated_at = now
+
+    return delay
+
+  def _take(self, tokens: float, updated_at: float, now: float) -> tuple[float, float]:
+    # Refills `tokens` for the time since `updated_at`, then returns what's left after taking one along with 0,
+    # or what's left without taking one along with how long until the next one is due
+    if self.interval == 0:
+      return self.capacity - 1, 0
+
+    # Wall clocks can go backwards, which shouldn't cost tokens
+    tokens = min(self.capacity, tokens + max(now - updated_at, 0) / self.interval)
+    if tokens >= 1:
+      return tokens - 1, 0
+
+    return tokens, (1 - tokens) * self.interval
+
+
+class SharedTokenBucket(TokenBucket):
+  """
+  A `TokenBucket` whose state lives in a file at `path`, so every process on the host using the same file shares
+  one budget. This keeps the many short-lived processes a torrent client's on-complete hook can start at once from
+  exceeding a tracker's rate limit together.
+
+  Taking a token holds an exclusive `flock` on the file only long enough to update it. Callers that have to wait
+  sleep until the next token is due without holding it. Times are wall clock times, since they're compared across
+  processes. If the file can't be opened later on (e.g. a cleanup job removed it), this process keeps limiting
+  itself without it.
+
+  Raises:
+    `OSError`: if the file's directory can't be created or belongs to another user.
+  """
+
+  def __init__(self, path: str, interval: float, capacity: int = 1):
+    super().__init__(interval, capacity, clock=time)
+    self.path = path
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # Another user's processes could tamper with (or lock us out of) the state in a directory they created
+    if hasattr(os, "getuid") and os.stat(directory).st_uid != os.getuid():
+      raise PermissionError(f"{directory} belongs to another user")
+
+  def _take_or_delay(self) -> float:
+    if self.interval == 0:
+      return 0
+
+    try:
+      fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError:
+      return super()._take_or_delay()
+
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX)
+
+      now = self._clock()
+      state = os.pread(fd, SHARED_STATE.size, 0)
+      # A new (or damaged) file starts out as a full bucket
+      tokens, updated_at = SHARED_STATE.unpack(state) if len(state) == SHARED_STATE.size else (self.capacity, now)
+
+      tokens, delay = self._take(tokens, updated_at, now)
+      os.pwrite(fd, SHARED_STATE.pack(tokens, now), 0)
+
+      return delay
+    finally:
+      # Closing the file releases the lock
+      os.close(fd)
+
+
+def create_rate_limiter(
+  interval: float,
+  capacity: int = 1,
+  shared_directory: str | None = None,
+  key: str = "",
+) -> TokenBucket:
+  """
+  Returns a rate limiter for requests made with `key` (e.g. an API key). With a `shared_directory`, every process
+  on the host limiting the same `key` shares one `SharedTokenBucket`, unless file locking isn't available here or
+  the directory can't be used, in which case the limit is kept per process.
+  """
+
+  if shared_directory is None or fcntl is None:
+    return TokenBucket(interval, capacity)
+
+  # The key itself never ends up on disk
+  filename = f"{hashlib.sha256(key.encode()).hexdigest()[:32]}.bucket"
+  try:
+    return SharedTokenBucket(os.path.join(shared_directory, filename), interval, capacity)
+  except OSError:
+    return TokenBucket(interval, capacity)
@@ -0,0 +1,194 @@
+import os
+from time import time
+
+from .database import Database
+
+# Outcomes that are reused by later scans instead of looking the torrent up again. Torrents that weren't found
+# are looked up again once their `RecheckPolicy` says so.
+SETTLED_STATUSES = ("generated", "not_found", "skipped")
+
+# Keeps `IN (...)` queries under SQLite's limit on the number of parameters in a statement
+QUERY_BATCH_SIZE = 500
+
+DAY = 24 * 60 * 60
+
+
+class RecheckPolicy:
+  """
+  Decides when a torrent that wasn't found on the other tracker is worth looking up again.
+
+  The wait starts at `base_interval` and doubles after every check that comes up empty, up to `max_interval`.
+  Torrents created less than `recent_age` ago are the likeliest to be uploaded to the other tracker soon,
+  so they're rechecked every `base_interval` no matter how often they've been missed. All values are in seconds.
+  """
+
+  def __init__(self, base_interval: float = DAY, max_interval: float = 30 * DAY, recent_age: float = 30 * DAY):
+    self.base_interval = base_interval
+    self.max_interval = max_interval
+    self.recent_age = recent_age
+
+  def is_recent(self, state: dict, now: float) -> bool:
+    return state["added_at"] is not None and now - state["added_at"] < self.recent_age
+
+  def next_check_at(self, state: dict, now: float) -> float:
+    if self.is_recent(state, now):
+      return state["checked_at"] + self.base_interval
+
+    interval = self.base_interval * 2 ** max(state["attempts"] - 1, 0)
+    return state["checked_at"] + min(interval, self.max_interval)
+
+  def is_due(self, state: dict, now: float) -> bool:
+    return now >= self.next_check_at(state, now)
+
+  def priority(self, state: dict, now: float) -> tuple:
+    """
+    Returns a sort key that puts the torrents most likely to have been uploaded since their last check first:
+    recent torrents, then those missed the fewest times, then the newest.
+    """
+
+    return (not self.is_recent(state, now), state["attempts"], -(state["added_at"] or 0))
+
+
+class ScanState:
+  """
+  A persistent record of how each source torrent fared in previous scans, keyed by its infohash.
+
+  `status` is the name of the `Progress` counter the torrent's result was counted under and `message` is what was
+  printed for it. For generated torrents, the source flag of the new torrent and where it was saved are kept too.
+  `attempts` counts how many scans in a row ended with the same status and `added_at` is when the source torrent
+  was created, which `RecheckPolicy` uses to decide when torrents that weren't found get looked up again.
+  """
+
+  COLUMNS = ("status", "message", "source_flag", "output_path", "checked_at", "attempts", "added_at")
+
+  def __init__(self, database: Database, policy: RecheckPolicy | None = None):
+    self.policy = policy or RecheckPolicy()
+    self._db = database
+    self._db.execute(
+      """
+      CREATE TABLE IF NOT EXISTS scan_state (
+        infohash TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        message TEXT,
+        source_flag BLOB,
+        output_path TEXT,
+        checked_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        added_at REAL
+      )
+      """
+    )
+    self._db.execute(
+      """
+      CREATE TABLE IF NOT EXISTS scan_checkpoints (
+        directory TEXT PRIMARY KEY,
+        filepath TEXT NOT NULL,
+        updated_at REAL NOT NULL
+      )
+      """
+    )
+    self.__add_missing_columns()
+
+  def get(self, infohash: str) -> dict | None:
+    return self.get_many([infohash]).get(infohash)
+
+  def get_many(self, infohashes: list[str]) -> dict[str, dict]:
+    states = {}
+
+    for i in range(0, len(infohashes), QUERY_BATCH_SIZE):
+      batch = infohashes[i : i + QUERY_BATCH_SIZE]
+      placeholders = ", ".join("?" * len(batch))
+      rows = self._db.execute(
+        f"SELECT infohash, {', '.join(self.COLUMNS)} FROM scan_state WHERE infohash IN ({placeholders})",
+        batch,
+      )
+
+      for infohash, *values in rows:
+        states[infohash] = dict(zip(self.COLUMNS, values))
+
+    return states
+
+  def settled_result(self, infohash: str, recheck: bool = True) -> tuple[str, str] | None:
+    """
+    Returns the `(status, message)` to report for a torrent that a previous scan already settled, or `None` if it
+    needs to be scanned again. Generated torrents are only settled while their output file still exists and
+    torrents that weren't found stop being settled once they're due for a recheck, unless `recheck` is `False`.
+    """
+
+    state = self.get(infohash)
+    if not state or state["status"] not in SETTLED_STATUSES:
+      return None
+
+    if state["status"] == "generated":
+      if not state["output_path"] or not os.path.exists(state["output_path"]):
+        return None
+
+      return "already_exists", "Torrent was previously generated."
+
+    if state["status"] == "not_found" and recheck and self.policy.is_due(state, time()):
+      return None
+
+    return state["status"], state["message"]
+
+  def prioritized_rechecks(self, infohashes: list[str]) -> list[str]:
+    """
+    Returns those of `infohashes` that weren't found before and are due for a recheck, most promising first
+    (see `RecheckPolicy.priority`).
+    """
+
+    now = time()
+    due = [
+      (infohash, state)
+      for infohash, state in self.get_many(infohashes).items()
+      if state["status"] == "not_found" and self.policy.is_due(state, now)
+    ]
+
+    return [infohash for infohash, state in sorted(due, key=lambda item: self.policy.priority(item[1], now))]
+
+  def record(
+    self,
+    infohash: str,
+    status: str,
+    message: str,
+    source_flag: bytes | None = None,
+    output_path: str | None = None,
+    added_at: float | None = None,
+  ) -> None:
+    self._db.execute(
+      """
+      INSERT INTO scan_state (infohash, status, message, source_flag, output_path, checked_at, attempts, added_at)
+      VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+      ON CONFLICT (infohash) DO UPDATE SET
+        status = excluded.status,
+        message = excluded.message,
+        source_flag = excluded.source_flag,
+        output_path = excluded.output_path,
+        checked_at = excluded.checked_at,
+        attempts = CASE WHEN scan_state.status = excluded.status THEN scan_state.attempts + 1 ELSE 1 END,
+        added_at = COALESCE(excluded.added_at, scan_state.added_at)
+      """,
+      (infohash, status, message, source_flag, output_path, time(), added_at),
+    )
+
+  def checkpoint(self, directory: str) -> str | None:
+    """
+    Returns the last torrent an unfinished scan of `directory` got through, or `None` if the last scan finished.
+    """
+
+    rows = self._db.execute("SELECT filepath FROM scan_checkpoints WHERE directory = ?", (directory,))
+    return rows[0][0] if rows else None
+
+  def save_checkpoint(self, directory: str, filepath: str) -> None:
+    self._db.execute("INSERT OR REPLACE INTO scan_checkpoints VALUES (?, ?, ?)", (directory, filepath, time()))
+
+  def clear_checkpoint(self, directory: str) -> None:
+    self._db.execute("DELETE FROM scan_checkpoints WHERE directory = ?", (directory,))
+
+  def __add_missing_columns(self):
+    # Databases created before rechecks were scheduled don't have these columns yet
+    columns = {row[1] for row in self._db.execute("PRAGMA table_info(scan_state)")}
+
+    if "attempts" not in columns:
+      self._db.execute("ALTER TABLE scan_state ADD COLUMN attempts INTEGER NOT NULL DEFAULT 1")
+    if "added_at" not in columns:
+      self._db.execute("ALTER TABLE scan_state ADD COLUMN added_at REAL")
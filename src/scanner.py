@@ -1,18 +1,21 @@
+import asyncio
 import os
+import threading
+from bisect import bisect_right
 
 from .api import RedAPI, OpsAPI
-from .errors import (
-  TorrentDecodingError,
-  UnknownTrackerError,
-  TorrentNotFoundError,
-  TorrentAlreadyExistsError,
-  TorrentExistsInClientError,
-)
-from .filesystem import mkdir_p, list_files_of_extension, assert_path_exists
+from .async_api import AsyncGazelleAPI, AsyncInjection
+from .filesystem import mkdir_p, list_files_of_extension, scan_files_of_extension, assert_path_exists
+from .hash_cache import InfohashCache
+from .index import OUTPUT_DIRECTORY_DEPTH, OUTPUT_INDEX_RECONCILE_INTERVAL, OutputIndex, build_infohash_index
 from .injection import Injection
-from .parser import get_bencoded_data, calculate_infohash
+from .pipeline import UNSCANNED, ScanBudget, ScanPipeline
 from .progress import Progress
-from .torrent import generate_new_torrent_from_file
+from .scan_state import ScanState
+from .sharding import Shard
+from .source_flags import SourceFlagStats
+from .watcher import TorrentFileWatch
+from .torrent import generate_new_torrent_from_file, generate_new_torrent_from_file_async, load_source_torrent
 
 
 def scan_torrent_file(
@@ -21,6 +24,10 @@ def scan_torrent_file(
   red_api: RedAPI,
   ops_api: OpsAPI,
   injector: Injection | None,
+  workers: int = 1,
+  cache: InfohashCache | None = None,
+  output_infohashes: OutputIndex | None = None,
+  source_flag_stats: SourceFlagStats | None = None,
 ) -> str:
   """
   Scans a single .torrent file and generates a new one using the tracker API.
@@ -31,6 +38,11 @@ def scan_torrent_file(
     `red_api` (`RedAPI`): The pre-configured RED tracker API.
     `ops_api` (`OpsAPI`): The pre-configured OPS tracker API.
     `injector` (`Injection`): The pre-configured torrent Injection object.
+    `workers` (`int`, optional): The number of processes used to build the infohash index. Defaults to 1.
+    `cache` (`InfohashCache`, optional): A persistent cache of infohashes for files that haven't changed.
+    `output_infohashes` (`OutputIndex`, optional): A long-lived index of the output directory to use instead of
+      listing and indexing it for this one file.
+    `source_flag_stats` (`SourceFlagStats`, optional): Learned source flag hit rates that order the lookups.
   Returns:
     str: The path to the new .torrent file.
   Raises:
@@ -39,9 +51,11 @@ def scan_torrent_file(
   source_torrent_path = assert_path_exists(source_torrent_path)
   output_directory = mkdir_p(output_directory)
 
-  output_torrents = list_files_of_extension(output_directory, ".torrent")
-  output_infohashes = __collect_infohashes_from_files(output_torrents)
+  if output_infohashes is None:
+    output_torrents = scan_files_of_extension(output_directory, ".torrent", OUTPUT_DIRECTORY_DEPTH)
+    output_infohashes = build_infohash_index(output_torrents, workers, cache=cache)
 
+  source_torrent_meta = load_source_torrent(source_torrent_path, cache)
   new_tracker, new_torrent_filepath, _ = generate_new_torrent_from_file(
     source_torrent_path,
     output_directory,
@@ -49,6 +63,8 @@ def scan_torrent_file(
     ops_api,
     input_infohashes={},
     output_infohashes=output_infohashes,
+    source_torrent_meta=source_torrent_meta,
+    source_flag_stats=source_flag_stats,
   )
 
   if injector:
@@ -56,6 +72,52 @@ def scan_torrent_file(
       source_torrent_path,
       new_torrent_filepath,
       new_tracker.site_shortname(),
+      source_torrent_meta=source_torrent_meta,
+    )
+
+  return new_torrent_filepath
+
+
+async def scan_torrent_file_async(
+  source_torrent_path: str,
+  output_directory: str,
+  red_api: AsyncGazelleAPI,
+  ops_api: AsyncGazelleAPI,
+  injector: AsyncInjection | None,
+  cache: InfohashCache | None = None,
+  output_infohashes: OutputIndex | None = None,
+  source_flag_stats: SourceFlagStats | None = None,
+) -> str:
+  """
+  Like `scan_torrent_file`, but with async tracker APIs and injector (see `EventLoopThread`). Local work (loading
+  the torrent and indexing the output directory) runs in worker threads.
+  """
+
+  source_torrent_path = assert_path_exists(source_torrent_path)
+  output_directory = mkdir_p(output_directory)
+
+  if output_infohashes is None:
+    output_torrents = scan_files_of_extension(output_directory, ".torrent", OUTPUT_DIRECTORY_DEPTH)
+    output_infohashes = await asyncio.to_thread(build_infohash_index, output_torrents, cache=cache)
+
+  source_torrent_meta = await asyncio.to_thread(load_source_torrent, source_torrent_path, cache)
+  new_tracker, new_torrent_filepath, _ = await generate_new_torrent_from_file_async(
+    source_torrent_path,
+    output_directory,
+    red_api,
+    ops_api,
+    input_infohashes={},
+    output_infohashes=output_infohashes,
+    source_torrent_meta=source_torrent_meta,
+    source_flag_stats=source_flag_stats,
+  )
+
+  if injector:
+    await injector.inject_torrent(
+      source_torrent_path,
+      new_torrent_filepath,
+      new_tracker.site_shortname(),
+      source_torrent_meta=source_torrent_meta,
     )
 
   return new_torrent_filepath
@@ -67,6 +129,13 @@ def scan_torrent_directory(
   red_api: RedAPI,
   ops_api: OpsAPI,
   injector: Injection | None,
+  workers: int = 1,
+  cache: InfohashCache | None = None,
+  scan_state: ScanState | None = None,
+  recheck_budget: int | None = None,
+  budget: ScanBudget | None = None,
+  shard: Shard | None = None,
+  source_flag_stats: SourceFlagStats | None = None,
 ) -> str:
   """
   Scans a directory for .torrent files and generates new ones using the tracker APIs.
@@ -77,6 +146,16 @@ def scan_torrent_directory(
     `red_api` (`RedAPI`): The pre-configured RED tracker API.
     `ops_api` (`OpsAPI`): The pre-configured OPS tracker API.
     `injector` (`Injection`): The pre-configured torrent Injection object.
+    `workers` (`int`, optional): The number of processes used to build the infohash indexes and threads used to
+      load torrents ahead of the tracker lookups. Defaults to 1.
+    `cache` (`InfohashCache`, optional): A persistent cache of infohashes for files that haven't changed.
+    `scan_state` (`ScanState`, optional): Outcomes of previous scans. Torrents they settled aren't looked up again.
+    `recheck_budget` (`int`, optional): The most API calls to spend rechecking torrents that weren't found before.
+    `budget` (`ScanBudget`, optional): Limits on the scan's runtime and API calls. When the scan stops early or is
+      interrupted, the next scan with the same `scan_state` resumes from the last torrent it got through.
+    `shard` (`Shard`, optional): Only scans the torrents in this shard of the input directory. Torrents outside it
+      are still indexed, so copies of them are reported as already existing.
+    `source_flag_stats` (`SourceFlagStats`, optional): Learned source flag hit rates that order the lookups.
   Returns:
     str: A report of the scan.
   Raises:
@@ -86,76 +165,144 @@ def scan_torrent_directory(
   input_directory = assert_path_exists(input_directory)
   output_directory = mkdir_p(output_directory)
 
+  # The input paths are kept for the main loop below, but the output directory is only ever streamed into its index
   input_torrents = list_files_of_extension(input_directory, ".torrent")
-  output_torrents = list_files_of_extension(output_directory, ".torrent")
-  input_infohashes = __collect_infohashes_from_files(input_torrents)
-  output_infohashes = __collect_infohashes_from_files(output_torrents)
+  output_torrents = scan_files_of_extension(output_directory, ".torrent", OUTPUT_DIRECTORY_DEPTH)
+  # Every copy of a torrent is sharded and settled by its own infohash, so copies under different names are treated
+  # the same as the one the index kept
+  source_infohashes = {}
+  input_infohashes = build_infohash_index(input_torrents, workers, cache=cache, infohashes_by_path=source_infohashes)
+  output_infohashes = build_infohash_index(output_torrents, workers, cache=cache)
 
-  p = Progress(len(input_torrents))
+  if cache:
+    cache.forget_missing(input_directory)
+    cache.forget_missing(output_directory)
 
-  for i, source_torrent_path in enumerate(input_torrents, 1):
-    basename = os.path.basename(source_torrent_path)
-    print(f"({i}/{p.total}) {basename}")
+  if shard:
+    input_torrents = [
+      filepath for filepath in input_torrents if shard.contains(source_infohashes.get(filepath), filepath)
+    ]
 
-    try:
-      new_tracker, new_torrent_filepath, was_previously_generated = generate_new_torrent_from_file(
-        source_torrent_path,
-        output_directory,
-        red_api,
-        ops_api,
-        input_infohashes,
-        output_infohashes,
-      )
+  # Scanning in a stable order lets an interrupted scan resume where it left off, wrapping around to the
+  # torrents before that point (which are mostly settled by then and go quickly)
+  input_torrents.sort()
+  checkpoint_key = f"{input_directory} (shard {shard})" if shard else input_directory
+  checkpoint = scan_state.checkpoint(checkpoint_key) if scan_state else None
+  if checkpoint:
+    resume_at = bisect_right(input_torrents, checkpoint)
+    input_torrents = input_torrents[resume_at:] + input_torrents[:resume_at]
+    print(f"Resuming the previous scan after {os.path.basename(checkpoint)}")
 
-      if injector:
-        injector.inject_torrent(
-          source_torrent_path,
-          new_torrent_filepath,
-          new_tracker.site_shortname(),
-        )
-
-      if was_previously_generated:
-        if injector:
-          p.already_exists.print("Torrent was previously generated but was injected into your torrent client.")
-        else:
-          p.already_exists.print("Torrent was previously generated.")
-      else:
-        p.generated.print(
-          f"Torrent can be cross-seeded to {new_tracker.site_shortname()}; successfully generated as '{new_torrent_filepath}'."
-        )
-    except TorrentDecodingError as e:
-      p.error.print(str(e))
-      continue
-    except UnknownTrackerError as e:
-      p.skipped.print(str(e))
-      continue
-    except TorrentAlreadyExistsError as e:
-      p.already_exists.print(str(e))
-      continue
-    except TorrentExistsInClientError as e:
-      p.already_exists.print(str(e))
-      continue
-    except TorrentNotFoundError as e:
-      p.not_found.print(str(e))
-      continue
-    except Exception as e:
-      p.error.print(str(e))
+  p = Progress(len(input_torrents))
+  pipeline = ScanPipeline(
+    output_directory,
+    red_api,
+    ops_api,
+    injector,
+    input_infohashes,
+    output_infohashes,
+    cache=cache,
+    workers=workers,
+    scan_state=scan_state,
+    recheck_budget=recheck_budget,
+    budget=budget,
+    source_flag_stats=source_flag_stats,
+    source_infohashes=source_infohashes,
+  )
+
+  scanned = 0
+  for job in pipeline.run(input_torrents):
+    # Jobs come back in order, so after the first unscanned one the checkpoint has to stay put
+    if job.status == UNSCANNED or scanned < job.index:
       continue
 
+    scanned += 1
+    basename = os.path.basename(job.filepath)
+    print(f"({scanned}/{p.total}) {basename}")
+    getattr(p, job.status).print(job.message)
+
+    if scan_state and not job.from_scan_state:
+      scan_state.save_checkpoint(checkpoint_key, job.filepath)
+
+  if scanned < p.total:
+    print(f"Stopped after {scanned} of {p.total} torrents because the scan budget ran out; the next scan resumes here.")
+  elif scan_state:
+    scan_state.clear_checkpoint(checkpoint_key)
+
   return p.report()
 
 
-def __collect_infohashes_from_files(files: list[str]) -> dict:
-  infohash_dict = {}
+def watch_torrent_directory(
+  input_directory: str,
+  output_directory: str,
+  red_api: RedAPI,
+  ops_api: OpsAPI,
+  injector: Injection | None,
+  workers: int = 1,
+  cache: InfohashCache | None = None,
+  scan_state: ScanState | None = None,
+  file_watch: TorrentFileWatch | None = None,
+  stop_event: threading.Event | None = None,
+  source_flag_stats: SourceFlagStats | None = None,
+) -> None:
+  """
+  Watches a directory for new .torrent files and generates new ones for them as they arrive. Only files created or
+  moved into the directory after watching starts are scanned; run `scan_torrent_directory` first to catch up.
+
+  Args:
+    `input_directory` (`str`): The directory to watch for .torrent files.
+    `output_directory` (`str`): The directory to save the new .torrent files.
+    `red_api` (`RedAPI`): The pre-configured RED tracker API.
+    `ops_api` (`OpsAPI`): The pre-configured OPS tracker API.
+    `injector` (`Injection`): The pre-configured torrent Injection object.
+    `workers` (`int`, optional): The number of processes used to build the infohash indexes. Defaults to 1.
+    `cache` (`InfohashCache`, optional): A persistent cache of infohashes for files that haven't changed.
+    `scan_state` (`ScanState`, optional): Outcomes of previous scans, which new outcomes are recorded in.
+    `file_watch` (`TorrentFileWatch`, optional): Where new files come from. Defaults to watching `input_directory`.
+    `stop_event` (`threading.Event`, optional): Watching stops once this is set. Defaults to watching forever.
+    `source_flag_stats` (`SourceFlagStats`, optional): Learned source flag hit rates that order the lookups.
+  Raises:
+    `FileNotFoundError`: if the input directory does not exist.
+  """
+
+  input_directory = assert_path_exists(input_directory)
+  output_directory = mkdir_p(output_directory)
+  stop_event = stop_event or threading.Event()
+  file_watch = file_watch or TorrentFileWatch(input_directory)
+
+  input_infohashes = build_infohash_index(list_files_of_extension(input_directory, ".torrent"), workers, cache=cache)
+  output_infohashes = OutputIndex(output_directory, workers, cache)
+  output_infohashes.start_reconciling(OUTPUT_INDEX_RECONCILE_INTERVAL)
 
-  for filepath in files:
-    try:
-      torrent_data = get_bencoded_data(filepath)
+  print(f"Watching {input_directory} for new .torrent files...")
 
-      if torrent_data:
-        infohash = calculate_infohash(torrent_data)
-        infohash_dict[infohash] = filepath
-    except Exception:
-      continue
+  try:
+    while not stop_event.is_set():
+      new_torrents = file_watch.ready_files()
+      if not new_torrents:
+        continue
+
+      p = Progress(len(new_torrents))
+      pipeline = ScanPipeline(
+        output_directory,
+        red_api,
+        ops_api,
+        injector,
+        input_infohashes,
+        output_infohashes,
+        cache=cache,
+        workers=workers,
+        scan_state=scan_state,
+        source_flag_stats=source_flag_stats,
+      )
+
+      for job in pipeline.run(new_torrents):
+        print(os.path.basename(job.filepath))
+        getattr(p, job.status).print(job.message)
 
-  return infohash_dict
+        # Later arrivals that are just another copy of this torrent get reported as already existing
+        if job.source_infohash:
+          input_infohashes[job.source_infohash] = job.filepath
+  finally:
+    output_infohashes.stop_reconciling()
+    file_watch.close()
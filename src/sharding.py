@@ -0,0 +1,48 @@
+import os
+import zlib
+
+
+class Shard:
+  """
+  One of `count` disjoint slices of a directory scan, numbered from 1. Several fertilizer processes (possibly on
+  different hosts looking at the same files) can each scan one shard and together they cover every torrent exactly
+  once. Torrents are assigned by their infohash, so every process agrees on the split without coordinating.
+  """
+
+  def __init__(self, number: int, count: int):
+    if count < 1 or not 1 <= number <= count:
+      raise ValueError(f"Invalid shard {number}/{count}: must be between 1/{count} and {count}/{count}")
+
+    self.number = number
+    self.count = count
+
+  @classmethod
+  def parse(cls, value: str) -> "Shard":
+    """
+    Parses a shard written as `i/N`, e.g. `2/3` for the second of three shards.
+
+    Raises:
+      `ValueError`: if `value` isn't a valid shard.
+    """
+
+    number, separator, count = value.partition("/")
+    if not separator or not number.strip().isdigit() or not count.strip().isdigit():
+      raise ValueError(f"Invalid shard '{value}': must look like 1/3")
+
+    return cls(int(number), int(count))
+
+  def contains(self, infohash: str | None, filepath: str) -> bool:
+    """
+    Returns whether the torrent at `filepath` with the given uppercase hex `infohash` belongs to this shard.
+    Torrents without an infohash (e.g. ones that can't be decoded) are assigned by their filename instead.
+    """
+
+    if infohash:
+      key = int(infohash[:16], 16)
+    else:
+      key = zlib.crc32(os.path.basename(filepath).encode())
+
+    return key % self.count == self.number - 1
+
+  def __str__(self) -> str:
+    return f"{self.number}/{self.count}"
@@ -0,0 +1,90 @@
+import threading
+from datetime import datetime, timezone
+from typing import Type
+
+from .database import Database
+from .trackers import RedTracker, OpsTracker
+
+# The era of torrents whose creation date isn't known
+UNKNOWN_ERA = "unknown"
+
+
+class SourceFlagStats:
+  """
+  Learns which source flag torrents are found under on each tracker, so lookups can try the likeliest one first
+  instead of always going through `source_flags_for_creation()` in the same order. A torrent that isn't found
+  still costs a lookup per flag, but one that is found costs fewer the better the order is.
+
+  Hits are counted per tracker and per era (the year the source torrent was created), since which flag matches
+  depends a lot on when a torrent was uploaded: RED was PTH and OPS was APL until they were renamed. Flags are
+  tried in order of their hits in the torrent's era, then their hits in all eras, then the tracker's default order.
+  """
+
+  def __init__(self, database: Database):
+    self._db = database
+    self._db.execute(
+      """
+      CREATE TABLE IF NOT EXISTS source_flag_hits (
+        tracker TEXT NOT NULL,
+        era TEXT NOT NULL,
+        source_flag BLOB NOT NULL,
+        hits INTEGER NOT NULL,
+        PRIMARY KEY (tracker, era, source_flag)
+      )
+      """
+    )
+    self._lock = threading.Lock()
+    # The table stays tiny (a few flags per tracker per year), so it's kept in memory and only written through
+    self._hits = {}
+    for tracker, era, source_flag, hits in self._db.execute("SELECT * FROM source_flag_hits"):
+      self._hits[(tracker, era, bytes(source_flag))] = hits
+
+  def order(self, new_tracker: Type[RedTracker] | Type[OpsTracker], created_at: float | None) -> list[bytes]:
+    """
+    Returns `new_tracker`'s source flags in the order they should be tried for a torrent created at `created_at`.
+    """
+
+    tracker = new_tracker.site_shortname()
+    era = self.era(created_at)
+    source_flags = new_tracker.source_flags_for_creation()
+
+    with self._lock:
+      era_hits = {flag: self._hits.get((tracker, era, flag), 0) for flag in source_flags}
+      total_hits = {flag: self.__hits_in_all_eras(tracker, flag) for flag in source_flags}
+
+    # `sorted` is stable, so flags without any hits keep the tracker's default order
+    return sorted(source_flags, key=lambda flag: (-era_hits[flag], -total_hits[flag]))
+
+  def record_hit(
+    self,
+    new_tracker: Type[RedTracker] | Type[OpsTracker],
+    created_at: float | None,
+    source_flag: bytes,
+  ) -> None:
+    key = (new_tracker.site_shortname(), self.era(created_at), source_flag)
+
+    with self._lock:
+      self._hits[key] = self._hits.get(key, 0) + 1
+
+    self._db.execute(
+      """
+      INSERT INTO source_flag_hits VALUES (?, ?, ?, 1)
+      ON CONFLICT (tracker, era, source_flag) DO UPDATE SET hits = hits + 1
+      """,
+      key,
+    )
+
+  @staticmethod
+  def era(created_at: float | None) -> str:
+    if created_at is None:
+      return UNKNOWN_ERA
+
+    try:
+      return str(datetime.fromtimestamp(created_at, timezone.utc).year)
+    except (OverflowError, OSError, ValueError):
+      return UNKNOWN_ERA
+
+  def __hits_in_all_eras(self, tracker: str, source_flag: bytes) -> int:
+    return sum(
+      hits for (hit_tracker, _, flag), hits in self._hits.items() if (hit_tracker, flag) == (tracker, source_flag)
+    )
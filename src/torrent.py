@@ -1,19 +1,45 @@
-import copy
+import asyncio
 import os
+from functools import partial
 from html import unescape
 
 from .api import RedAPI, OpsAPI
+from .async_api import AsyncGazelleAPI
 from .errors import TorrentDecodingError, UnknownTrackerError, TorrentNotFoundError, TorrentAlreadyExistsError
 from .filesystem import replace_extension
-from .parser import (
-  get_bencoded_data,
-  get_origin_tracker,
-  recalculate_hash_for_new_source,
-  save_bencoded_data,
-)
+from .hash_cache import InfohashCache
+from .metadata import TorrentMeta, load_torrent_meta
+from .parser import save_spliced_data, sniff_origin_tracker, splice_torrent
+from .source_flags import SourceFlagStats
 from .trackers import RedTracker, OpsTracker
 
 
+def load_source_torrent(source_torrent_path: str, cache: InfohashCache | None = None) -> TorrentMeta:
+  """
+  Loads a torrent file that is to be cross-seeded, along with the infohashes of its variants for the reciprocal
+  tracker. If a `cache` is given, those are taken from it when the file hasn't changed and are stored in it otherwise.
+
+  Raises:
+    `TorrentDecodingError`: if the torrent file could not be decoded.
+    `UnknownTrackerError`: if the torrent file is not from OPS or RED.
+  """
+
+  # Most torrents in a shared directory come from other trackers, so unless a qBittorrent fastresume file
+  # could say otherwise (see `load_torrent_meta`), rule those out from a partial read before paying for a full one.
+  has_fastresume = os.path.exists(replace_extension(source_torrent_path, ".fastresume"))
+  if not has_fastresume and __is_from_unknown_tracker(source_torrent_path):
+    raise UnknownTrackerError("Torrent not from OPS or RED based on source or announce URL")
+
+  source_torrent_meta = load_torrent_meta(source_torrent_path)
+  if not source_torrent_meta.origin_tracker:
+    raise UnknownTrackerError("Torrent not from OPS or RED based on source or announce URL")
+
+  if cache:
+    __load_variant_hashes_with_cache(source_torrent_meta, cache)
+
+  return source_torrent_meta
+
+
 def generate_new_torrent_from_file(
   source_torrent_path: str,
   output_directory: str,
@@ -21,6 +47,8 @@ def generate_new_torrent_from_file(
   ops_api: OpsAPI,
   input_infohashes=None,
   output_infohashes=None,
+  source_torrent_meta: TorrentMeta | None = None,
+  source_flag_stats: SourceFlagStats | None = None,
 ) -> tuple[OpsTracker | RedTracker, str, bool]:
   """
   Generates a new torrent file for the reciprocal tracker of the original torrent file if it exists on the reciprocal tracker.
@@ -31,7 +59,9 @@ def generate_new_torrent_from_file(
     `red_api` (`RedApi`): The pre-configured API object for RED.
     `ops_api` (`OpsApi`): The pre-configured API object for OPS.
     `input_infohashes` (`dict`, optional): A dictionary of infohashes and their filenames from the input directory for caching purposes. Defaults to an empty dictionary.
-    `output_infohashes` (`dict`, optional): A dictionary of infohashes and their filenames from the output directory for caching purposes. Defaults to an empty dictionary.
+    `output_infohashes` (`dict`, optional): A dictionary of infohashes and their filenames from the output directory for caching purposes. Defaults to an empty dictionary. Torrents found or written in the output directory are added to it.
+    `source_torrent_meta` (`TorrentMeta`, optional): The already loaded original torrent (see `load_source_torrent`). Loaded from `source_torrent_path` if not given.
+    `source_flag_stats` (`SourceFlagStats`, optional): Which source flags earlier lookups found torrents under. The likeliest flags are tried first and hits are recorded in it. Defaults to the tracker's fixed order.
   Returns:
     A tuple containing the new tracker class (`RedTracker` or `OpsTracker`), the path to the new torrent file, and a boolean
     representing whether the torrent already existed (False: created just now, True: torrent file already existed).
@@ -43,17 +73,108 @@ def generate_new_torrent_from_file(
     `Exception`: if an unknown error occurs.
   """
 
+  steps = __generation_steps(
+    source_torrent_path,
+    output_directory,
+    red_api,
+    ops_api,
+    input_infohashes,
+    output_infohashes,
+    source_torrent_meta,
+    source_flag_stats,
+  )
+
+  try:
+    step = next(steps)
+    while True:
+      if callable(step):
+        result = step()
+      else:
+        new_tracker_api, new_hash = step
+        result = new_tracker_api.find_torrent(new_hash)
+
+      step = steps.send(result)
+  except StopIteration as result:
+    return result.value
+
+
+async def generate_new_torrent_from_file_async(
+  source_torrent_path: str,
+  output_directory: str,
+  red_api: AsyncGazelleAPI,
+  ops_api: AsyncGazelleAPI,
+  input_infohashes=None,
+  output_infohashes=None,
+  source_torrent_meta: TorrentMeta | None = None,
+  source_flag_stats: SourceFlagStats | None = None,
+) -> tuple[OpsTracker | RedTracker, str, bool]:
+  """
+  Like `generate_new_torrent_from_file`, but makes its API calls through `AsyncGazelleAPI`s without blocking the
+  event loop. Everything else that may block (loading the original torrent if `source_torrent_meta` isn't given,
+  hashing its variants, recording source flag hits and writing the new torrent) runs in worker threads.
+  """
+
+  if source_torrent_meta is None:
+    source_torrent_meta = await asyncio.to_thread(load_source_torrent, source_torrent_path)
+
+  steps = __generation_steps(
+    source_torrent_path,
+    output_directory,
+    red_api,
+    ops_api,
+    input_infohashes,
+    output_infohashes,
+    source_torrent_meta,
+    source_flag_stats,
+  )
+
+  try:
+    step = next(steps)
+    while True:
+      if callable(step):
+        result = await asyncio.to_thread(step)
+      else:
+        new_tracker_api, new_hash = step
+        # Needed for the new torrent if this lookup finds it, and only ever fetched once
+        await new_tracker_api.load_announce_url()
+        result = await new_tracker_api.find_torrent(new_hash)
+
+      step = steps.send(result)
+  except StopIteration as result:
+    return result.value
+
+
+def __generation_steps(
+  source_torrent_path,
+  output_directory,
+  red_api,
+  ops_api,
+  input_infohashes,
+  output_infohashes,
+  source_torrent_meta,
+  source_flag_stats,
+):
+  # The steps of generating a new torrent, minus the API calls and blocking local work, so the same steps can be
+  # driven with or without blocking. Yields each `(api, infohash)` to look up and expects the API response to be sent
+  # back, and yields functions that touch the disk or database (or hash) and expects what they return to be sent back.
+  # Returns (through `StopIteration`) what `generate_new_torrent_from_file` does.
   if output_infohashes is None:
     output_infohashes = {}
   if input_infohashes is None:
     input_infohashes = {}
-  source_torrent_data, source_tracker = __get_bencoded_data_and_tracker(source_torrent_path)
-  new_torrent_data = copy.deepcopy(source_torrent_data)
-  new_tracker = source_tracker.reciprocal_tracker()
+  if source_torrent_meta is None:
+    source_torrent_meta = load_source_torrent(source_torrent_path)
+
+  new_tracker = source_torrent_meta.origin_tracker.reciprocal_tracker()
   new_tracker_api = __get_new_tracker_api(new_tracker, red_api, ops_api)
   stored_api_response = None
 
-  all_possible_hashes = __calculate_all_possible_hashes(source_torrent_data, new_tracker.source_flags_for_creation())
+  if source_flag_stats:
+    new_sources = source_flag_stats.order(new_tracker, source_torrent_meta.creation_date)
+  else:
+    new_sources = new_tracker.source_flags_for_creation()
+  # Only hashes when the variants weren't taken from the cache (e.g. with --no-cache)
+  all_possible_hashes = yield partial(source_torrent_meta.infohashes_for_sources, new_sources)
   found_input_hash = __check_matching_hashes(all_possible_hashes, input_infohashes)
   found_output_hash = __check_matching_hashes(all_possible_hashes, output_infohashes)
 
@@ -64,9 +185,8 @@ def generate_new_torrent_from_file(
   if found_output_hash:
     return new_tracker, output_infohashes[found_output_hash], True
 
-  for new_source in new_tracker.source_flags_for_creation():
-    new_hash = recalculate_hash_for_new_source(source_torrent_data, new_source)
-    stored_api_response = new_tracker_api.find_torrent(new_hash)
+  for new_source, new_hash in zip(new_sources, all_possible_hashes):
+    stored_api_response = yield new_tracker_api, new_hash
 
     if stored_api_response["status"] == "success":
       new_torrent_filepath = __generate_torrent_output_filepath(
@@ -76,18 +196,20 @@ def generate_new_torrent_from_file(
         output_directory,
       )
 
-      if os.path.exists(new_torrent_filepath):
-        return new_tracker, new_torrent_filepath, True
-
-      if new_torrent_filepath:
-        torrent_id = __get_torrent_id(stored_api_response)
-
-        new_torrent_data[b"info"][b"source"] = new_source  # This is already bytes rather than str
-        new_torrent_data[b"announce"] = new_tracker_api.announce_url.encode()
-        new_torrent_data[b"comment"] = __generate_torrent_url(new_tracker_api.site_url, torrent_id).encode()
-        save_bencoded_data(new_torrent_filepath, new_torrent_data)
+      previously_generated = yield partial(
+        __write_new_torrent,
+        new_torrent_filepath,
+        source_torrent_meta,
+        new_tracker,
+        new_tracker_api,
+        new_source,
+        __get_torrent_id(stored_api_response),
+        source_flag_stats,
+      )
+      # Keeps long-lived indexes (see `OutputIndex`) current without re-listing the output directory
+      output_infohashes[new_hash] = new_torrent_filepath
 
-        return new_tracker, new_torrent_filepath, False
+      return new_tracker, new_torrent_filepath, previously_generated
 
   if stored_api_response["error"] in ("bad hash parameter", "bad parameters"):
     raise TorrentNotFoundError(f"Torrent could not be found on {new_tracker.site_shortname()}")
@@ -95,8 +217,33 @@ def generate_new_torrent_from_file(
   raise Exception(f"An unknown error occurred in the API response from {new_tracker.site_shortname()}")
 
 
-def __calculate_all_possible_hashes(source_torrent_data: dict, sources: list[str]) -> list[str]:
-  return [recalculate_hash_for_new_source(source_torrent_data, source) for source in sources]
+def __write_new_torrent(
+  new_torrent_filepath: str,
+  source_torrent_meta: TorrentMeta,
+  new_tracker: OpsTracker | RedTracker,
+  new_tracker_api,
+  new_source: bytes,
+  torrent_id: str,
+  source_flag_stats: SourceFlagStats | None,
+) -> bool:
+  # Returns whether the new torrent was already there, in which case it's left as it is
+  if source_flag_stats:
+    source_flag_stats.record_hit(new_tracker, source_torrent_meta.creation_date, new_source)
+
+  if os.path.exists(new_torrent_filepath):
+    return True
+
+  new_torrent_segments = splice_torrent(
+    source_torrent_meta.buffer,
+    {
+      b"announce": new_tracker_api.announce_url.encode(),
+      b"comment": __generate_torrent_url(new_tracker_api.site_url, torrent_id).encode(),
+    },
+    {b"source": new_source},  # This is already bytes rather than str
+  )
+  save_spliced_data(new_torrent_filepath, new_torrent_segments)
+
+  return False
 
 
 def __check_matching_hashes(all_possible_hashes: list[str], infohashes: dict) -> str | None:
@@ -131,28 +278,24 @@ def __generate_torrent_url(site_url: str, torrent_id: str) -> str:
   return f"{site_url}/torrents.php?torrentid={torrent_id}"
 
 
-def __get_bencoded_data_and_tracker(torrent_path):
-  # The fastresume stuff is to support qBittorrent since it doesn't store
-  # announce URLs in the torrent file IFF we're taking the file from `BT_backup`.
-  #
-  # qbit stores that information in a sidecar file that has the exact same name
-  # as the torrent file but with a `.fastresume` extension instead. It's also stored
-  # in a list of lists called `trackers` in this `.fastresume` file instead of `announce`.
-  fastresume_path = replace_extension(torrent_path, ".fastresume")
-  source_torrent_data = get_bencoded_data(torrent_path)
-  fastresume_data = get_bencoded_data(fastresume_path)
+def __load_variant_hashes_with_cache(source_torrent_meta: TorrentMeta, cache: InfohashCache):
+  new_sources = source_torrent_meta.origin_tracker.reciprocal_tracker().source_flags_for_creation()
+  cached = cache.get(source_torrent_meta.filepath)
 
-  if not source_torrent_data or not source_torrent_data.get(b"info"):
-    raise TorrentDecodingError("Error decoding torrent file")
+  if cached and cached[0] == source_torrent_meta.infohash:
+    source_torrent_meta.variant_hashes.update(cached[1])
 
-  torrent_tracker = get_origin_tracker(source_torrent_data)
-  fastresume_tracker = get_origin_tracker(fastresume_data) if fastresume_data else None
-  source_tracker = torrent_tracker or fastresume_tracker
+  if any(new_source not in source_torrent_meta.variant_hashes for new_source in new_sources):
+    source_torrent_meta.infohashes_for_sources(new_sources)
+    cache.put(source_torrent_meta.filepath, source_torrent_meta.infohash, source_torrent_meta.variant_hashes)
 
-  if not source_tracker:
-    raise UnknownTrackerError("Torrent not from OPS or RED based on source or announce URL")
 
-  return source_torrent_data, source_tracker
+def __is_from_unknown_tracker(torrent_path) -> bool:
+  try:
+    return sniff_origin_tracker(torrent_path) is None
+  except (TorrentDecodingError, OSError):
+    # The partial read wasn't enough to tell, so leave it to the full parse
+    return False
 
 
 def __get_new_tracker_api(new_tracker, red_api, ops_api):
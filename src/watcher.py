@@ -0,0 +1,203 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from time import monotonic, sleep
+
+from .filesystem import replace_extension, scan_files_of_extension
+
+# How long a file has to go without changing before it's considered completely written
+DEBOUNCE_SECONDS = 2.0
+
+# How often `PollingWatcher` lists the directory
+POLL_INTERVAL = 5.0
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+WATCHED_EXTENSIONS = (".torrent", ".fastresume")
+
+
+class InotifyWatcher:
+  """
+  Reports files created in, written to or moved into a directory using Linux's inotify, so waiting for changes
+  costs nothing while there aren't any.
+
+  Raises:
+    `OSError`: if inotify isn't available on this system.
+  """
+
+  def __init__(self, directory: str):
+    libc_name = ctypes.util.find_library("c")
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+
+    if not hasattr(libc, "inotify_init1"):
+      raise OSError("inotify is not available on this system")
+
+    self.directory = directory
+    self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), "Could not initialize inotify")
+
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+      errno = ctypes.get_errno()
+      os.close(self._fd)
+      raise OSError(errno, f"Could not watch {directory}")
+
+  def poll(self, timeout: float) -> list[str] | None:
+    """
+    Waits up to `timeout` seconds and returns the paths of the files that changed. Returns `None` if events were
+    lost because the kernel's queue overflowed, in which case the caller should list the directory instead.
+    """
+
+    readable, _, _ = select.select([self._fd], [], [], timeout)
+    if not readable:
+      return []
+
+    try:
+      data = os.read(self._fd, 64 * 1024)
+    except BlockingIOError:
+      return []
+
+    paths = []
+    pos = 0
+    while pos < len(data):
+      _wd, mask, _cookie, name_length = INOTIFY_EVENT.unpack_from(data, pos)
+      name = data[pos + INOTIFY_EVENT.size : pos + INOTIFY_EVENT.size + name_length].rstrip(b"\0")
+      pos += INOTIFY_EVENT.size + name_length
+
+      if mask & IN_Q_OVERFLOW:
+        return None
+      if name:
+        paths.append(os.path.join(self.directory, os.fsdecode(name)))
+
+    return paths
+
+  def close(self) -> None:
+    os.close(self._fd)
+
+
+class PollingWatcher:
+  """
+  Reports new and changed files by listing a directory every `interval` seconds. Used where inotify isn't available.
+  """
+
+  def __init__(self, directory: str, interval: float = POLL_INTERVAL):
+    self.directory = directory
+    self.interval = interval
+    self._snapshot = self.__take_snapshot()
+    self._snapshot_at = monotonic()
+
+  def poll(self, timeout: float) -> list[str] | None:
+    # Callers may poll more often than `interval`, but the directory is only listed once it has passed
+    wait = max(self._snapshot_at + self.interval - monotonic(), 0)
+    if wait > timeout:
+      sleep(timeout)
+      return []
+
+    sleep(wait)
+
+    snapshot = self.__take_snapshot()
+    changed = [path for path, key in snapshot.items() if self._snapshot.get(path) != key]
+    self._snapshot = snapshot
+    self._snapshot_at = monotonic()
+
+    return changed
+
+  def close(self) -> None:
+    pass
+
+  def __take_snapshot(self) -> dict[str, tuple[int, int]]:
+    snapshot = {}
+
+    for extension in WATCHED_EXTENSIONS:
+      for entry in scan_files_of_extension(self.directory, extension):
+        try:
+          stat = entry.stat()
+        except OSError:
+          continue
+
+        snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+    return snapshot
+
+
+def create_watcher(directory: str) -> InotifyWatcher | PollingWatcher:
+  try:
+    return InotifyWatcher(directory)
+  except (OSError, AttributeError):
+    return PollingWatcher(directory)
+
+
+class TorrentFileWatch:
+  """
+  Watches a directory for new .torrent files and hands each one out once it has stopped changing for `debounce`
+  seconds, so files that are still being written aren't read. A changed .fastresume file counts as a change to
+  the .torrent file next to it, since qBittorrent writes the two separately.
+
+  Each .torrent file is handed out at most once, and those already in the directory when watching starts never
+  are, so clients rewriting resume data for the torrents they have don't queue them again.
+  """
+
+  def __init__(self, directory: str, debounce: float = DEBOUNCE_SECONDS, watcher=None):
+    self.directory = directory
+    self.debounce = debounce
+    self.watcher = watcher or create_watcher(directory)
+    # Torrent paths waiting to settle, along with when they last changed and their size at that point
+    self._pending = {}
+    # Torrent paths that were already there or have been handed out
+    self._seen = {entry.path for entry in scan_files_of_extension(directory, ".torrent")}
+
+  def ready_files(self, timeout: float = 1.0) -> list[str]:
+    """
+    Waits up to `timeout` seconds for changes and returns the .torrent files that have finished changing.
+    """
+
+    changed = self.watcher.poll(timeout)
+    if changed is None:
+      changed = [entry.path for entry in scan_files_of_extension(self.directory, ".torrent")]
+
+    now = monotonic()
+    for path in changed:
+      if path.endswith(".fastresume"):
+        path = replace_extension(path, ".torrent")
+
+      if path.endswith(".torrent") and path not in self._seen:
+        self._pending[path] = (now, self.__size(path))
+
+    ready = []
+    for path, (changed_at, size) in list(self._pending.items()):
+      if now - changed_at < self.debounce:
+        continue
+
+      current_size = self.__size(path)
+      if current_size is None:
+        # The file was removed again, or only its .fastresume file exists so far
+        if now - changed_at >= self.debounce * 10:
+          del self._pending[path]
+      elif current_size != size:
+        self._pending[path] = (now, current_size)
+      else:
+        del self._pending[path]
+        self._seen.add(path)
+        ready.append(path)
+
+    return ready
+
+  def close(self) -> None:
+    self.watcher.close()
+
+  @staticmethod
+  def __size(path: str) -> int | None:
+    try:
+      return os.path.getsize(path)
+    except OSError:
+      return None
@@ -3,9 +3,12 @@ import os
 
 from flask import Flask, request
 
-from src.errors import TorrentAlreadyExistsError, TorrentNotFoundError
+from src.async_api import AsyncGazelleAPI, AsyncInjection, EventLoopThread
+from src.errors import TorrentAlreadyExistsError, TorrentNotFoundError, TrackerUnavailableError
+from src.filesystem import mkdir_p
+from src.index import OUTPUT_INDEX_RECONCILE_INTERVAL, OutputIndex
 from src.parser import is_valid_infohash
-from src.scanner import scan_torrent_file
+from src.scanner import scan_torrent_file_async
 
 app = Flask(__name__)
 
@@ -37,12 +40,18 @@ def webhook():
     return http_error(f"No torrent found at {filepath}", 404)
 
   try:
-    new_filepath = scan_torrent_file(
-      filepath,
-      config["output_dir"],
-      config["red_api"],
-      config["ops_api"],
-      config["injector"],
+    # Every request's lookups share one event loop, so waiting on rate limits and retries doesn't tie up threads
+    new_filepath = config["runtime"].run(
+      scan_torrent_file_async(
+        filepath,
+        config["output_dir"],
+        config["red_api"],
+        config["ops_api"],
+        config["injector"],
+        cache=config.get("cache"),
+        output_infohashes=config.get("output_index"),
+        source_flag_stats=config.get("source_flag_stats"),
+      )
     )
 
     return http_success(new_filepath, 201)
@@ -50,6 +59,8 @@ def webhook():
     return http_error(str(e), 409)
   except TorrentNotFoundError as e:
     return http_error(str(e), 404)
+  except TrackerUnavailableError as e:
+    return http_error(str(e), 503)
   except Exception as e:
     return http_error(str(e), 500)
 
@@ -67,16 +78,39 @@ def http_error(message, code):
   return {"status": "error", "message": message}, code
 
 
-def run_webserver(input_dir, output_dir, red_api, ops_api, injector, host="0.0.0.0", port=9713):
+def run_webserver(
+  input_dir,
+  output_dir,
+  red_api,
+  ops_api,
+  injector,
+  host="0.0.0.0",
+  port=9713,
+  cache=None,
+  workers=1,
+  source_flag_stats=None,
+):
   app.logger.setLevel(logging.INFO)
+
+  output_index = OutputIndex(mkdir_p(output_dir), workers, cache)
+  output_index.start_reconciling(OUTPUT_INDEX_RECONCILE_INTERVAL)
+  runtime = EventLoopThread()
+
   app.config.update(
     {
       "input_dir": input_dir,
       "output_dir": output_dir,
-      "red_api": red_api,
-      "ops_api": ops_api,
-      "injector": injector,
+      "runtime": runtime,
+      "red_api": AsyncGazelleAPI(red_api, runtime.max_connections),
+      "ops_api": AsyncGazelleAPI(ops_api, runtime.max_connections),
+      "injector": AsyncInjection(injector) if injector else None,
+      "cache": cache,
+      "output_index": output_index,
+      "source_flag_stats": source_flag_stats,
     }
   )
 
-  app.run(debug=False, host=host, port=port)
+  try:
+    app.run(debug=False, host=host, port=port)
+  finally:
+    runtime.close()
@@ -3,6 +3,7 @@ import requests_mock
 
 from src.config import Config
 from src.api import RedAPI, OpsAPI
+from src.circuit_breaker import CircuitBreaker
 
 
 @pytest.fixture
@@ -18,14 +19,14 @@ def mock_config():
 @pytest.fixture
 def red_api():
   instance = RedAPI("redsecret", delay_in_seconds=0)
-  instance._max_retries = 1
+  instance.circuit_breaker = CircuitBreaker(failure_threshold=1)
   return instance
 
 
 @pytest.fixture
 def ops_api():
   instance = OpsAPI("opssecret", delay_in_seconds=0)
-  instance._max_retries = 1
+  instance.circuit_breaker = CircuitBreaker(failure_threshold=1)
   return instance
 
 
@@ -1,5 +1,8 @@
 import os
 import shutil
+from hashlib import sha1
+
+import bencoder
 
 
 def get_support_file_path(name):
@@ -10,6 +13,15 @@ def get_torrent_path(name):
   return get_support_file_path(f"{name}.torrent")
 
 
+def decode_torrent_file(filepath):
+  with open(filepath, "rb") as f:
+    return bencoder.decode(f.read())
+
+
+def reencoded_infohash(torrent_data):
+  return sha1(bencoder.encode(torrent_data[b"info"])).hexdigest().upper()
+
+
 def copy_and_mkdir(src, dst):
   os.makedirs(os.path.dirname(dst), exist_ok=True)
   shutil.copy(src, dst)
@@ -37,3 +49,4 @@ class SetupTeardown:
     shutil.rmtree("/tmp/injection", ignore_errors=True)
     shutil.rmtree("/tmp/OPS", ignore_errors=True)
     shutil.rmtree("/tmp/RED", ignore_errors=True)
+    shutil.rmtree("/tmp/rate-limits", ignore_errors=True)
@@ -1,10 +1,17 @@
 import pytest
+import requests
 import requests_mock
 
+from unittest.mock import MagicMock, patch
+
 from .helpers import SetupTeardown
 
-from src.errors import AuthenticationError
+from src.errors import AuthenticationError, TrackerUnavailableError
 from src.api import GazelleAPI
+from src.circuit_breaker import CircuitBreaker
+from src.database import Database
+from src.lookup_cache import LookupCache
+from src.rate_limit import TokenBucket
 
 
 class MockApi(GazelleAPI):
@@ -20,7 +27,7 @@ class MockApi(GazelleAPI):
 @pytest.fixture
 def mock_api_instance():
   instance = MockApi("supersecret")
-  instance._max_retries = 1
+  instance.circuit_breaker = CircuitBreaker(failure_threshold=1)
   return instance
 
 
@@ -65,6 +72,86 @@ class TestGazelleGetFindTorrent(SetupTeardown):
       assert isinstance(response, dict)
       assert response["info"] == "success"
 
+  def test_counts_requests(self, mock_api_instance):
+    with requests_mock.Mocker() as m:
+      m.get("https://foo.bar/ajax.php?action=torrent&hash=abc", json={"status": "success"})
+      mock_api_instance.rate_limiter = TokenBucket(0)
+      mock_api_instance.find_torrent("abc")
+      mock_api_instance.find_torrent("abc")
+
+      assert mock_api_instance.request_count == 2
+
+  def test_waits_for_rate_limiter_before_each_request(self, mock_api_instance):
+    mock_api_instance.rate_limiter = MagicMock()
+
+    with requests_mock.Mocker() as m:
+      m.get("https://foo.bar/ajax.php?action=torrent&hash=abc", json={"status": "success"})
+      mock_api_instance.find_torrent("abc")
+      mock_api_instance.find_torrent("abc")
+
+    assert mock_api_instance.rate_limiter.acquire.call_count == 2
+
+  def test_reuses_cached_responses(self, mock_api_instance):
+    mock_api_instance.rate_limiter = TokenBucket(0)
+    mock_api_instance.lookup_cache = LookupCache(Database(":memory:"))
+
+    with requests_mock.Mocker() as m:
+      m.get("https://foo.bar/ajax.php?action=torrent&hash=abc", json={"status": "failure", "error": "bad parameters"})
+      first_response = mock_api_instance.find_torrent("abc")
+      second_response = mock_api_instance.find_torrent("abc")
+
+      assert first_response == second_response == {"status": "failure", "error": "bad parameters"}
+      assert m.call_count == 1
+      assert mock_api_instance.request_count == 1
+
+
+class TestGazelleCircuitBreaker(SetupTeardown):
+  def test_fails_fast_once_tracker_keeps_failing(self, mock_api_instance):
+    mock_api_instance.circuit_breaker = CircuitBreaker()
+    mock_api_instance.rate_limiter = TokenBucket(0)
+
+    with requests_mock.Mocker() as m, patch("src.errors.sleep") as mock_sleep:
+      m.get("https://foo.bar/ajax.php?action=torrent&hash=abc", exc=requests.exceptions.ConnectionError)
+
+      with pytest.raises(TrackerUnavailableError, match="MockApi is unavailable"):
+        mock_api_instance.find_torrent("abc")
+
+      assert m.call_count == mock_api_instance.circuit_breaker.failure_threshold
+      assert mock_sleep.call_count == mock_api_instance.circuit_breaker.failure_threshold - 1
+
+      with pytest.raises(TrackerUnavailableError, match="trying again in"):
+        mock_api_instance.find_torrent("def")
+
+      assert m.call_count == mock_api_instance.circuit_breaker.failure_threshold
+
+  def test_closes_circuit_when_probe_succeeds(self, mock_api_instance):
+    mock_api_instance.rate_limiter = TokenBucket(0)
+    mock_api_instance.circuit_breaker = CircuitBreaker(reset_timeout=0)
+
+    with requests_mock.Mocker() as m, patch("src.errors.sleep"):
+      m.get("https://foo.bar/ajax.php?action=torrent&hash=abc", exc=requests.exceptions.ConnectionError)
+      for _ in range(mock_api_instance.circuit_breaker.failure_threshold):
+        with pytest.raises(Exception):
+          mock_api_instance.find_torrent("abc")
+
+      assert mock_api_instance.circuit_breaker.is_open
+
+      m.get("https://foo.bar/ajax.php?action=torrent&hash=abc", json={"status": "success"})
+
+      assert mock_api_instance.find_torrent("abc") == {"status": "success"}
+      assert not mock_api_instance.circuit_breaker.is_open
+
+  def test_settles_probe_when_rate_limiter_fails(self, mock_api_instance):
+    mock_api_instance.circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    mock_api_instance.circuit_breaker.record_failure()
+    mock_api_instance.rate_limiter = MagicMock()
+    mock_api_instance.rate_limiter.acquire.side_effect = PermissionError("Permission denied")
+
+    with pytest.raises(PermissionError):
+      mock_api_instance.find_torrent("abc")
+
+    assert mock_api_instance.circuit_breaker.is_open
+
 
 class TestGazelleAnnounceUrl(SetupTeardown):
   def test_returns_announce_url_if_set(self, mock_api_instance):
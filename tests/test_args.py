@@ -64,3 +64,113 @@ class TestArgs(SetupTeardown):
     args = parse_args(["-i", "foo", "-o", "bar", "-c", "baz.json"])
 
     assert args.config_file == "baz.json"
+
+  def test_sets_workers(self):
+    args = parse_args(["-i", "foo", "-o", "bar", "-w", "4"])
+
+    assert args.workers == 4
+
+  def test_defaults_workers_to_at_least_one(self):
+    args = parse_args(["-i", "foo", "-o", "bar"])
+
+    assert args.workers >= 1
+
+  def test_requires_positive_workers(self, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+      parse_args(["-i", "foo", "-o", "bar", "-w", "0"])
+
+    captured = capsys.readouterr()
+
+    assert excinfo.value.code == 2
+    assert "--workers must be at least 1" in captured.err
+
+  def test_sets_no_cache(self):
+    args = parse_args(["-i", "foo", "-o", "bar", "--no-cache"])
+
+    assert args.no_cache
+
+  def test_defaults_to_using_the_cache(self):
+    args = parse_args(["-i", "foo", "-o", "bar"])
+
+    assert not args.no_cache
+
+  def test_sets_recheck_options(self):
+    args = parse_args(
+      ["-i", "foo", "-o", "bar", "--recheck-after", "2", "--recheck-max", "10", "--recheck-budget", "30"]
+    )
+
+    assert args.recheck_after == 2
+    assert args.recheck_max == 10
+    assert args.recheck_budget == 30
+
+  def test_defaults_recheck_options(self):
+    args = parse_args(["-i", "foo", "-o", "bar"])
+
+    assert args.recheck_after == 1
+    assert args.recheck_max == 30
+    assert args.recheck_budget is None
+
+  def test_requires_recheck_after_to_fit_recheck_max(self, capsys):
+    with pytest.raises(SystemExit):
+      parse_args(["-i", "foo", "-o", "bar", "--recheck-after", "5", "--recheck-max", "2"])
+
+    captured = capsys.readouterr()
+
+    assert "--recheck-after must be positive and no greater than --recheck-max" in captured.err
+
+  def test_sets_watch(self):
+    args = parse_args(["-i", "foo", "-o", "bar", "--watch"])
+
+    assert args.watch
+
+  def test_requires_input_directory_for_watch(self, capsys):
+    with pytest.raises(SystemExit):
+      parse_args(["-f", "foo", "-o", "bar", "--watch"])
+
+    captured = capsys.readouterr()
+
+    assert "--watch requires --input-directory" in captured.err
+
+  def test_does_not_allow_watch_with_server(self, capsys):
+    with pytest.raises(SystemExit):
+      parse_args(["-i", "foo", "-o", "bar", "--watch", "--server"])
+
+    captured = capsys.readouterr()
+
+    assert "--watch can't be used with --server" in captured.err
+
+  def test_sets_scan_budget(self):
+    args = parse_args(["-i", "foo", "-o", "bar", "--max-runtime", "90", "--max-api-calls", "500"])
+
+    assert args.max_runtime == 90
+    assert args.max_api_calls == 500
+
+  def test_defaults_to_no_scan_budget(self):
+    args = parse_args(["-i", "foo", "-o", "bar"])
+
+    assert args.max_runtime is None
+    assert args.max_api_calls is None
+
+  def test_requires_max_api_calls_to_cover_a_lookup(self, capsys):
+    for max_api_calls in ["0", "2"]:
+      with pytest.raises(SystemExit):
+        parse_args(["-i", "foo", "-o", "bar", "--max-api-calls", max_api_calls])
+
+      captured = capsys.readouterr()
+
+      assert "--max-api-calls must be at least 3" in captured.err
+
+    assert parse_args(["-i", "foo", "-o", "bar", "--max-api-calls", "3"]).max_api_calls == 3
+
+  def test_sets_shard(self):
+    args = parse_args(["-i", "foo", "-o", "bar", "--shard", "2/3"])
+
+    assert (args.shard.number, args.shard.count) == (2, 3)
+
+  def test_rejects_invalid_shard(self, capsys):
+    with pytest.raises(SystemExit):
+      parse_args(["-i", "foo", "-o", "bar", "--shard", "4/3"])
+
+    captured = capsys.readouterr()
+
+    assert "Invalid shard 4/3" in captured.err
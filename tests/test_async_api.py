@@ -0,0 +1,151 @@
+import asyncio
+import re
+import threading
+import pytest
+import requests
+import requests_mock
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from .helpers import SetupTeardown
+
+from src.async_api import AsyncGazelleAPI, AsyncInjection, EventLoopThread
+from src.circuit_breaker import CircuitBreaker
+from src.database import Database
+from src.errors import AuthenticationError, TrackerUnavailableError
+from src.lookup_cache import LookupCache
+
+
+@pytest.fixture
+def runtime():
+  runtime = EventLoopThread(max_connections=4)
+  yield runtime
+  runtime.close()
+
+
+class TestEventLoopThread(SetupTeardown):
+  def test_runs_coroutines_from_other_threads(self, runtime):
+    async def add(a, b):
+      await asyncio.sleep(0)
+      return a + b
+
+    assert runtime.run(add(1, 2)) == 3
+
+  def test_raises_exceptions_of_coroutines(self, runtime):
+    async def fail():
+      raise ValueError("foo")
+
+    with pytest.raises(ValueError):
+      runtime.run(fail())
+
+  def test_runs_blocking_work_in_worker_threads(self, runtime):
+    async def thread_name():
+      return await asyncio.to_thread(lambda: threading.current_thread().name)
+
+    assert runtime.run(thread_name()).startswith("fertilizer-io")
+
+
+class TestAsyncGazelleAPI(SetupTeardown):
+  def test_finds_torrents(self, runtime, red_api):
+    api = AsyncGazelleAPI(red_api)
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+
+      assert runtime.run(api.find_torrent("abc")) == self.TORRENT_SUCCESS_RESPONSE
+      assert m.request_history[0].qs == {"action": ["torrent"], "hash": ["abc"]}
+      assert api.request_count == 1
+
+  def test_shares_concurrent_lookups_of_the_same_infohash(self, runtime, red_api):
+    api = AsyncGazelleAPI(red_api)
+
+    async def find_many():
+      return await asyncio.gather(*[api.find_torrent(infohash) for infohash in ["abc", "ABC", "abc", "def"]])
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+
+      assert runtime.run(find_many()) == [self.TORRENT_KNOWN_BAD_RESPONSE] * 4
+      assert m.call_count == 2
+
+  def test_uses_lookup_cache(self, runtime, red_api):
+    red_api.lookup_cache = LookupCache(Database(":memory:"))
+    api = AsyncGazelleAPI(red_api)
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+
+      runtime.run(api.find_torrent("abc"))
+      runtime.run(api.find_torrent("abc"))
+
+      assert m.call_count == 1
+      assert red_api.lookup_cache.get(red_api.site_url, "ABC") == self.TORRENT_KNOWN_BAD_RESPONSE
+
+  def test_retries_without_blocking(self, runtime, red_api):
+    red_api.circuit_breaker = CircuitBreaker(failure_threshold=2)
+    api = AsyncGazelleAPI(red_api)
+
+    with requests_mock.Mocker() as m, patch("src.errors.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+      m.get(
+        re.compile("action=torrent"),
+        [{"exc": requests.exceptions.ConnectionError}, {"json": self.TORRENT_SUCCESS_RESPONSE}],
+      )
+
+      assert runtime.run(api.find_torrent("abc")) == self.TORRENT_SUCCESS_RESPONSE
+      assert mock_sleep.await_count == 1
+      assert m.call_count == 2
+
+  def test_fails_fast_once_circuit_opens(self, runtime, red_api):
+    red_api.circuit_breaker = CircuitBreaker()
+    api = AsyncGazelleAPI(red_api)
+
+    with requests_mock.Mocker() as m, patch("src.errors.asyncio.sleep", new_callable=AsyncMock):
+      m.get(re.compile("action=torrent"), exc=requests.exceptions.ConnectTimeout)
+
+      with pytest.raises(TrackerUnavailableError):
+        runtime.run(api.find_torrent("abc"))
+      with pytest.raises(TrackerUnavailableError):
+        runtime.run(api.find_torrent("def"))
+
+      assert m.call_count == red_api.circuit_breaker.failure_threshold
+
+  def test_raises_if_account_info_is_unavailable(self, runtime, red_api):
+    api = AsyncGazelleAPI(red_api)
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=index"), json={"status": "failure", "error": "bad credentials"})
+
+      with pytest.raises(AuthenticationError):
+        runtime.run(api.get_account_info())
+
+  def test_loads_announce_url(self, runtime, red_api):
+    api = AsyncGazelleAPI(red_api)
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      assert runtime.run(api.load_announce_url()) == "https://flacsfor.me/bar/announce"
+      assert api.announce_url == "https://flacsfor.me/bar/announce"
+
+
+class TestAsyncInjection(SetupTeardown):
+  def test_injects_one_torrent_at_a_time(self, runtime):
+    running = []
+    overlapped = []
+
+    def inject_torrent(*args, **kwargs):
+      overlapped.append(bool(running))
+      running.append(1)
+      threading.Event().wait(0.01)
+      running.pop()
+      return args
+
+    injection = MagicMock()
+    injection.inject_torrent.side_effect = inject_torrent
+    async_injection = AsyncInjection(injection)
+
+    async def inject_many():
+      return await asyncio.gather(*[async_injection.inject_torrent(i) for i in range(3)])
+
+    assert runtime.run(inject_many()) == [(0,), (1,), (2,)]
+    assert overlapped == [False, False, False]
@@ -0,0 +1,173 @@
+import pytest
+
+from .helpers import SetupTeardown
+
+from src.errors import TorrentDecodingError
+from src.bencode import (
+  value_end,
+  string_value,
+  iter_dict,
+  dict_value_span,
+  dict_item_span,
+  lazy_value,
+  LazyDict,
+  encode_item,
+  dict_splices,
+  splice_segments,
+)
+
+
+class TestValueEnd(SetupTeardown):
+  def test_returns_end_of_int(self):
+    assert value_end(b"i42ei1e", 0) == 4
+
+  def test_returns_end_of_string(self):
+    assert value_end(b"3:foo3:bar", 0) == 5
+
+  def test_returns_end_of_nested_containers(self):
+    data = b"d3:fooli1e3:bare3:bazd1:ai2eee"
+
+    assert value_end(data, 0) == len(data)
+
+  def test_works_from_an_offset(self):
+    assert value_end(b"3:fooli1ee", 5) == 10
+
+  def test_raises_on_truncated_data(self):
+    with pytest.raises(TorrentDecodingError):
+      value_end(b"10:foo", 0)
+
+    with pytest.raises(TorrentDecodingError):
+      value_end(b"li1e", 0)
+
+  def test_raises_on_invalid_token(self):
+    with pytest.raises(TorrentDecodingError):
+      value_end(b"x", 0)
+
+
+class TestStringValue(SetupTeardown):
+  def test_returns_string_contents(self):
+    assert string_value(b"i1e3:foo", 3, 8) == b"foo"
+
+
+class TestIterDict(SetupTeardown):
+  def test_yields_keys_and_value_offsets(self):
+    data = b"d3:fooi1e3:bar3:baze"
+
+    assert list(iter_dict(data, 0)) == [(b"foo", 6, 9), (b"bar", 14, 19)]
+
+  def test_raises_if_not_a_dict(self):
+    with pytest.raises(TorrentDecodingError):
+      list(iter_dict(b"li1ee", 0))
+
+
+class TestDictValueSpan(SetupTeardown):
+  def test_returns_span_of_value(self):
+    data = b"d3:fooi1e3:bar3:baze"
+    start, end = dict_value_span(data, 0, b"bar")
+
+    assert data[start:end] == b"3:baz"
+
+  def test_returns_none_if_key_is_absent(self):
+    assert dict_value_span(b"d3:fooi1ee", 0, b"bar") is None
+
+
+class TestDictItemSpan(SetupTeardown):
+  def test_returns_span_of_key_and_value(self):
+    data = b"d3:fooi1e6:source3:REDe"
+    start, end = dict_item_span(data, 0, b"source")
+
+    assert data[start:end] == b"6:source3:RED"
+
+  def test_returns_sorted_insertion_point_if_key_is_absent(self):
+    data = b"d1:ai1e1:zi2ee"
+    start, end = dict_item_span(data, 0, b"m")
+
+    assert start == end
+    assert data[:start] == b"d1:ai1e"
+
+  def test_returns_end_of_dict_if_key_sorts_last(self):
+    data = b"d1:ai1ee"
+
+    assert dict_item_span(data, 0, b"z") == (7, 7)
+
+  def test_finds_keys_in_unsorted_dicts(self):
+    data = b"d1:zi1e1:ai2ee"
+    start, end = dict_item_span(data, 0, b"a")
+
+    assert data[start:end] == b"1:ai2e"
+
+
+class TestEncodeItem(SetupTeardown):
+  def test_encodes_key_and_value(self):
+    assert encode_item(b"source", b"RED") == b"6:source3:RED"
+    assert encode_item(b"private", 1) == b"7:privatei1e"
+
+
+class TestDictSplices(SetupTeardown):
+  def test_replaces_inserts_and_removes_items(self):
+    data = b"d1:ai1e1:ci3e1:di4ee"
+    splices = dict_splices(data, 0, {b"a": 9, b"b": 2, b"d": None})
+
+    assert b"".join(splice_segments(data, 0, len(data), splices)) == b"d1:ai9e1:bi2e1:ci3ee"
+
+  def test_keeps_sorted_order_of_items_inserted_at_the_same_offset(self):
+    data = b"d1:ai1ee"
+    splices = dict_splices(data, 0, {b"c": 3, b"b": 2})
+
+    assert b"".join(splice_segments(data, 0, len(data), splices)) == b"d1:ai1e1:bi2e1:ci3ee"
+
+
+class TestSpliceSegments(SetupTeardown):
+  def test_returns_views_of_untouched_regions(self):
+    data = b"d1:ai1e1:bi2ee"
+    segments = splice_segments(data, 0, len(data), [(7, 13, b"1:bi5e")])
+
+    assert b"".join(segments) == b"d1:ai1e1:bi5ee"
+    assert isinstance(segments[0], memoryview)
+
+  def test_returns_whole_range_without_splices(self):
+    assert b"".join(splice_segments(b"xxd1:ai1eexx", 2, 10, [])) == b"d1:ai1ee"
+
+
+class TestLazyValue(SetupTeardown):
+  def test_decodes_scalars(self):
+    assert lazy_value(b"i-42e", 0, 5) == -42
+    assert lazy_value(b"3:foo", 0, 5) == b"foo"
+
+  def test_returns_lists_of_lazy_values(self):
+    result = lazy_value(b"l3:fooli1eed1:ai2eee", 0, 20)
+
+    assert result[0] == b"foo"
+    assert result[1] == [1]
+    assert isinstance(result[2], LazyDict)
+    assert result[2][b"a"] == 2
+
+
+class TestLazyDict(SetupTeardown):
+  def test_looks_up_values(self):
+    data = LazyDict(b"d8:announce3:foo4:infod4:name3:bar6:pieces4:abcdee")
+
+    assert data[b"announce"] == b"foo"
+    assert data[b"info"][b"name"] == b"bar"
+    assert data.get(b"missing") is None
+    assert b"info" in data
+    assert list(data) == [b"announce", b"info"]
+    assert len(data[b"info"]) == 2
+
+  def test_raises_key_error_for_missing_keys(self):
+    with pytest.raises(KeyError):
+      LazyDict(b"de")[b"foo"]
+
+  def test_returns_spans_of_values(self):
+    raw = b"d8:announce3:foo4:infod4:name3:baree"
+    data = LazyDict(raw)
+    start, end = data.span(b"info")
+
+    assert raw[start:end] == b"d4:name3:bare"
+    assert data[b"info"].start == start
+    assert data[b"info"].end == end
+    assert data.end == len(raw)
+
+  def test_raises_on_malformed_data(self):
+    with pytest.raises(TorrentDecodingError):
+      len(LazyDict(b"d3:foo"))
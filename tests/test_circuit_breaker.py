@@ -0,0 +1,136 @@
+import threading
+import pytest
+
+from .helpers import SetupTeardown
+
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class TestCircuitBreaker(SetupTeardown):
+  def test_opens_after_threshold_failures_in_a_row(self):
+    breaker = CircuitBreaker(failure_threshold=3, clock=FakeClock())
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+  def test_successes_reset_failure_count(self):
+    breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+
+  def test_lets_one_probe_through_after_reset_timeout(self):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 59
+    assert not breaker.allow_request()
+    assert breaker.seconds_until_probe() == 1
+
+    clock.now = 60
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()
+
+  def test_closes_when_probe_succeeds(self):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=clock)
+    breaker.record_failure()
+    clock.now = 60
+    breaker.allow_request()
+
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+    assert breaker.seconds_until_probe() == 0
+
+  def test_backs_off_when_probes_fail(self):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, max_reset_timeout=200, clock=clock)
+    breaker.record_failure()
+
+    probe_waits = []
+    for _ in range(3):
+      probe_waits.append(breaker.seconds_until_probe())
+      clock.now += probe_waits[-1]
+      assert breaker.allow_request()
+      breaker.record_failure()
+
+    assert probe_waits == [60, 120, 200]
+    assert breaker.state == OPEN
+
+  def test_resets_backoff_once_closed(self):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=clock)
+    breaker.record_failure()
+    clock.now = 60
+    breaker.allow_request()
+    breaker.record_failure()
+    clock.now = 180
+    breaker.allow_request()
+    breaker.record_success()
+
+    breaker.record_failure()
+
+    assert breaker.seconds_until_probe() == 60
+
+  def test_allows_a_single_probe_across_threads(self):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0, clock=clock)
+    breaker.record_failure()
+    allowed = []
+
+    threads = [threading.Thread(target=lambda: allowed.append(breaker.allow_request())) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    assert allowed.count(True) == 1
+
+  def test_records_outcome_of_requests(self):
+    breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+
+    with breaker.request():
+      pass
+
+    assert breaker.state == CLOSED
+
+    with pytest.raises(KeyboardInterrupt):
+      with breaker.request():
+        raise KeyboardInterrupt
+
+    assert breaker.state == OPEN
+
+  def test_settles_probes_that_end_in_unexpected_errors(self):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=clock)
+    breaker.record_failure()
+    clock.now = 60
+    assert breaker.allow_request()
+
+    with pytest.raises(OSError):
+      with breaker.request():
+        raise OSError("No space left on device")
+
+    assert breaker.state == OPEN
+    assert breaker.seconds_until_probe() == 120
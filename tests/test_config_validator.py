@@ -1,9 +1,15 @@
+import re
 import pytest
-# from unittest import mock
+import requests
+import requests_mock
+from unittest.mock import MagicMock, patch
 
 from .helpers import SetupTeardown
 
+from src.circuit_breaker import CircuitBreaker
 from src.config_validator import ConfigValidator
+from src.errors import TrackerUnavailableError
+from src.rate_limit import TokenBucket
 
 
 @pytest.fixture
@@ -157,3 +163,34 @@ class TestValidate(SetupTeardown):
       validator.validate()
 
     assert '- "injection_link_directory": File or directory not found: /tmp/doesnt_exist' in str(excinfo.value)
+
+
+class TestVerifyApiKeys(SetupTeardown):
+  ANNOUNCE = {"json": SetupTeardown.ANNOUNCE_SUCCESS_RESPONSE}
+  OUTAGE = {"exc": requests.exceptions.ConnectionError}
+
+  @pytest.fixture(autouse=True)
+  def instant_probes(self):
+    with (
+      patch("src.api.create_rate_limiter", lambda *args, **kwargs: TokenBucket(0)),
+      patch("src.api.CircuitBreaker", lambda: CircuitBreaker(reset_timeout=0)),
+      patch("src.errors.sleep"),
+    ):
+      yield
+
+  def test_waits_for_tracker_that_is_down_at_startup(self, red_key, ops_key):
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("redacted"), [self.OUTAGE] * 4 + [self.ANNOUNCE])
+      m.get(re.compile("orpheus"), [self.ANNOUNCE])
+
+      red_api, ops_api = ConfigValidator.verify_api_keys(MagicMock(red_key=red_key, ops_key=ops_key))
+
+    assert red_api.announce_url == "https://flacsfor.me/bar/announce"
+    assert red_api.request_count == 5
+
+  def test_gives_up_on_tracker_that_stays_down(self, red_key, ops_key):
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("redacted"), [self.OUTAGE])
+
+      with pytest.raises(TrackerUnavailableError, match="RED is unavailable"):
+        ConfigValidator.verify_api_keys(MagicMock(red_key=red_key, ops_key=ops_key))
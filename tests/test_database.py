@@ -0,0 +1,38 @@
+import os
+
+from .helpers import SetupTeardown
+
+from src.database import Database, database_path_for_config
+
+
+class TestDatabasePathForConfig(SetupTeardown):
+  def test_returns_path_next_to_config_file(self):
+    assert database_path_for_config("/foo/bar/config.json") == "/foo/bar/fertilizer.sqlite3"
+
+  def test_resolves_relative_config_paths(self):
+    assert database_path_for_config("config.json") == os.path.join(os.getcwd(), "fertilizer.sqlite3")
+
+
+class TestDatabase(SetupTeardown):
+  def test_executes_statements(self):
+    db = Database(":memory:")
+    db.execute("CREATE TABLE foo (bar TEXT)")
+    db.executemany("INSERT INTO foo VALUES (?)", [("a",), ("b",)])
+
+    assert db.execute("SELECT bar FROM foo ORDER BY bar") == [("a",), ("b",)]
+
+  def test_persists_to_disk_in_wal_mode(self):
+    path = "/tmp/fertilizer-test.sqlite3"
+    for suffix in ["", "-wal", "-shm"]:
+      if os.path.exists(path + suffix):
+        os.remove(path + suffix)
+
+    db = Database(path)
+    db.execute("CREATE TABLE foo (bar TEXT)")
+    db.execute("INSERT INTO foo VALUES (?)", ("a",))
+
+    assert db.execute("PRAGMA journal_mode") == [("wal",)]
+
+    db.close()
+
+    assert Database(path).execute("SELECT bar FROM foo") == [("a",)]
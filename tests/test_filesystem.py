@@ -1,9 +1,16 @@
 import os
 import pytest
 
-from .helpers import SetupTeardown
+from .helpers import SetupTeardown, get_torrent_path, copy_and_mkdir
 
-from src.filesystem import sane_join, mkdir_p, assert_path_exists, list_files_of_extension, replace_extension
+from src.filesystem import (
+  sane_join,
+  mkdir_p,
+  assert_path_exists,
+  list_files_of_extension,
+  scan_files_of_extension,
+  replace_extension,
+)
 
 
 class TestSaneJoin(SetupTeardown):
@@ -75,6 +82,37 @@ class TestListFilesOfExtension(SetupTeardown):
 
     assert len(files) == 0
 
+  def test_lists_subdirectories_up_to_max_depth(self):
+    top = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/top.torrent")
+    nested = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/OPS/nested.torrent")
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/OPS/deeper/deep.torrent")
+
+    assert list_files_of_extension("/tmp/output") == [top]
+    assert sorted(list_files_of_extension("/tmp/output", max_depth=1)) == sorted([top, nested])
+
+
+class TestScanFilesOfExtension(SetupTeardown):
+  def test_yields_dir_entries_lazily(self):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/RED/foo.torrent")
+
+    entries = scan_files_of_extension("/tmp/output", ".torrent", max_depth=1)
+    entry = next(entries)
+
+    assert entry.path == filepath
+    assert entry.stat().st_size == os.path.getsize(filepath)
+    assert next(entries, None) is None
+
+  def test_skips_directories_with_matching_names(self):
+    os.makedirs("/tmp/output/folder.torrent")
+
+    assert list(scan_files_of_extension("/tmp/output", ".torrent", max_depth=1)) == []
+
+  def test_does_not_follow_symlinked_directories(self):
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/foo.torrent")
+    os.symlink("/tmp/input", "/tmp/output/link")
+
+    assert list(scan_files_of_extension("/tmp/output", ".torrent", max_depth=1)) == []
+
 
 class TestReplaceExtension(SetupTeardown):
   def test_replaces_extension(self):
@@ -0,0 +1,75 @@
+import os
+
+from .helpers import get_torrent_path, SetupTeardown, copy_and_mkdir
+
+from src.database import Database
+from src.hash_cache import InfohashCache
+
+
+class TestInfohashCache(SetupTeardown):
+  def test_returns_stored_entries_for_unchanged_files(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+
+    cache.put(filepath, b"a" * 20, {b"OPS": b"b" * 20})
+
+    assert cache.get(filepath) == (b"a" * 20, {b"OPS": b"b" * 20})
+
+  def test_returns_empty_variant_hashes_if_none_were_stored(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+
+    cache.put(filepath, b"a" * 20)
+
+    assert cache.get(filepath) == (b"a" * 20, {})
+
+  def test_returns_none_for_unknown_files(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+
+    assert cache.get(filepath) is None
+    assert cache.get("/tmp/input/missing.torrent") is None
+
+  def test_ignores_entries_for_changed_files(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    cache.put(filepath, b"a" * 20)
+
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert cache.get(filepath) is None
+
+  def test_gets_many_entries_at_once(self):
+    cache = InfohashCache(Database(":memory:"))
+    red = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    ops = copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/input/ops_source.torrent")
+    cache.put_many([(red, b"a" * 20, None), (ops, b"b" * 20, None)])
+
+    result = cache.get_many([red, ops, "/tmp/input/missing.torrent"])
+
+    assert result == {red: (b"a" * 20, {}), ops: (b"b" * 20, {})}
+
+  def test_forgets_files_missing_from_directory(self):
+    cache = InfohashCache(Database(":memory:"))
+    red = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    ops = copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/input/ops_source.torrent")
+    other = copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/output/ops_source.torrent")
+    cache.put_many([(red, b"a" * 20, None), (ops, b"b" * 20, None), (other, b"c" * 20, None)])
+    os.remove(ops)
+    os.remove(other)
+
+    cache.forget_missing("/tmp/input")
+
+    assert cache.get(red) is not None
+    assert cache._db.execute("SELECT path FROM infohashes ORDER BY path") == [(red,), (other,)]
+
+  def test_accepts_dir_entries(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    cache.put(filepath, b"a" * 20)
+
+    with os.scandir("/tmp/input") as entries:
+      result = cache.get_many(list(entries))
+
+    assert result == {filepath: (b"a" * 20, {})}
@@ -0,0 +1,133 @@
+import os
+
+from unittest.mock import patch
+
+from .helpers import get_torrent_path, SetupTeardown, copy_and_mkdir
+
+from src.database import Database
+from src.hash_cache import InfohashCache
+from src.filesystem import scan_files_of_extension
+from src.index import OutputIndex, build_infohash_index
+from src.parser import calculate_infohash_from_file
+
+
+class TestBuildInfohashIndex(SetupTeardown):
+  def test_indexes_torrents_by_infohash(self):
+    filepaths = [get_torrent_path("red_source"), get_torrent_path("ops_source")]
+
+    result = build_infohash_index(filepaths)
+
+    assert result == {calculate_infohash_from_file(filepath): filepath for filepath in filepaths}
+
+  def test_skips_files_that_cannot_be_decoded(self):
+    result = build_infohash_index([get_torrent_path("broken"), get_torrent_path("no_info"), "/tmp/missing.torrent"])
+
+    assert result == {}
+
+  def test_records_infohash_of_every_copy_by_path(self):
+    filepaths = [copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{name}.torrent") for name in ["a", "b"]]
+    infohashes_by_path = {}
+
+    result = build_infohash_index(filepaths, infohashes_by_path=infohashes_by_path)
+
+    infohash = calculate_infohash_from_file(filepaths[0])
+    assert result == {infohash: filepaths[1]}
+    assert infohashes_by_path == {filepaths[0]: infohash, filepaths[1]: infohash}
+
+  def test_parallel_index_matches_serial_index(self):
+    filepaths = []
+    for i, name in enumerate(["red_source", "ops_source", "broken", "no_source", "red_source", "no_info"] * 3):
+      filepaths.append(copy_and_mkdir(get_torrent_path(name), f"/tmp/input/{i}-{name}.torrent"))
+
+    serial = build_infohash_index(filepaths)
+    parallel = build_infohash_index(filepaths, workers=2, chunk_size=2)
+
+    assert parallel == serial
+    assert list(parallel.items()) == list(serial.items())
+
+  def test_indexes_files_from_a_generator(self):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/OPS/red_source.torrent"),
+      copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/output/RED/ops_source.torrent"),
+    ]
+
+    result = build_infohash_index(scan_files_of_extension("/tmp/output", max_depth=1), chunk_size=1)
+
+    assert result == {calculate_infohash_from_file(filepath): filepath for filepath in filepaths}
+
+  def test_takes_unchanged_files_from_cache(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    expected = build_infohash_index([filepath], cache=cache)
+
+    with patch("src.index.calculate_infohash_digest_from_file") as mock_hash:
+      result = build_infohash_index([filepath], cache=cache)
+
+    assert mock_hash.call_count == 0
+    assert result == expected
+
+  def test_rehashes_changed_files(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/changing.torrent")
+    build_infohash_index([filepath], cache=cache)
+    copy_and_mkdir(get_torrent_path("ops_source"), filepath)
+
+    result = build_infohash_index([filepath], cache=cache)
+
+    assert result == {calculate_infohash_from_file(filepath): filepath}
+
+
+class TestOutputIndex(SetupTeardown):
+  def test_indexes_directory_on_creation(self):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/red_source.torrent")
+
+    index = OutputIndex("/tmp/output")
+
+    assert dict(index) == {calculate_infohash_from_file(filepath): filepath}
+
+  def test_indexes_tracker_subfolders(self):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/OPS/red_source.torrent")
+
+    index = OutputIndex("/tmp/output")
+
+    assert dict(index) == {calculate_infohash_from_file(filepath): filepath}
+
+  def test_adds_entries_in_place(self):
+    index = OutputIndex("/tmp/output")
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/red_source.torrent")
+
+    index["FOO"] = filepath
+
+    assert "FOO" in index
+    assert index["FOO"] == filepath
+
+  def test_drops_entries_for_deleted_files_on_lookup(self):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/red_source.torrent")
+    index = OutputIndex("/tmp/output")
+    os.remove(filepath)
+
+    assert calculate_infohash_from_file(get_torrent_path("red_source")) not in index
+    assert len(index) == 0
+
+  def test_reconcile_picks_up_directory_changes(self):
+    red = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/red_source.torrent")
+    index = OutputIndex("/tmp/output")
+    os.remove(red)
+    ops = copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/output/ops_source.torrent")
+
+    index.reconcile()
+
+    assert dict(index) == {calculate_infohash_from_file(ops): ops}
+
+  def test_reconcile_keeps_entries_added_while_it_runs(self):
+    index = OutputIndex("/tmp/output")
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/red_source.torrent")
+
+    def add_while_indexing(*args, **kwargs):
+      index["FOO"] = filepath
+      return {}
+
+    with patch("src.index.build_infohash_index", side_effect=add_while_indexing):
+      index.reconcile()
+
+    assert index["FOO"] == filepath
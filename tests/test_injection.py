@@ -1,7 +1,7 @@
 import os
 import pytest
 
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 from .helpers import get_torrent_path, get_support_file_path, copy_and_mkdir, SetupTeardown
 
@@ -9,6 +9,7 @@ from src.clients.deluge import Deluge
 from src.clients.qbittorrent import Qbittorrent
 from src.errors import TorrentInjectionError
 from src.injection import Injection
+from src.metadata import load_torrent_meta
 
 
 class ConfigMock:
@@ -95,6 +96,24 @@ class TestInjectTorrent(SetupTeardown):
       save_path_override="/tmp/injection/OPS",
     )
 
+  def test_uses_given_torrent_meta_instead_of_reading_source(self, injector):
+    source_torrent_meta = load_torrent_meta(get_torrent_path("red_source"))
+    new_torrent_filepath = copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/output/ops_source.torrent")
+    copy_and_mkdir(get_support_file_path("foo.txt"), "/tmp/input/Big Buck Bunny/foo.txt")
+    injector.client.get_torrent_info.return_value = {"content_path": "/tmp/input/Big Buck Bunny"}
+
+    with patch("src.injection.load_torrent_meta") as load_torrent_meta_mock:
+      injector.inject_torrent(
+        "/tmp/input/missing.torrent", new_torrent_filepath, "OPS", source_torrent_meta=source_torrent_meta
+      )
+
+    load_torrent_meta_mock.assert_not_called()
+    injector.client.inject_torrent.assert_called_with(
+      "F15A59B9620FBF4CB06407C10399607367D9204D",
+      "/tmp/output/ops_source.torrent",
+      save_path_override="/tmp/injection/OPS",
+    )
+
   def test_copies_torrent_files_to_linking_directory(self, injector):
     source_torrent_filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
     new_torrent_filepath = copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/output/ops_source.torrent")
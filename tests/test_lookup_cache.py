@@ -0,0 +1,137 @@
+import threading
+
+from time import sleep
+from unittest.mock import patch
+
+from .helpers import SetupTeardown
+
+from src.database import Database
+from src.lookup_cache import LookupCache
+
+HIT = {"status": "success", "response": {"torrent": {"filePath": "foo", "id": 123, "size": 456}}}
+MISS = {"status": "failure", "error": "bad hash parameter"}
+FAILURE = {"status": "failure", "error": "unknown error"}
+
+
+class TestLookupCache(SetupTeardown):
+  def test_returns_nothing_for_unknown_lookups(self):
+    assert LookupCache(Database(":memory:")).get("https://foo.bar", "ABC") is None
+
+  def test_keeps_only_used_fields_of_hits(self):
+    cache = LookupCache(Database(":memory:"))
+    cache.put("https://foo.bar", "abc", HIT)
+
+    assert cache.get("https://foo.bar", "ABC") == {
+      "status": "success",
+      "response": {"torrent": {"filePath": "foo", "id": 123}},
+    }
+
+  def test_caches_misses(self):
+    cache = LookupCache(Database(":memory:"))
+    cache.put("https://foo.bar", "ABC", MISS)
+
+    assert cache.get("https://foo.bar", "ABC") == MISS
+
+  def test_does_not_cache_failed_lookups(self):
+    cache = LookupCache(Database(":memory:"))
+    cache.put("https://foo.bar", "ABC", FAILURE)
+
+    assert cache.get("https://foo.bar", "ABC") is None
+
+  def test_keeps_sites_apart(self):
+    cache = LookupCache(Database(":memory:"))
+    cache.put("https://foo.bar", "ABC", HIT)
+
+    assert cache.get("https://baz.qux", "ABC") is None
+
+  def test_expires_hits_and_misses_separately(self):
+    cache = LookupCache(Database(":memory:"), hit_ttl=100, miss_ttl=10)
+
+    with patch("src.lookup_cache.time", return_value=1000):
+      cache.put("https://foo.bar", "HIT", HIT)
+      cache.put("https://foo.bar", "MISS", MISS)
+
+    with patch("src.lookup_cache.time", return_value=1050):
+      assert cache.get("https://foo.bar", "HIT") is not None
+      assert cache.get("https://foo.bar", "MISS") is None
+
+    with patch("src.lookup_cache.time", return_value=1100):
+      assert cache.get("https://foo.bar", "HIT") is None
+
+  def test_evicts_least_recently_used_entries(self):
+    cache = LookupCache(Database(":memory:"), max_entries=2)
+
+    with patch("src.lookup_cache.time", side_effect=[1, 2, 3, 4, 5, 5, 5]):
+      cache.put("https://foo.bar", "A", HIT)
+      cache.put("https://foo.bar", "B", HIT)
+      cache.get("https://foo.bar", "A")
+      cache.put("https://foo.bar", "C", HIT)
+
+      assert cache.get("https://foo.bar", "A") is not None
+      assert cache.get("https://foo.bar", "B") is None
+      assert cache.get("https://foo.bar", "C") is not None
+
+  def test_only_counts_entries_every_so_many_stores(self):
+    database = Database(":memory:")
+    cache = LookupCache(database, max_entries=300)
+    counts = []
+    execute = database.execute
+
+    def count_queries(sql, parameters=()):
+      if "COUNT" in sql:
+        counts.append(sql)
+
+      return execute(sql, parameters)
+
+    with patch.object(database, "execute", side_effect=count_queries):
+      for i in range(10):
+        cache.put("https://foo.bar", f"{i}", HIT)
+
+    assert len(counts) == 3
+
+
+class TestLookupCacheFetch(SetupTeardown):
+  def test_looks_up_and_caches_response(self):
+    cache = LookupCache(Database(":memory:"))
+    calls = []
+
+    def look_up():
+      calls.append(1)
+      return MISS
+
+    assert cache.fetch("https://foo.bar", "ABC", look_up) == MISS
+    assert cache.fetch("https://foo.bar", "abc", look_up) == MISS
+    assert len(calls) == 1
+
+  def test_shares_concurrent_lookups(self):
+    cache = LookupCache(Database(":memory:"))
+    looking_up = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def look_up():
+      calls.append(1)
+      looking_up.set()
+      release.wait(5)
+      return FAILURE
+
+    def fetch():
+      results.append(cache.fetch("https://foo.bar", "ABC", look_up))
+
+    leader = threading.Thread(target=fetch)
+    leader.start()
+    assert looking_up.wait(5)
+
+    followers = [threading.Thread(target=fetch) for _ in range(3)]
+    for follower in followers:
+      follower.start()
+
+    # Failed lookups aren't cached, so only waiting on the leader keeps the others from looking up again
+    sleep(0.1)
+    release.set()
+    for thread in [leader, *followers]:
+      thread.join()
+
+    assert results == [FAILURE] * 4
+    assert len(calls) == 1
@@ -0,0 +1,74 @@
+import pytest
+
+from .helpers import decode_torrent_file, get_torrent_path, reencoded_infohash, SetupTeardown
+
+from src.errors import TorrentDecodingError
+from src.metadata import TorrentMeta, load_torrent_meta
+from src.trackers import RedTracker, OpsTracker
+
+
+class TestLoadTorrentMeta(SetupTeardown):
+  def test_returns_torrent_meta(self):
+    torrent_path = get_torrent_path("red_source")
+    torrent_data = decode_torrent_file(torrent_path)
+    result = load_torrent_meta(torrent_path)
+
+    assert isinstance(result, TorrentMeta)
+    assert result.filepath == torrent_path
+    assert result.infohash_hex == reencoded_infohash(torrent_data)
+    assert len(result.infohash) == 20
+    assert result.origin_tracker == RedTracker
+    assert result.source == b"RED"
+    assert result.name == b"Big Buck Bunny"
+    assert result.total_size == sum(file[b"length"] for file in torrent_data[b"info"][b"files"])
+
+  def test_records_offsets_into_the_buffer(self):
+    result = load_torrent_meta(get_torrent_path("red_source"))
+    info_start, info_end = result.info_span
+    files_start, files_end = result.files_span
+
+    assert result.buffer[info_start] == ord("d")
+    assert result.buffer[info_end - 1] == ord("e")
+    assert info_start < files_start < files_end < info_end
+
+  def test_handles_single_file_torrents(self):
+    torrent_path = "/tmp/input/single.torrent"
+    with open(torrent_path, "wb") as f:
+      f.write(b"d8:announce26:https://flacsfor.me/123abc4:infod6:lengthi42e4:name3:fooee")
+
+    result = load_torrent_meta(torrent_path)
+
+    assert result.files_span is None
+    assert result.total_size == 42
+    assert result.source is None
+
+  def test_uses_fastresume_file_for_origin_tracker(self):
+    assert load_torrent_meta(get_torrent_path("qbit_ops")).origin_tracker == OpsTracker
+
+  def test_leaves_origin_tracker_empty_if_unknown(self):
+    assert load_torrent_meta(get_torrent_path("no_source")).origin_tracker is None
+
+  def test_provides_variant_hasher(self):
+    result = load_torrent_meta(get_torrent_path("red_source"))
+
+    assert result.variant_hasher.infohash_for_source(b"RED") == result.infohash_hex
+    assert result.variant_hasher is result.variant_hasher
+
+  def test_provides_lazy_data(self):
+    assert load_torrent_meta(get_torrent_path("red_source")).data[b"info"][b"source"] == b"RED"
+
+  def test_provides_creation_date(self):
+    assert load_torrent_meta(get_torrent_path("red_source")).creation_date == 1490916601
+
+  def test_has_no_instance_dict(self):
+    assert not hasattr(load_torrent_meta(get_torrent_path("red_source")), "__dict__")
+
+  def test_raises_if_torrent_cannot_be_decoded(self):
+    with pytest.raises(TorrentDecodingError) as excinfo:
+      load_torrent_meta(get_torrent_path("broken"))
+
+    assert str(excinfo.value) == "Error decoding torrent file"
+
+  def test_raises_if_torrent_has_no_info(self):
+    with pytest.raises(TorrentDecodingError):
+      load_torrent_meta(get_torrent_path("no_info"))
@@ -1,7 +1,9 @@
+import mmap
 import os
+import bencoder
 import pytest
 
-from .helpers import get_torrent_path, SetupTeardown
+from .helpers import decode_torrent_file, get_torrent_path, reencoded_infohash, SetupTeardown
 
 from src.errors import TorrentDecodingError
 from src.trackers import RedTracker, OpsTracker
@@ -9,13 +11,20 @@ from src.parser import (
   is_valid_infohash,
   get_source,
   get_name,
-  get_bencoded_data,
   get_announce_url,
   get_origin_tracker,
-  recalculate_hash_for_new_source,
-  save_bencoded_data,
-  calculate_infohash,
+  calculate_infohash_from_buffer,
+  calculate_infohash_from_file,
+  get_info_span,
+  SourceVariantHasher,
+  get_lazy_bencoded_data,
+  get_torrent_skeleton,
+  sniff_origin_tracker,
+  read_torrent_buffer,
+  splice_torrent,
+  save_spliced_data,
 )
+from src.bencode import LazyDict
 
 
 class TestIsValidInfohash(SetupTeardown):
@@ -85,83 +94,249 @@ class TestGetOriginTracker(SetupTeardown):
     assert get_origin_tracker({b"announce": b"https://foo/123abc"}) is None
 
 
-class TestCalculateInfohash(SetupTeardown):
+class TestCalculateInfohashFromBuffer(SetupTeardown):
   def test_returns_infohash(self):
-    torrent_data = {b"info": {b"source": b"RED"}}
-    result = calculate_infohash(torrent_data)
+    assert calculate_infohash_from_buffer(b"d4:infod6:source3:REDee") == "FD2F1D966DF7E2E35B0CF56BC8510C6BB4D44467"
 
-    assert result == "FD2F1D966DF7E2E35B0CF56BC8510C6BB4D44467"
+  def test_matches_infohash_of_decoded_data(self):
+    for name in ("red_source", "ops_source", "no_source", "qbit_ops"):
+      torrent_path = get_torrent_path(name)
 
-  def test_raises_if_no_info_key(self):
-    torrent_data = {}
+      with open(torrent_path, "rb") as f:
+        result = calculate_infohash_from_buffer(f.read())
+
+      assert result == reencoded_infohash(decode_torrent_file(torrent_path))
 
+  def test_raises_if_no_info_key(self):
     with pytest.raises(TorrentDecodingError) as excinfo:
-      calculate_infohash(torrent_data)
+      calculate_infohash_from_buffer(b"d8:announce3:fooe")
 
     assert "Torrent data does not contain 'info' key" in str(excinfo.value)
 
+  def test_raises_if_info_is_not_a_dict(self):
+    with pytest.raises(TorrentDecodingError):
+      calculate_infohash_from_buffer(b"d4:info3:fooe")
+
+  def test_raises_on_malformed_data(self):
+    with pytest.raises(TorrentDecodingError):
+      calculate_infohash_from_buffer(b"d4:infod6:source3:RE")
+
+
+class TestCalculateInfohashFromFile(SetupTeardown):
+  def test_returns_infohash(self):
+    result = calculate_infohash_from_file(get_torrent_path("red_source"))
+
+    assert result == reencoded_infohash(decode_torrent_file(get_torrent_path("red_source")))
+
+  def test_raises_on_error(self):
+    with pytest.raises(TorrentDecodingError):
+      calculate_infohash_from_file(get_torrent_path("broken"))
+
+
+class TestGetInfoSpan(SetupTeardown):
+  def test_returns_span_of_info_dict(self):
+    data = b"d8:announce3:foo4:infod6:source3:REDee"
+    start, end = get_info_span(data)
+
+    assert data[start:end] == b"d6:source3:REDe"
+
+
+class TestSourceVariantHasher(SetupTeardown):
+  def test_replaces_existing_source(self):
+    hasher = SourceVariantHasher.from_buffer(b"d4:infod6:source3:REDee")
+
+    assert hasher.infohash_for_source(b"OPS") == "4F36F59992B6F7CB6EB6C2DEE06DD66AC81A981B"
+
+  def test_matches_hash_of_reencoded_data(self):
+    torrent_path = get_torrent_path("red_source")
+    torrent_data = decode_torrent_file(torrent_path)
+    hasher = SourceVariantHasher.from_buffer(read_torrent_buffer(torrent_path))
+
+    for new_source in (b"OPS", b"APL", b"", "RED"):
+      expected = reencoded_infohash({b"info": {**torrent_data[b"info"], b"source": new_source}})
+
+      assert hasher.infohash_for_source(new_source) == expected
+
+  def test_inserts_source_if_absent(self):
+    torrent_path = get_torrent_path("no_source")
+    torrent_data = decode_torrent_file(torrent_path)
+    hasher = SourceVariantHasher.from_buffer(read_torrent_buffer(torrent_path))
+    expected = reencoded_infohash({b"info": {**torrent_data[b"info"], b"source": b"RED"}})
+
+    assert hasher.infohash_for_source(b"RED") == expected
+
+  def test_removes_source_if_none(self):
+    torrent_path = get_torrent_path("red_source")
+    torrent_data = decode_torrent_file(torrent_path)
+    hasher = SourceVariantHasher.from_buffer(read_torrent_buffer(torrent_path))
+    info_without_source = {k: v for k, v in torrent_data[b"info"].items() if k != b"source"}
+
+    assert hasher.infohash_for_source(None) == reencoded_infohash({b"info": info_without_source})
+
+  def test_can_be_built_from_raw_buffer(self):
+    torrent_path = get_torrent_path("red_source")
+    with open(torrent_path, "rb") as f:
+      hasher = SourceVariantHasher.from_buffer(f.read())
+
+    assert hasher.infohash_for_source(b"RED") == reencoded_infohash(decode_torrent_file(torrent_path))
+
+  def test_returns_hashes_for_many_sources(self):
+    hasher = SourceVariantHasher.from_buffer(b"d4:infod6:source3:REDee")
+
+    assert hasher.infohashes_for_sources([b"RED", b"OPS"]) == [
+      "FD2F1D966DF7E2E35B0CF56BC8510C6BB4D44467",
+      "4F36F59992B6F7CB6EB6C2DEE06DD66AC81A981B",
+    ]
+
+  def test_raises_if_no_info_key(self):
+    with pytest.raises(TorrentDecodingError):
+      SourceVariantHasher.from_buffer(b"d8:announce3:fooe")
+
 
-class TestRecalculateHashForNewSource(SetupTeardown):
-  def test_replaces_source_and_returns_hash(self):
-    torrent_data = {b"info": {b"source": b"RED"}}
-    new_source = b"OPS"
+class TestReadTorrentBuffer(SetupTeardown):
+  def test_reads_small_files_into_memory(self):
+    result = read_torrent_buffer(get_torrent_path("red_source"))
 
-    result = recalculate_hash_for_new_source(torrent_data, new_source)
+    assert isinstance(result, bytes)
 
-    assert result == "4F36F59992B6F7CB6EB6C2DEE06DD66AC81A981B"
+  def test_maps_files_at_or_above_threshold(self):
+    torrent_path = get_torrent_path("red_source")
+    result = read_torrent_buffer(torrent_path, mmap_threshold=0)
 
-  def test_doesnt_mutate_original_dict(self):
-    torrent_data = {b"info": {b"source": b"RED"}}
-    new_source = b"OPS"
+    with open(torrent_path, "rb") as f:
+      assert isinstance(result, mmap.mmap)
+      assert result[:] == f.read()
 
-    recalculate_hash_for_new_source(torrent_data, new_source)
+  def test_never_maps_if_threshold_is_none(self):
+    assert isinstance(read_torrent_buffer(get_torrent_path("red_source"), mmap_threshold=None), bytes)
 
-    assert torrent_data == {b"info": {b"source": b"RED"}}
+  def test_mapped_buffers_work_with_hashers_and_lazy_reader(self):
+    torrent_path = get_torrent_path("red_source")
+    mapped = read_torrent_buffer(torrent_path, mmap_threshold=0)
+    expected = reencoded_infohash(decode_torrent_file(torrent_path))
 
+    assert calculate_infohash_from_buffer(mapped) == expected
+    assert SourceVariantHasher.from_buffer(mapped).infohash_for_source(b"RED") == expected
+    assert LazyDict(mapped)[b"info"][b"source"] == b"RED"
+    assert LazyDict(mapped)[b"info"][b"name"] == decode_torrent_file(torrent_path)[b"info"][b"name"]
 
-class TestGetTorrentData(SetupTeardown):
-  def test_returns_torrent_data(self):
-    result = get_bencoded_data(get_torrent_path("no_source"))
 
-    assert isinstance(result, dict)
-    assert b"info" in result
+class TestGetLazyTorrentData(SetupTeardown):
+  def test_returns_lazy_torrent_data(self):
+    result = get_lazy_bencoded_data(get_torrent_path("red_source"))
+
+    assert result[b"info"][b"source"] == b"RED"
+    assert result[b"info"][b"files"] == decode_torrent_file(get_torrent_path("red_source"))[b"info"][b"files"]
+
+  def test_works_with_existing_accessors(self):
+    result = get_lazy_bencoded_data(get_torrent_path("red_source"))
+
+    assert get_source(result) == b"RED"
+    assert get_name(result) == b"Big Buck Bunny"
+    assert get_origin_tracker(result) == RedTracker
 
   def test_returns_none_on_error(self):
-    result = get_bencoded_data(get_torrent_path("broken"))
+    assert get_lazy_bencoded_data(get_torrent_path("broken")) is None
+    assert get_lazy_bencoded_data("/tmp/nonexistent.torrent") is None
 
-    assert result is None
 
+class TestGetTorrentSkeleton(SetupTeardown):
+  def test_returns_everything_but_pieces(self):
+    torrent_path = get_torrent_path("red_source")
+    full_data = decode_torrent_file(torrent_path)
+    result = bencoder.decode(get_torrent_skeleton(torrent_path).buffer)
 
-class TestSaveTorrentData(SetupTeardown):
-  def test_saves_torrent_data(self):
-    torrent_data = {b"info": {b"source": b"RED"}}
-    filename = "/tmp/test_save_bencoded_data.torrent"
+    assert result[b"info"][b"pieces"] == b""
+    assert {**result[b"info"], b"pieces": full_data[b"info"][b"pieces"]} == full_data[b"info"]
+    assert {k: v for k, v in result.items() if k != b"info"} == {k: v for k, v in full_data.items() if k != b"info"}
 
-    save_bencoded_data(filename, torrent_data)
+  def test_raises_if_read_size_is_too_small(self):
+    with pytest.raises(TorrentDecodingError):
+      get_torrent_skeleton(get_torrent_path("red_source"), read_size=64)
 
-    with open(filename, "rb") as f:
-      result = f.read()
+  def test_raises_if_torrent_has_no_pieces(self):
+    with pytest.raises(TorrentDecodingError):
+      get_torrent_skeleton(get_torrent_path("no_info"))
 
-    assert result == b"d4:infod6:source3:REDee"
+    with pytest.raises(TorrentDecodingError):
+      get_torrent_skeleton(get_torrent_path("broken"))
 
-    os.remove(filename)
 
-  def test_returns_filename(self):
-    torrent_data = {b"info": {b"source": b"RED"}}
-    filename = "/tmp/test_save_bencoded_data.torrent"
+class TestSniffOriginTracker(SetupTeardown):
+  def test_returns_tracker_based_on_source(self):
+    assert sniff_origin_tracker(get_torrent_path("red_source")) == RedTracker
+    assert sniff_origin_tracker(get_torrent_path("ops_source")) == OpsTracker
 
-    result = save_bencoded_data(filename, torrent_data)
+  def test_returns_tracker_based_on_announce(self):
+    assert sniff_origin_tracker(get_torrent_path("red_announce")) == RedTracker
+    assert sniff_origin_tracker(get_torrent_path("ops_announce")) == OpsTracker
 
-    assert result == filename
+  def test_returns_none_if_no_match(self):
+    assert sniff_origin_tracker(get_torrent_path("no_source")) is None
+
+
+class TestSpliceTorrent(SetupTeardown):
+  def test_matches_reencoded_torrent(self):
+    torrent_path = get_torrent_path("red_source")
+    torrent_data = decode_torrent_file(torrent_path)
+    torrent_data[b"announce"] = b"https://home.opsfet.ch/bar/announce"
+    torrent_data[b"comment"] = b"https://orpheus.network/torrents.php?torrentid=123"
+    torrent_data[b"info"][b"source"] = b"OPS"
+
+    with open(torrent_path, "rb") as f:
+      segments = splice_torrent(
+        f.read(),
+        {b"announce": torrent_data[b"announce"], b"comment": torrent_data[b"comment"]},
+        {b"source": b"OPS"},
+      )
+
+    assert b"".join(segments) == bencoder.encode(torrent_data)
+
+  def test_inserts_missing_items(self):
+    segments = splice_torrent(b"d4:infod4:name3:fooee", {b"announce": b"bar"}, {b"source": b"OPS"})
+
+    assert b"".join(segments) == b"d8:announce3:bar4:infod4:name3:foo6:source3:OPSee"
+
+  def test_raises_if_no_info_key(self):
+    with pytest.raises(TorrentDecodingError):
+      splice_torrent(b"d8:announce3:fooe", {}, {b"source": b"OPS"})
 
+
+class TestSaveSplicedData(SetupTeardown):
+  def test_saves_segments(self):
+    filename = "/tmp/test_save_spliced_data.torrent"
+    data = b"d4:infod6:source3:REDee"
+
+    result = save_spliced_data(filename, [memoryview(data)[:16], b"3:OPS", memoryview(data)[21:]])
+
+    with open(filename, "rb") as f:
+      assert f.read() == b"d4:infod6:source3:OPSee"
+
+    assert result == filename
     os.remove(filename)
 
-  def test_creates_parent_directory(self):
-    torrent_data = {b"info": {b"source": b"RED"}}
-    filename = "/tmp/output/foo/test_save_bencoded_data.torrent"
+  def test_leaves_no_temporary_files(self):
+    filename = "/tmp/output/test_save_spliced_data.torrent"
 
-    save_bencoded_data(filename, torrent_data)
+    save_spliced_data(filename, [b"de"])
+
+    assert os.listdir("/tmp/output") == ["test_save_spliced_data.torrent"]
+
+  def test_keeps_existing_file_and_removes_temporary_file_if_writing_fails(self):
+    filename = "/tmp/output/test_save_spliced_data.torrent"
+    save_spliced_data(filename, [b"de"])
+
+    with pytest.raises(TypeError):
+      save_spliced_data(filename, [b"d4:", None])
+
+    with open(filename, "rb") as f:
+      assert f.read() == b"de"
+    assert os.listdir("/tmp/output") == ["test_save_spliced_data.torrent"]
+
+  def test_creates_parent_directory(self):
+    filename = "/tmp/output/foo/test_save_spliced_data.torrent"
 
-    assert os.path.exists("/tmp/output/foo")
+    save_spliced_data(filename, [b"de"])
 
+    assert os.path.exists(filename)
     os.remove(filename)
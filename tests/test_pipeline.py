@@ -0,0 +1,362 @@
+import os
+import re
+import threading
+import requests_mock
+
+from unittest.mock import MagicMock, patch
+
+from .helpers import SetupTeardown, get_torrent_path, copy_and_mkdir
+
+from src.database import Database
+from src.errors import TorrentExistsInClientError, TrackerUnavailableError
+from src.index import build_infohash_index
+from src.parser import calculate_infohash_from_file
+from src.pipeline import UNSCANNED, ScanBudget, ScanPipeline
+from src.scan_state import RecheckPolicy, ScanState
+from src.torrent import load_source_torrent
+from src.trackers import OpsTracker, RedTracker
+
+
+def run_in_thread(pipeline, filepaths, timeout=5):
+  # Fails the test instead of hanging it if the pipeline never finishes
+  outcome = {}
+
+  def run():
+    try:
+      outcome["jobs"] = list(pipeline.run(filepaths))
+    except Exception as e:
+      outcome["error"] = e
+
+  thread = threading.Thread(target=run, daemon=True)
+  thread.start()
+  thread.join(timeout)
+  assert not thread.is_alive()
+
+  return outcome
+
+
+class TestScanBudget(SetupTeardown):
+  def test_is_unlimited_by_default(self):
+    budget = ScanBudget()
+
+    assert budget.reserve(1000)
+    assert not budget.exhausted()
+
+  def test_reserves_and_refunds_api_calls(self):
+    budget = ScanBudget(max_api_calls=4)
+
+    assert budget.reserve(3)
+    assert not budget.reserve(3)
+
+    budget.refund(2)
+
+    assert budget.api_calls == 1
+    assert budget.reserve(3)
+    assert budget.exhausted()
+
+  def test_runs_out_at_deadline(self):
+    budget = ScanBudget(max_runtime=0)
+
+    assert budget.exhausted()
+    assert not budget.reserve(1)
+
+
+class TestScanPipeline(SetupTeardown):
+  def test_yields_jobs_in_input_order(self, red_api, ops_api):
+    filepaths = []
+    for i, name in enumerate(["red_source", "broken", "no_source", "ops_source"] * 5):
+      filepaths.append(copy_and_mkdir(get_torrent_path(name), f"/tmp/input/{i}-{name}.torrent"))
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      pipeline = ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}, workers=4, queue_size=2)
+      jobs = list(pipeline.run(filepaths))
+
+    assert [job.filepath for job in jobs] == filepaths
+    assert [job.status for job in jobs[:4]] == ["not_found", "error", "skipped", "not_found"]
+
+  def test_generates_torrents(self, red_api, ops_api):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      [job] = ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}).run([filepath])
+
+    assert job.status == "generated"
+    assert job.message == (
+      "Torrent can be cross-seeded to OPS; successfully generated as '/tmp/output/OPS/foo [OPS].torrent'."
+    )
+    assert job.meta is None
+
+  def test_injects_generated_torrents(self, red_api, ops_api):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    injector = MagicMock()
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      [job] = ScanPipeline("/tmp/output", red_api, ops_api, injector, {}, {}).run([filepath])
+
+    assert job.status == "generated"
+    assert injector.inject_torrent.call_count == 1
+
+  def test_reports_injection_errors(self, red_api, ops_api):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    injector = MagicMock()
+    injector.inject_torrent.side_effect = TorrentExistsInClientError("Torrent exists in client")
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      [job] = ScanPipeline("/tmp/output", red_api, ops_api, injector, {}, {}).run([filepath])
+
+    assert job.status == "already_exists"
+    assert job.message == "Torrent exists in client"
+
+  def test_loads_ahead_of_lookups(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/first.torrent"),
+      copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/input/second.torrent"),
+    ]
+    second_loaded = threading.Event()
+
+    def load(filepath, cache):
+      meta = load_source_torrent(filepath, cache)
+      if filepath == filepaths[1]:
+        second_loaded.set()
+
+      return meta
+
+    def generate(filepath, *args, **kwargs):
+      # The first lookup can only finish once the second torrent has been loaded in the background
+      if filepath == filepaths[0]:
+        assert second_loaded.wait(5)
+
+      raise Exception("Lookup failed")
+
+    with (
+      patch("src.pipeline.load_source_torrent", side_effect=load),
+      patch("src.pipeline.generate_new_torrent_from_file", side_effect=generate),
+    ):
+      jobs = list(ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}, workers=2).run(filepaths))
+
+    assert [job.message for job in jobs] == ["Lookup failed", "Lookup failed"]
+
+  def test_looks_up_on_each_tracker_in_parallel(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/first.torrent"),
+      copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/input/second.torrent"),
+    ]
+    red_lookup_started = threading.Event()
+
+    def generate(filepath, *args, **kwargs):
+      # The first torrent is looked up on OPS, which can only finish once the second one's RED lookup is running
+      if filepath == filepaths[0]:
+        assert red_lookup_started.wait(5)
+        raise Exception("OPS lookup failed")
+
+      red_lookup_started.set()
+      raise Exception("RED lookup failed")
+
+    with patch("src.pipeline.generate_new_torrent_from_file", side_effect=generate):
+      jobs = list(ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}).run(filepaths))
+
+    assert [job.message for job in jobs] == ["OPS lookup failed", "RED lookup failed"]
+
+  def test_defers_lookups_on_unavailable_tracker(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/first.torrent"),
+      copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/input/second.torrent"),
+    ]
+    lookups = []
+
+    def generate(filepath, *args, **kwargs):
+      lookups.append(filepath)
+      # OPS is down the first time the first torrent is looked up on it
+      if filepath == filepaths[0] and lookups.count(filepath) == 1:
+        raise TrackerUnavailableError("OPS is unavailable")
+
+      new_tracker = OpsTracker if filepath == filepaths[0] else RedTracker
+      return new_tracker, f"/tmp/output/{os.path.basename(filepath)}", False
+
+    with patch("src.pipeline.generate_new_torrent_from_file", side_effect=generate):
+      jobs = list(ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}).run(filepaths))
+
+    # The lanes run side by side, so only the order within the OPS lane is certain
+    assert lookups.count(filepaths[0]) == 2
+    assert lookups.count(filepaths[1]) == 1
+    assert [job.filepath for job in jobs] == filepaths
+    assert [job.status for job in jobs] == ["generated", "generated"]
+
+  def test_gives_up_on_deferred_lookups_if_tracker_stays_unavailable(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/first.torrent"),
+      copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/input/second.torrent"),
+    ]
+    for _ in range(ops_api.circuit_breaker.failure_threshold):
+      ops_api.circuit_breaker.record_failure()
+
+    with requests_mock.Mocker() as m, patch("src.pipeline.sleep") as mock_sleep:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      jobs = list(ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}).run(filepaths))
+
+    assert [job.status for job in jobs] == ["error", "generated"]
+    assert jobs[0].message == "OPS is unavailable, so this torrent will be looked up again next scan."
+    assert 0 < mock_sleep.call_args[0][0] <= ops_api.circuit_breaker.reset_timeout
+    assert not any("orpheus" in request.url for request in m.request_history)
+
+  def test_looks_up_copies_of_a_torrent_once(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{name}.torrent")
+      for name in ["BT_backup", "watch", "backup"]
+    ]
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      jobs = list(ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}).run(filepaths))
+      lookups = [request for request in m.request_history if "action=torrent" in request.url]
+
+    assert [job.status for job in jobs] == ["not_found"] * 3
+    assert len({job.message for job in jobs}) == 1
+    assert len(lookups) == len(OpsTracker.source_flags_for_creation())
+
+  def test_shares_generated_torrent_with_copies(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{name}.torrent") for name in ["BT_backup", "watch"]
+    ]
+    injector = MagicMock()
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      jobs = list(ScanPipeline("/tmp/output", red_api, ops_api, injector, {}, {}).run(filepaths))
+      lookups = [request for request in m.request_history if "action=torrent" in request.url]
+
+    assert [job.status for job in jobs] == ["generated", "already_exists"]
+    assert jobs[1].new_torrent_filepath == "/tmp/output/OPS/foo [OPS].torrent"
+    assert len(lookups) == 1
+    assert injector.inject_torrent.call_count == 2
+
+  def test_records_outcomes_in_scan_state(self, red_api, ops_api):
+    generated = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    skipped = copy_and_mkdir(get_torrent_path("no_source"), "/tmp/input/no_source.torrent")
+    input_infohashes = build_infohash_index([generated, skipped])
+    scan_state = ScanState(Database(":memory:"))
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      pipeline = ScanPipeline("/tmp/output", red_api, ops_api, None, input_infohashes, {}, scan_state=scan_state)
+      list(pipeline.run([generated, skipped]))
+
+    generated_state = scan_state.get(calculate_infohash_from_file(generated))
+    assert generated_state["status"] == "generated"
+    assert generated_state["source_flag"] == b"OPS"
+    assert generated_state["output_path"] == "/tmp/output/OPS/foo [OPS].torrent"
+    assert scan_state.get(calculate_infohash_from_file(skipped))["status"] == "skipped"
+
+  def test_finishes_settled_torrents_without_loading_them(self, red_api, ops_api):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    infohash = calculate_infohash_from_file(filepath)
+    scan_state = ScanState(Database(":memory:"))
+    scan_state.record(infohash, "not_found", "Torrent could not be found on OPS")
+    checked_at = scan_state.get(infohash)["checked_at"]
+
+    with patch("src.pipeline.load_source_torrent") as mock_load, requests_mock.Mocker() as m:
+      pipeline = ScanPipeline("/tmp/output", red_api, ops_api, None, {infohash: filepath}, {}, scan_state=scan_state)
+      [job] = pipeline.run([filepath])
+
+    assert mock_load.call_count == 0
+    assert m.call_count == 0
+    assert (job.status, job.message) == ("not_found", "Torrent could not be found on OPS")
+    assert scan_state.get(infohash)["checked_at"] == checked_at
+
+  def test_injects_torrents_generated_by_an_earlier_scan_without_injector(self, red_api, ops_api):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    input_infohashes = build_infohash_index([filepath])
+    scan_state = ScanState(Database(":memory:"))
+    injector = MagicMock()
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      pipeline = ScanPipeline("/tmp/output", red_api, ops_api, None, input_infohashes, {}, scan_state=scan_state)
+      [first_job] = pipeline.run([filepath])
+      lookups = m.call_count
+
+      pipeline = ScanPipeline("/tmp/output", red_api, ops_api, injector, input_infohashes, {}, scan_state=scan_state)
+      [second_job] = pipeline.run([filepath])
+
+      assert m.call_count == lookups
+
+    assert first_job.status == "generated"
+    assert second_job.status == "already_exists"
+    assert injector.inject_torrent.call_count == 1
+    assert injector.inject_torrent.call_args[0][:3] == (filepath, "/tmp/output/OPS/foo [OPS].torrent", "OPS")
+
+  def test_spends_recheck_budget_on_most_promising_torrents(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent"),
+      copy_and_mkdir(get_torrent_path("red_announce"), "/tmp/input/red_announce.torrent"),
+    ]
+    input_infohashes = build_infohash_index(filepaths)
+    old_infohash, new_infohash = [calculate_infohash_from_file(filepath) for filepath in filepaths]
+    scan_state = ScanState(Database(":memory:"), RecheckPolicy(base_interval=0))
+    scan_state.record(old_infohash, "not_found", "Torrent could not be found on OPS", added_at=1)
+    scan_state.record(new_infohash, "not_found", "Torrent could not be found on OPS", added_at=2)
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      pipeline = ScanPipeline(
+        "/tmp/output", red_api, ops_api, None, input_infohashes, {}, scan_state=scan_state, recheck_budget=3
+      )
+      jobs = list(pipeline.run(filepaths))
+
+    assert [job.status for job in jobs] == ["not_found", "not_found"]
+    assert [job.from_scan_state for job in jobs] == [True, False]
+    assert scan_state.get(old_infohash)["attempts"] == 1
+    assert scan_state.get(new_infohash)["attempts"] == 2
+
+  def test_stops_looking_up_once_budget_runs_out(self, red_api, ops_api):
+    filepaths = [
+      copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/first.torrent"),
+      copy_and_mkdir(get_torrent_path("broken_name"), "/tmp/input/second.torrent"),
+    ]
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+      red_api.announce_url
+      ops_api.announce_url
+
+      budget = ScanBudget(max_api_calls=3)
+      jobs = list(ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}, budget=budget).run(filepaths))
+
+    assert jobs[0].status == "not_found"
+    assert all(job.status == UNSCANNED for job in jobs[1:])
+    assert budget.api_calls == 3
+
+  def test_raises_if_a_stage_fails(self, red_api, ops_api):
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    scan_state = ScanState(Database(":memory:"))
+
+    with patch.object(scan_state, "settled_result", side_effect=RuntimeError("database is locked")):
+      pipeline = ScanPipeline("/tmp/output", red_api, ops_api, None, {}, {}, scan_state=scan_state)
+      outcome = run_in_thread(pipeline, [filepath])
+
+    assert str(outcome["error"]) == "database is locked"
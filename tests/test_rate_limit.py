@@ -0,0 +1,191 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import pytest
+
+from time import monotonic
+from unittest.mock import patch
+
+from .helpers import SetupTeardown
+
+from src.rate_limit import SHARED_RATE_LIMIT_DIRECTORY, SharedTokenBucket, TokenBucket, create_rate_limiter
+
+
+class FakeClock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class TestTokenBucket(SetupTeardown):
+  def test_starts_full_and_allows_bursts(self):
+    bucket = TokenBucket(10, capacity=3, clock=FakeClock())
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+  def test_refills_one_token_per_interval_up_to_capacity(self):
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=2, clock=clock)
+    bucket.try_acquire()
+    bucket.try_acquire()
+
+    clock.now = 9
+    assert not bucket.try_acquire()
+    clock.now = 10
+    assert bucket.try_acquire()
+    clock.now = 100
+    assert [bucket.try_acquire() for _ in range(3)] == [True, True, False]
+
+  def test_never_limits_without_interval(self):
+    bucket = TokenBucket(0)
+
+    assert all(bucket.acquire(timeout=0) for _ in range(100))
+
+  def test_spaces_requests_by_interval(self):
+    bucket = TokenBucket(0.05)
+
+    started_at = monotonic()
+    for _ in range(3):
+      bucket.acquire()
+
+    assert monotonic() - started_at >= 0.1
+
+  def test_gives_up_after_timeout(self):
+    bucket = TokenBucket(10)
+    bucket.acquire()
+
+    assert not bucket.acquire(timeout=0.01)
+
+  def test_is_thread_safe(self):
+    bucket = TokenBucket(0.01, capacity=2)
+
+    def acquire_many():
+      for _ in range(5):
+        bucket.acquire()
+
+    started_at = monotonic()
+    threads = [threading.Thread(target=acquire_many) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    # 20 requests with 2 free at the start need at least 18 intervals
+    assert monotonic() - started_at >= 0.18
+    assert bucket.metrics.acquired == 20
+
+  def test_acquires_asynchronously(self):
+    bucket = TokenBucket(0.05)
+
+    async def acquire_twice():
+      await asyncio.gather(bucket.acquire_async(), bucket.acquire_async())
+
+    started_at = monotonic()
+    asyncio.run(acquire_twice())
+
+    assert monotonic() - started_at >= 0.05
+    assert bucket.metrics.acquired == 2
+
+  def test_records_wait_times(self):
+    bucket = TokenBucket(0.05)
+    bucket.acquire()
+    bucket.acquire()
+
+    metrics = bucket.metrics.snapshot()
+
+    assert metrics["acquired"] == 2
+    assert metrics["waited"] == 1
+    assert metrics["max_wait"] >= 0.04
+    assert metrics["average_wait"] == pytest.approx(metrics["total_wait"] / 2)
+
+  def test_rejects_invalid_settings(self):
+    with pytest.raises(ValueError):
+      TokenBucket(1, capacity=0)
+
+
+def acquire_from_shared_bucket(path, count):
+  bucket = SharedTokenBucket(path, 0.05)
+  for _ in range(count):
+    bucket.acquire()
+
+
+class TestSharedTokenBucket(SetupTeardown):
+  def test_shares_tokens_between_instances(self):
+    first = SharedTokenBucket("/tmp/rate-limits/shared.bucket", 10, capacity=2)
+    second = SharedTokenBucket("/tmp/rate-limits/shared.bucket", 10, capacity=2)
+
+    assert first.try_acquire()
+    assert second.try_acquire()
+    assert not first.try_acquire()
+    assert not second.try_acquire()
+
+  def test_keeps_separate_files_apart(self):
+    first = SharedTokenBucket("/tmp/rate-limits/first.bucket", 10)
+    second = SharedTokenBucket("/tmp/rate-limits/second.bucket", 10)
+
+    assert first.try_acquire()
+    assert second.try_acquire()
+
+  def test_shares_rate_between_processes(self):
+    context = multiprocessing.get_context("spawn")
+    processes = [
+      context.Process(target=acquire_from_shared_bucket, args=("/tmp/rate-limits/processes.bucket", 2))
+      for _ in range(3)
+    ]
+
+    started_at = monotonic()
+    for process in processes:
+      process.start()
+    for process in processes:
+      process.join()
+
+    # 6 requests with 1 free at the start need at least 5 intervals, no matter how many processes make them
+    assert monotonic() - started_at >= 0.25
+    assert all(process.exitcode == 0 for process in processes)
+
+  def test_starts_full_if_state_file_is_damaged(self):
+    os.makedirs("/tmp/rate-limits", exist_ok=True)
+    with open("/tmp/rate-limits/damaged.bucket", "wb") as f:
+      f.write(b"foo")
+
+    assert SharedTokenBucket("/tmp/rate-limits/damaged.bucket", 10).try_acquire()
+
+  def test_limits_privately_if_state_file_cannot_be_opened(self):
+    bucket = SharedTokenBucket("/tmp/rate-limits/unopenable.bucket", 10)
+    os.makedirs("/tmp/rate-limits/unopenable.bucket")
+
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+  def test_refuses_directory_of_another_user(self):
+    os.makedirs("/tmp/rate-limits", exist_ok=True)
+
+    with patch("src.rate_limit.os.getuid", return_value=os.getuid() + 1):
+      with pytest.raises(PermissionError):
+        SharedTokenBucket("/tmp/rate-limits/shared.bucket", 10)
+
+
+class TestCreateRateLimiter(SetupTeardown):
+  def test_creates_private_bucket_without_shared_directory(self):
+    assert type(create_rate_limiter(2)) is TokenBucket
+
+  def test_creates_shared_bucket_per_key(self):
+    first = create_rate_limiter(2, shared_directory="/tmp/rate-limits", key="secret")
+    second = create_rate_limiter(2, shared_directory="/tmp/rate-limits", key="secret")
+    other = create_rate_limiter(2, shared_directory="/tmp/rate-limits", key="other")
+
+    assert isinstance(first, SharedTokenBucket)
+    assert first.path == second.path != other.path
+    assert "secret" not in first.path
+
+  def test_falls_back_to_private_bucket_if_shared_directory_is_unusable(self):
+    os.makedirs("/tmp/rate-limits", exist_ok=True)
+
+    with patch("src.rate_limit.os.getuid", return_value=os.getuid() + 1):
+      assert type(create_rate_limiter(2, shared_directory="/tmp/rate-limits", key="secret")) is TokenBucket
+
+  def test_shares_directory_per_user(self):
+    assert SHARED_RATE_LIMIT_DIRECTORY.endswith(f"fertilizer-rate-limits-{os.getuid()}")
@@ -0,0 +1,129 @@
+from .helpers import SetupTeardown, get_torrent_path, copy_and_mkdir
+
+from src.database import Database
+from src.scan_state import DAY, RecheckPolicy, ScanState
+
+
+def state(checked_at=0, attempts=1, added_at=None, status="not_found"):
+  return {"status": status, "checked_at": checked_at, "attempts": attempts, "added_at": added_at}
+
+
+class TestRecheckPolicy(SetupTeardown):
+  def test_doubles_interval_after_each_miss(self):
+    policy = RecheckPolicy(base_interval=DAY, max_interval=30 * DAY)
+
+    assert policy.next_check_at(state(attempts=1), now=100 * DAY) == DAY
+    assert policy.next_check_at(state(attempts=2), now=100 * DAY) == 2 * DAY
+    assert policy.next_check_at(state(attempts=4), now=100 * DAY) == 8 * DAY
+
+  def test_caps_interval(self):
+    policy = RecheckPolicy(base_interval=DAY, max_interval=30 * DAY)
+
+    assert policy.next_check_at(state(attempts=10), now=100 * DAY) == 30 * DAY
+
+  def test_rechecks_recent_torrents_at_base_interval(self):
+    policy = RecheckPolicy(base_interval=DAY, max_interval=30 * DAY, recent_age=30 * DAY)
+
+    assert policy.next_check_at(state(attempts=10, added_at=80 * DAY), now=100 * DAY) == DAY
+    assert policy.is_due(state(attempts=10, added_at=80 * DAY), now=2 * DAY)
+
+  def test_prioritizes_recent_then_least_missed_then_newest(self):
+    policy = RecheckPolicy(recent_age=30 * DAY)
+    now = 100 * DAY
+    states = {
+      "old_many": state(attempts=5, added_at=DAY),
+      "old_few_older": state(attempts=1, added_at=DAY),
+      "old_few_newer": state(attempts=1, added_at=2 * DAY),
+      "recent": state(attempts=9, added_at=90 * DAY),
+    }
+
+    ordered = sorted(states, key=lambda key: policy.priority(states[key], now))
+
+    assert ordered == ["recent", "old_few_newer", "old_few_older", "old_many"]
+
+
+class TestScanState(SetupTeardown):
+  def test_records_outcomes(self):
+    scan_state = ScanState(Database(":memory:"))
+
+    scan_state.record("ABC", "generated", "Generated", source_flag=b"OPS", output_path="/tmp/output/OPS/foo.torrent")
+
+    state = scan_state.get("ABC")
+    assert state["status"] == "generated"
+    assert state["source_flag"] == b"OPS"
+    assert state["output_path"] == "/tmp/output/OPS/foo.torrent"
+    assert state["checked_at"] > 0
+
+  def test_returns_none_for_unknown_infohashes(self):
+    scan_state = ScanState(Database(":memory:"))
+
+    assert scan_state.get("ABC") is None
+    assert scan_state.settled_result("ABC") is None
+    assert scan_state.settled_result(None) is None
+
+  def test_settles_not_found_and_skipped_torrents(self):
+    scan_state = ScanState(Database(":memory:"))
+    scan_state.record("ABC", "not_found", "Torrent could not be found on OPS")
+    scan_state.record("DEF", "skipped", "Torrent not from OPS or RED based on source or announce URL")
+
+    assert scan_state.settled_result("ABC") == ("not_found", "Torrent could not be found on OPS")
+    assert scan_state.settled_result("DEF") == (
+      "skipped",
+      "Torrent not from OPS or RED based on source or announce URL",
+    )
+
+  def test_settles_generated_torrents_while_output_exists(self):
+    scan_state = ScanState(Database(":memory:"))
+    output_path = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/OPS/foo.torrent")
+    scan_state.record("ABC", "generated", "Generated", output_path=output_path)
+    scan_state.record("DEF", "generated", "Generated", output_path="/tmp/output/OPS/missing.torrent")
+
+    assert scan_state.settled_result("ABC") == ("already_exists", "Torrent was previously generated.")
+    assert scan_state.settled_result("DEF") is None
+
+  def test_does_not_settle_errors(self):
+    scan_state = ScanState(Database(":memory:"))
+    scan_state.record("ABC", "error", "Something went wrong")
+
+    assert scan_state.settled_result("ABC") is None
+
+  def test_counts_repeated_outcomes(self):
+    scan_state = ScanState(Database(":memory:"))
+
+    scan_state.record("ABC", "not_found", "Not found", added_at=123)
+    scan_state.record("ABC", "not_found", "Not found")
+
+    assert scan_state.get("ABC")["attempts"] == 2
+    assert scan_state.get("ABC")["added_at"] == 123
+
+    scan_state.record("ABC", "skipped", "Skipped")
+
+    assert scan_state.get("ABC")["attempts"] == 1
+
+  def test_unsettles_not_found_torrents_due_for_recheck(self):
+    scan_state = ScanState(Database(":memory:"), RecheckPolicy(base_interval=0))
+    scan_state.record("ABC", "not_found", "Torrent could not be found on OPS")
+
+    assert scan_state.settled_result("ABC") is None
+    assert scan_state.settled_result("ABC", recheck=False) == ("not_found", "Torrent could not be found on OPS")
+
+  def test_lists_due_rechecks_by_priority(self):
+    scan_state = ScanState(Database(":memory:"), RecheckPolicy(base_interval=0))
+    scan_state.record("OLD", "not_found", "Not found", added_at=1)
+    scan_state.record("NEW", "not_found", "Not found", added_at=2)
+    scan_state.record("SKIPPED", "skipped", "Skipped")
+
+    assert scan_state.prioritized_rechecks(["OLD", "NEW", "SKIPPED", "UNKNOWN"]) == ["NEW", "OLD"]
+
+  def test_adds_columns_to_existing_tables(self):
+    database = Database(":memory:")
+    database.execute(
+      "CREATE TABLE scan_state (infohash TEXT PRIMARY KEY, status TEXT NOT NULL, message TEXT, "
+      "source_flag BLOB, output_path TEXT, checked_at REAL NOT NULL)"
+    )
+    database.execute("INSERT INTO scan_state VALUES ('ABC', 'not_found', 'Not found', NULL, NULL, 0)")
+
+    scan_state = ScanState(database)
+
+    assert scan_state.get("ABC")["attempts"] == 1
+    assert scan_state.get("ABC")["added_at"] is None
@@ -1,16 +1,22 @@
 import os
 import re
 import shutil
+import threading
 import pytest
 import requests_mock
 
-from unittest.mock import MagicMock
+from unittest.mock import ANY, MagicMock, patch
 from colorama import Fore
 
 from .helpers import SetupTeardown, get_torrent_path, copy_and_mkdir
 
+from src.database import Database
 from src.errors import TorrentExistsInClientError, TorrentDecodingError
-from src.scanner import scan_torrent_directory, scan_torrent_file
+from src.parser import calculate_infohash_from_file
+from src.pipeline import ScanBudget
+from src.scan_state import ScanState
+from src.sharding import Shard
+from src.scanner import scan_torrent_directory, scan_torrent_file, watch_torrent_directory
 
 
 class TestScanTorrentFile(SetupTeardown):
@@ -55,7 +61,7 @@ class TestScanTorrentFile(SetupTeardown):
       scan_torrent_file("/tmp/input/red_source.torrent", "/tmp/output", red_api, ops_api, injector_mock)
 
     injector_mock.inject_torrent.assert_called_once_with(
-      "/tmp/input/red_source.torrent", "/tmp/output/OPS/foo [OPS].torrent", "OPS"
+      "/tmp/input/red_source.torrent", "/tmp/output/OPS/foo [OPS].torrent", "OPS", source_torrent_meta=ANY
     )
 
   def test_calls_injector_if_torrent_is_duplicate(self, red_api, ops_api):
@@ -72,7 +78,7 @@ class TestScanTorrentFile(SetupTeardown):
       scan_torrent_file("/tmp/input/red_source.torrent", "/tmp/output", red_api, ops_api, injector_mock)
 
     injector_mock.inject_torrent.assert_called_once_with(
-      "/tmp/input/red_source.torrent", "/tmp/output/ops_source.torrent", "OPS"
+      "/tmp/input/red_source.torrent", "/tmp/output/ops_source.torrent", "OPS", source_torrent_meta=ANY
     )
 
   def test_doesnt_blow_up_if_other_torrent_name_has_bad_encoding(self, red_api, ops_api):
@@ -190,6 +196,17 @@ class TestScanTorrentDirectory(SetupTeardown):
     assert f"{Fore.LIGHTYELLOW_EX}Torrent was previously generated.{Fore.RESET}" in captured.out
     assert f"{Fore.LIGHTYELLOW_EX}Already exists{Fore.RESET}: 1" in captured.out
 
+  def test_finds_output_torrents_in_tracker_subfolders_without_api_calls(self, capsys, red_api, ops_api):
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/output/OPS/ops_source.torrent")
+
+    with requests_mock.Mocker() as m:
+      print(scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, None))
+      captured = capsys.readouterr()
+
+      assert m.call_count == 0
+      assert f"{Fore.LIGHTYELLOW_EX}Torrent was previously generated.{Fore.RESET}" in captured.out
+
   def test_returns_calls_injector_on_duplicate(self, capsys, red_api, ops_api):
     injector_mock = MagicMock()
     injector_mock.inject_torrent = MagicMock()
@@ -206,7 +223,7 @@ class TestScanTorrentDirectory(SetupTeardown):
     )
     assert f"{Fore.LIGHTYELLOW_EX}Already exists{Fore.RESET}: 1" in captured.out
     injector_mock.inject_torrent.assert_called_once_with(
-      "/tmp/input/red_source.torrent", "/tmp/output/ops_source.torrent", "OPS"
+      "/tmp/input/red_source.torrent", "/tmp/output/ops_source.torrent", "OPS", source_torrent_meta=ANY
     )
 
   def test_lists_torrents_that_already_exist_in_client(self, capsys, red_api, ops_api):
@@ -303,7 +320,7 @@ class TestScanTorrentDirectory(SetupTeardown):
       scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, injector_mock)
 
     injector_mock.inject_torrent.assert_called_once_with(
-      "/tmp/input/red_source.torrent", "/tmp/output/OPS/foo [OPS].torrent", "OPS"
+      "/tmp/input/red_source.torrent", "/tmp/output/OPS/foo [OPS].torrent", "OPS", source_torrent_meta=ANY
     )
 
   def test_doesnt_blow_up_if_other_torrent_name_has_bad_encoding(self, red_api, ops_api):
@@ -339,3 +356,158 @@ class TestScanTorrentDirectory(SetupTeardown):
       m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
 
       scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, None)
+
+
+class TestScanTorrentDirectoryCheckpoints(SetupTeardown):
+  def test_saves_checkpoint_when_budget_runs_out(self, capsys, red_api, ops_api):
+    scan_state = ScanState(Database(":memory:"))
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/a.torrent")
+    copy_and_mkdir(get_torrent_path("broken_name"), "/tmp/input/b.torrent")
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+      ops_api.announce_url
+
+      budget = ScanBudget(max_api_calls=3)
+      scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, None, scan_state=scan_state, budget=budget)
+      captured = capsys.readouterr()
+
+    assert "(1/2) a.torrent" in captured.out
+    assert "b.torrent" not in captured.out
+    assert "Stopped after 1 of 2 torrents" in captured.out
+    assert scan_state.checkpoint("/tmp/input") == "/tmp/input/a.torrent"
+
+  def test_resumes_from_checkpoint_and_clears_it_when_done(self, capsys, red_api, ops_api):
+    scan_state = ScanState(Database(":memory:"))
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/a.torrent")
+    copy_and_mkdir(get_torrent_path("red_announce"), "/tmp/input/b.torrent")
+    scan_state.save_checkpoint("/tmp/input", "/tmp/input/a.torrent")
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, None, scan_state=scan_state)
+      captured = capsys.readouterr()
+
+    assert "Resuming the previous scan after a.torrent" in captured.out
+    assert captured.out.index("(1/2) b.torrent") < captured.out.index("(2/2) a.torrent")
+    assert scan_state.checkpoint("/tmp/input") is None
+
+  def test_settles_every_copy_of_a_torrent_without_api_calls(self, capsys, red_api, ops_api):
+    scan_state = ScanState(Database(":memory:"))
+    for name in ["a", "b"]:
+      copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{name}.torrent")
+    scan_state.record(calculate_infohash_from_file("/tmp/input/a.torrent"), "not_found", "Not found on OPS")
+
+    with requests_mock.Mocker() as m:
+      scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, None, scan_state=scan_state)
+      captured = capsys.readouterr()
+
+    assert m.call_count == 0
+    assert captured.out.count("Not found on OPS") == 2
+
+
+class TestScanTorrentDirectoryShards(SetupTeardown):
+  def test_shards_split_input_directory(self, capsys, red_api, ops_api):
+    for name in ["red_source", "red_announce", "no_source", "broken"]:
+      copy_and_mkdir(get_torrent_path(name), f"/tmp/input/{name}.torrent")
+
+    scanned = []
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      for number in [1, 2]:
+        scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, None, shard=Shard(number, 2))
+        scanned.append(set(re.findall(r"\) (\w+)\.torrent", capsys.readouterr().out)))
+
+    assert not scanned[0] & scanned[1]
+    assert scanned[0] | scanned[1] == {"red_source", "red_announce", "no_source", "broken"}
+
+  def test_puts_copies_of_a_torrent_in_the_same_shard(self, capsys, red_api, ops_api):
+    # Both names belong in the other shard from the torrent's infohash, so assigning any copy by filename splits them
+    for name in ["copy", "watch"]:
+      copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{name}.torrent")
+
+    scanned = []
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      for number in [1, 2]:
+        scan_torrent_directory("/tmp/input", "/tmp/output", red_api, ops_api, None, shard=Shard(number, 2))
+        scanned.append(set(re.findall(r"\) (\w+)\.torrent", capsys.readouterr().out)))
+
+    assert {"copy", "watch"} in scanned
+
+  def test_keeps_checkpoints_per_shard(self, capsys, red_api, ops_api):
+    scan_state = ScanState(Database(":memory:"))
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/a.torrent")
+    copy_and_mkdir(get_torrent_path("broken_name"), "/tmp/input/b.torrent")
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+      ops_api.announce_url
+
+      budget = ScanBudget(max_api_calls=3)
+      scan_torrent_directory(
+        "/tmp/input", "/tmp/output", red_api, ops_api, None, scan_state=scan_state, budget=budget, shard=Shard(1, 1)
+      )
+
+    assert scan_state.checkpoint("/tmp/input") is None
+    assert scan_state.checkpoint("/tmp/input (shard 1/1)") == "/tmp/input/a.torrent"
+
+
+class FakeFileWatch:
+  def __init__(self, batches, stop_event):
+    self.batches = list(batches)
+    self.stop_event = stop_event
+    self.closed = False
+
+  def ready_files(self):
+    if not self.batches:
+      self.stop_event.set()
+      return []
+
+    return self.batches.pop(0)
+
+  def close(self):
+    self.closed = True
+
+
+class TestWatchTorrentDirectory(SetupTeardown):
+  def test_scans_new_torrents(self, capsys, red_api, ops_api):
+    stop_event = threading.Event()
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    file_watch = FakeFileWatch([[filepath]], stop_event)
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      watch_torrent_directory(
+        "/tmp/input", "/tmp/output", red_api, ops_api, None, file_watch=file_watch, stop_event=stop_event
+      )
+      captured = capsys.readouterr()
+
+    assert "red_source.torrent" in captured.out
+    assert "successfully generated as '/tmp/output/OPS/foo [OPS].torrent'" in captured.out
+    assert os.path.isfile("/tmp/output/OPS/foo [OPS].torrent")
+    assert file_watch.closed
+
+  def test_reports_copies_of_watched_torrents_as_already_existing(self, capsys, red_api, ops_api):
+    stop_event = threading.Event()
+    red = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    ops = copy_and_mkdir(get_torrent_path("ops_source"), "/tmp/input/ops_source.torrent")
+    file_watch = FakeFileWatch([[red], [ops]], stop_event)
+
+    with patch("src.scanner.build_infohash_index", return_value={}):
+      watch_torrent_directory(
+        "/tmp/input", "/tmp/output", red_api, ops_api, None, file_watch=file_watch, stop_event=stop_event
+      )
+    captured = capsys.readouterr()
+
+    assert "Torrent already exists in input directory at /tmp/input/red_source.torrent" in captured.out
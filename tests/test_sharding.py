@@ -0,0 +1,36 @@
+import pytest
+
+from hashlib import sha1
+
+from .helpers import SetupTeardown
+
+from src.sharding import Shard
+
+
+class TestShard(SetupTeardown):
+  def test_parses_shard(self):
+    shard = Shard.parse("2/3")
+
+    assert (shard.number, shard.count) == (2, 3)
+    assert str(shard) == "2/3"
+
+  @pytest.mark.parametrize("value", ["", "2", "a/3", "0/3", "4/3", "1/0", "-1/3"])
+  def test_rejects_invalid_shards(self, value):
+    with pytest.raises(ValueError):
+      Shard.parse(value)
+
+  def test_assigns_each_infohash_to_exactly_one_shard(self):
+    shards = [Shard(number, 3) for number in [1, 2, 3]]
+    infohashes = [sha1(bytes([i])).hexdigest().upper() for i in range(30)]
+
+    for infohash in infohashes:
+      assert sum(shard.contains(infohash, "/tmp/foo.torrent") for shard in shards) == 1
+
+    assert all(any(shard.contains(infohash, "") for infohash in infohashes) for shard in shards)
+
+  def test_assigns_torrents_without_infohash_by_filename(self):
+    shards = [Shard(number, 2) for number in [1, 2]]
+
+    for filepath in ["/tmp/a.torrent", "/tmp/b.torrent", "/tmp/c.torrent"]:
+      assert sum(shard.contains(None, filepath) for shard in shards) == 1
+      assert Shard(1, 2).contains(None, filepath) == Shard(1, 2).contains(None, f"/other{filepath}")
@@ -0,0 +1,49 @@
+from .helpers import SetupTeardown
+
+from src.database import Database
+from src.source_flags import UNKNOWN_ERA, SourceFlagStats
+from src.trackers import RedTracker, OpsTracker
+
+# 2017-01-01 and 2023-01-01
+OLD_TORRENT = 1483228800
+NEW_TORRENT = 1672531200
+
+
+class TestSourceFlagStats(SetupTeardown):
+  def test_uses_default_order_without_hits(self):
+    stats = SourceFlagStats(Database(":memory:"))
+
+    assert stats.order(OpsTracker, NEW_TORRENT) == [b"OPS", b"APL", b""]
+    assert stats.order(RedTracker, None) == [b"RED", b"PTH", b""]
+
+  def test_orders_by_hits_in_the_same_era(self):
+    stats = SourceFlagStats(Database(":memory:"))
+    stats.record_hit(OpsTracker, OLD_TORRENT, b"APL")
+    stats.record_hit(OpsTracker, NEW_TORRENT, b"")
+    stats.record_hit(OpsTracker, NEW_TORRENT, b"")
+
+    assert stats.order(OpsTracker, OLD_TORRENT) == [b"APL", b"", b"OPS"]
+    assert stats.order(OpsTracker, NEW_TORRENT) == [b"", b"APL", b"OPS"]
+
+  def test_falls_back_to_hits_in_all_eras(self):
+    stats = SourceFlagStats(Database(":memory:"))
+    stats.record_hit(RedTracker, OLD_TORRENT, b"PTH")
+
+    assert stats.order(RedTracker, None) == [b"PTH", b"RED", b""]
+
+  def test_keeps_trackers_apart(self):
+    stats = SourceFlagStats(Database(":memory:"))
+    stats.record_hit(RedTracker, NEW_TORRENT, b"")
+
+    assert stats.order(OpsTracker, NEW_TORRENT) == [b"OPS", b"APL", b""]
+
+  def test_persists_hits(self):
+    database = Database(":memory:")
+    SourceFlagStats(database).record_hit(OpsTracker, OLD_TORRENT, b"APL")
+
+    assert SourceFlagStats(database).order(OpsTracker, OLD_TORRENT) == [b"APL", b"OPS", b""]
+
+  def test_groups_torrents_into_eras_by_year(self):
+    assert SourceFlagStats.era(OLD_TORRENT) == "2017"
+    assert SourceFlagStats.era(None) == UNKNOWN_ERA
+    assert SourceFlagStats.era(10**20) == UNKNOWN_ERA
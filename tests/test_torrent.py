@@ -1,14 +1,22 @@
+import asyncio
 import os
 import re
+import threading
 import pytest
 import requests_mock
 
-from .helpers import get_torrent_path, SetupTeardown, copy_and_mkdir
+from unittest.mock import MagicMock, patch
 
-from src.trackers import RedTracker
-from src.parser import get_bencoded_data
+from .helpers import decode_torrent_file, get_torrent_path, SetupTeardown, copy_and_mkdir
+
+from src.trackers import RedTracker, OpsTracker
+from src.parser import calculate_infohash_from_file
 from src.errors import TorrentAlreadyExistsError, TorrentDecodingError, UnknownTrackerError, TorrentNotFoundError
-from src.torrent import generate_new_torrent_from_file
+from src.torrent import generate_new_torrent_from_file, generate_new_torrent_from_file_async, load_source_torrent
+from src.async_api import AsyncGazelleAPI
+from src.database import Database
+from src.hash_cache import InfohashCache
+from src.source_flags import SourceFlagStats
 
 
 class TestGenerateNewTorrentFromFile(SetupTeardown):
@@ -19,7 +27,7 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
       torrent_path = get_torrent_path("red_source")
       _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api)
-      parsed_torrent = get_bencoded_data(filepath)
+      parsed_torrent = decode_torrent_file(filepath)
 
       assert os.path.isfile(filepath)
       assert parsed_torrent[b"announce"] == b"https://home.opsfet.ch/bar/announce"
@@ -28,6 +36,19 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
       os.remove(filepath)
 
+  def test_adds_new_torrent_to_output_infohashes(self, red_api, ops_api):
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      output_infohashes = {}
+      torrent_path = get_torrent_path("red_source")
+      _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api, {}, output_infohashes)
+
+      assert output_infohashes == {calculate_infohash_from_file(filepath): filepath}
+
+      os.remove(filepath)
+
   def test_saves_new_torrent_from_ops_to_red(self, red_api, ops_api):
     with requests_mock.Mocker() as m:
       m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
@@ -35,7 +56,7 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
       torrent_path = get_torrent_path("ops_source")
       _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api)
-      parsed_torrent = get_bencoded_data(filepath)
+      parsed_torrent = decode_torrent_file(filepath)
 
       assert parsed_torrent[b"announce"] == b"https://flacsfor.me/bar/announce"
       assert parsed_torrent[b"comment"] == b"https://redacted.ch/torrents.php?torrentid=123"
@@ -50,7 +71,7 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
       torrent_path = get_torrent_path("qbit_ops")
       _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api)
-      parsed_torrent = get_bencoded_data(filepath)
+      parsed_torrent = decode_torrent_file(filepath)
 
       assert parsed_torrent[b"announce"] == b"https://flacsfor.me/bar/announce"
       assert parsed_torrent[b"comment"] == b"https://redacted.ch/torrents.php?torrentid=123"
@@ -67,7 +88,7 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
       new_tracker, filepath, previously_generated = generate_new_torrent_from_file(
         torrent_path, "/tmp", red_api, ops_api
       )
-      get_bencoded_data(filepath)
+      decode_torrent_file(filepath)
 
       assert os.path.isfile(filepath)
       assert new_tracker == RedTracker
@@ -85,7 +106,7 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
       torrent_path = get_torrent_path("ops_source")
       _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api)
-      parsed_torrent = get_bencoded_data(filepath)
+      parsed_torrent = decode_torrent_file(filepath)
 
       assert filepath == "/tmp/RED/foo [PTH].torrent"
       assert parsed_torrent[b"announce"] == b"https://flacsfor.me/bar/announce"
@@ -108,7 +129,7 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
       torrent_path = get_torrent_path("ops_source")
       _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api)
-      parsed_torrent = get_bencoded_data(filepath)
+      parsed_torrent = decode_torrent_file(filepath)
 
       assert filepath == "/tmp/RED/foo.torrent"
       assert parsed_torrent[b"announce"] == b"https://flacsfor.me/bar/announce"
@@ -117,6 +138,40 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
       os.remove(filepath)
 
+  def test_tries_likeliest_source_flag_first(self, red_api, ops_api):
+    torrent_path = get_torrent_path("ops_source")
+    stats = SourceFlagStats(Database(":memory:"))
+    stats.record_hit(RedTracker, load_source_torrent(torrent_path).creation_date, b"")
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api, source_flag_stats=stats)
+      lookups = [request for request in m.request_history if "action=torrent" in request.url]
+
+    assert filepath == "/tmp/RED/foo.torrent"
+    assert len(lookups) == 1
+
+    os.remove(filepath)
+
+  def test_records_which_source_flag_was_found(self, red_api, ops_api):
+    stats = SourceFlagStats(Database(":memory:"))
+
+    with requests_mock.Mocker() as m:
+      m.get(
+        re.compile("action=torrent"),
+        [{"json": self.TORRENT_KNOWN_BAD_RESPONSE}, {"json": self.TORRENT_SUCCESS_RESPONSE}],
+      )
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      torrent_path = get_torrent_path("ops_source")
+      _, filepath, _ = generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api, source_flag_stats=stats)
+
+    assert stats.order(RedTracker, None) == [b"PTH", b"RED", b""]
+
+    os.remove(filepath)
+
   def test_raises_error_if_cannot_decode_torrent(self, red_api, ops_api):
     with pytest.raises(TorrentDecodingError) as excinfo:
       torrent_path = get_torrent_path("broken")
@@ -131,6 +186,13 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
 
     assert str(excinfo.value) == "Torrent not from OPS or RED based on source or announce URL"
 
+  def test_rejects_unknown_tracker_without_full_read(self, red_api, ops_api):
+    with patch("src.torrent.load_torrent_meta") as load_torrent_meta_mock:
+      with pytest.raises(UnknownTrackerError):
+        generate_new_torrent_from_file(get_torrent_path("no_source"), "/tmp", red_api, ops_api)
+
+    load_torrent_meta_mock.assert_not_called()
+
   def test_raises_error_if_infohash_found_in_input(self, red_api, ops_api):
     input_hashes = {"2AEE440CDC7429B3E4A7E4D20E3839DBB48D72C2": "/path/to/foo"}
 
@@ -202,3 +264,128 @@ class TestGenerateNewTorrentFromFile(SetupTeardown):
       generate_new_torrent_from_file(torrent_path, "/tmp", red_api, ops_api)
 
     assert str(excinfo.value) == "Error decoding torrent file"
+
+  def test_uses_given_torrent_meta_instead_of_reading_source(self, red_api, ops_api):
+    source_torrent_meta = load_source_torrent(get_torrent_path("red_source"))
+    output_hashes = {"2AEE440CDC7429B3E4A7E4D20E3839DBB48D72C2": "bar"}
+
+    _, filepath, _ = generate_new_torrent_from_file(
+      "/tmp/missing.torrent", "/tmp", red_api, ops_api, {}, output_hashes, source_torrent_meta=source_torrent_meta
+    )
+
+    assert filepath == "bar"
+
+
+class TestGenerateNewTorrentFromFileAsync(SetupTeardown):
+  def test_saves_new_torrent(self, red_api, ops_api):
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      torrent_path = get_torrent_path("red_source")
+      coroutine = generate_new_torrent_from_file_async(
+        torrent_path, "/tmp", AsyncGazelleAPI(red_api), AsyncGazelleAPI(ops_api)
+      )
+      new_tracker, filepath, previously_generated = asyncio.run(coroutine)
+      parsed_torrent = decode_torrent_file(filepath)
+
+    assert (new_tracker, filepath, previously_generated) == (OpsTracker, "/tmp/OPS/foo [OPS].torrent", False)
+    assert parsed_torrent[b"announce"] == b"https://home.opsfet.ch/bar/announce"
+    assert parsed_torrent[b"info"][b"source"] == b"OPS"
+
+    os.remove(filepath)
+
+  def test_raises_error_if_torrent_not_found(self, red_api, ops_api):
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_KNOWN_BAD_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      coroutine = generate_new_torrent_from_file_async(
+        get_torrent_path("red_source"), "/tmp", AsyncGazelleAPI(red_api), AsyncGazelleAPI(ops_api)
+      )
+
+      with pytest.raises(TorrentNotFoundError):
+        asyncio.run(coroutine)
+
+      assert len([request for request in m.request_history if "action=torrent" in request.url]) == 3
+
+  def test_keeps_disk_and_database_work_off_the_event_loop(self, red_api, ops_api):
+    blocking_threads = []
+    source_flag_stats = MagicMock()
+    source_flag_stats.order.return_value = OpsTracker.source_flags_for_creation()
+    source_flag_stats.record_hit.side_effect = lambda *_: blocking_threads.append(threading.get_ident())
+
+    async def generate():
+      coroutine = generate_new_torrent_from_file_async(
+        get_torrent_path("red_source"),
+        "/tmp",
+        AsyncGazelleAPI(red_api),
+        AsyncGazelleAPI(ops_api),
+        source_flag_stats=source_flag_stats,
+      )
+      return threading.get_ident(), await coroutine
+
+    with (
+      requests_mock.Mocker() as m,
+      patch("src.torrent.save_spliced_data", side_effect=lambda *_: blocking_threads.append(threading.get_ident())),
+    ):
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      loop_thread, (_, _, previously_generated) = asyncio.run(generate())
+
+    assert previously_generated is False
+    assert len(blocking_threads) == 2
+    assert loop_thread not in blocking_threads
+
+
+class TestLoadSourceTorrent(SetupTeardown):
+  def test_returns_torrent_meta(self):
+    result = load_source_torrent(get_torrent_path("ops_source"))
+
+    assert result.origin_tracker == OpsTracker
+    assert result.source == b"OPS"
+
+  def test_raises_error_if_cannot_decode_torrent(self):
+    with pytest.raises(TorrentDecodingError) as excinfo:
+      load_source_torrent(get_torrent_path("broken"))
+
+    assert str(excinfo.value) == "Error decoding torrent file"
+
+  def test_raises_error_if_tracker_not_found(self):
+    with pytest.raises(UnknownTrackerError) as excinfo:
+      load_source_torrent(get_torrent_path("no_source"))
+
+    assert str(excinfo.value) == "Torrent not from OPS or RED based on source or announce URL"
+
+  def test_stores_variant_hashes_in_cache(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+
+    result = load_source_torrent(filepath, cache)
+    infohash, variant_hashes = cache.get(filepath)
+
+    assert infohash == result.infohash
+    assert set(variant_hashes) == {b"OPS", b"APL", b""}
+    assert variant_hashes == result.variant_hashes
+
+  def test_reuses_variant_hashes_from_cache(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    load_source_torrent(filepath, cache)
+
+    with patch("src.metadata.SourceVariantHasher") as mock_hasher:
+      result = load_source_torrent(filepath, cache)
+
+    assert mock_hasher.call_count == 0
+    assert set(result.variant_hashes) == {b"OPS", b"APL", b""}
+
+  def test_ignores_cached_variant_hashes_for_another_infohash(self):
+    cache = InfohashCache(Database(":memory:"))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/red_source.torrent")
+    cache.put(filepath, b"\x00" * 20, {b"OPS": b"\x01" * 20, b"APL": b"\x01" * 20, b"": b"\x01" * 20})
+
+    result = load_source_torrent(filepath, cache)
+
+    assert result.variant_hashes[b"OPS"] != b"\x01" * 20
+    assert cache.get(filepath)[0] == result.infohash
@@ -0,0 +1,149 @@
+import shutil
+import pytest
+
+from unittest.mock import patch
+
+from .helpers import SetupTeardown, get_support_file_path, get_torrent_path, copy_and_mkdir
+
+from src.watcher import WATCHED_EXTENSIONS, InotifyWatcher, PollingWatcher, TorrentFileWatch, create_watcher
+
+
+class FakeWatcher:
+  def __init__(self, batches):
+    self.batches = list(batches)
+
+  def poll(self, timeout):
+    return self.batches.pop(0) if self.batches else []
+
+  def close(self):
+    pass
+
+
+def inotify_watcher(directory):
+  try:
+    return InotifyWatcher(directory)
+  except OSError:
+    pytest.skip("inotify is not available")
+
+
+class TestInotifyWatcher(SetupTeardown):
+  def test_reports_created_and_moved_in_files(self):
+    watcher = inotify_watcher("/tmp/input")
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/output/moved.torrent")
+
+    copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/created.torrent")
+    shutil.move("/tmp/output/moved.torrent", "/tmp/input/moved.torrent")
+    changed = watcher.poll(1)
+    watcher.close()
+
+    assert "/tmp/input/created.torrent" in changed
+    assert "/tmp/input/moved.torrent" in changed
+
+  def test_returns_nothing_when_idle(self):
+    watcher = inotify_watcher("/tmp/input")
+
+    assert watcher.poll(0) == []
+    watcher.close()
+
+
+class TestPollingWatcher(SetupTeardown):
+  def test_reports_new_and_changed_files(self):
+    existing = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/existing.torrent")
+    watcher = PollingWatcher("/tmp/input", interval=0)
+
+    new = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/new.torrent")
+    fastresume = copy_and_mkdir(get_support_file_path("qbit_ops.fastresume"), "/tmp/input/new.fastresume")
+
+    assert sorted(watcher.poll(0)) == sorted([new, fastresume])
+    assert watcher.poll(0) == []
+
+    with open(existing, "ab") as f:
+      f.write(b"more")
+
+    assert watcher.poll(0) == [existing]
+
+  def test_lists_directory_once_per_interval(self):
+    watcher = PollingWatcher("/tmp/input", interval=5)
+
+    with patch("src.watcher.sleep"), patch("src.watcher.scan_files_of_extension", return_value=[]) as mock_scan:
+      with patch("src.watcher.monotonic", return_value=watcher._snapshot_at + 1):
+        assert watcher.poll(1) == []
+      with patch("src.watcher.monotonic", return_value=watcher._snapshot_at + 5):
+        watcher.poll(1)
+
+    assert mock_scan.call_count == len(WATCHED_EXTENSIONS)
+
+
+class TestCreateWatcher(SetupTeardown):
+  def test_falls_back_to_polling(self):
+    with patch("src.watcher.InotifyWatcher", side_effect=OSError("inotify is not available on this system")):
+      watcher = create_watcher("/tmp/input")
+
+    assert isinstance(watcher, PollingWatcher)
+
+
+class TestTorrentFileWatch(SetupTeardown):
+  def test_hands_out_files_once_they_stop_changing(self):
+    file_watch = TorrentFileWatch("/tmp/input", debounce=0.05, watcher=FakeWatcher([["/tmp/input/foo.torrent"]]))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/foo.torrent")
+
+    assert file_watch.ready_files(0) == []
+
+    with patch("src.watcher.monotonic", return_value=10**9):
+      assert file_watch.ready_files(0) == [filepath]
+      assert file_watch.ready_files(0) == []
+
+  def test_waits_for_files_that_are_still_growing(self):
+    file_watch = TorrentFileWatch("/tmp/input", debounce=1, watcher=FakeWatcher([["/tmp/input/foo.torrent"]]))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/foo.torrent")
+
+    with patch("src.watcher.monotonic", return_value=0):
+      file_watch.ready_files(0)
+
+    with open(filepath, "ab") as f:
+      f.write(b"more")
+
+    with patch("src.watcher.monotonic", return_value=5):
+      assert file_watch.ready_files(0) == []
+
+    with patch("src.watcher.monotonic", return_value=10):
+      assert file_watch.ready_files(0) == [filepath]
+
+  def test_treats_fastresume_changes_as_torrent_changes(self):
+    file_watch = TorrentFileWatch("/tmp/input", debounce=1, watcher=FakeWatcher([["/tmp/input/foo.fastresume"]]))
+    filepath = copy_and_mkdir(get_torrent_path("qbit_ops"), "/tmp/input/foo.torrent")
+
+    with patch("src.watcher.monotonic", return_value=0):
+      file_watch.ready_files(0)
+
+    with patch("src.watcher.monotonic", return_value=5):
+      assert file_watch.ready_files(0) == [filepath]
+
+  def test_ignores_other_files(self):
+    file_watch = TorrentFileWatch("/tmp/input", debounce=0, watcher=FakeWatcher([["/tmp/input/foo.txt"]]))
+
+    assert file_watch.ready_files(0) == []
+
+  def test_lists_directory_when_events_were_lost(self):
+    file_watch = TorrentFileWatch("/tmp/input", debounce=0, watcher=FakeWatcher([None]))
+    filepath = copy_and_mkdir(get_torrent_path("red_source"), "/tmp/input/foo.torrent")
+
+    assert file_watch.ready_files(0) == [filepath]
+
+  def test_ignores_resume_data_rewrites_of_existing_torrents(self):
+    copy_and_mkdir(get_torrent_path("qbit_ops"), "/tmp/input/foo.torrent")
+    file_watch = TorrentFileWatch("/tmp/input", debounce=0, watcher=FakeWatcher([["/tmp/input/foo.fastresume"], None]))
+
+    assert file_watch.ready_files(0) == []
+    assert file_watch.ready_files(0) == []
+
+  def test_hands_out_each_torrent_once(self):
+    file_watch = TorrentFileWatch(
+      "/tmp/input",
+      debounce=0,
+      watcher=FakeWatcher([["/tmp/input/foo.torrent"], ["/tmp/input/foo.fastresume", "/tmp/input/foo.torrent"]]),
+    )
+    filepath = copy_and_mkdir(get_torrent_path("qbit_ops"), "/tmp/input/foo.torrent")
+
+    assert file_watch.ready_files(0) == [filepath]
+    assert file_watch.ready_files(0) == []
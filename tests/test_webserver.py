@@ -3,25 +3,34 @@ import os
 import pytest
 import requests_mock
 
+from unittest.mock import patch
+
 from .helpers import SetupTeardown, get_torrent_path, copy_and_mkdir
 
+from src.async_api import AsyncGazelleAPI, EventLoopThread
+from src.index import OutputIndex
 from src.webserver import app as webserver_app
 
 
 @pytest.fixture()
 def app(red_api, ops_api):
+  runtime = EventLoopThread()
   webserver_app.config.update(
     {
       "input_dir": "/tmp/input",
       "output_dir": "/tmp/output",
-      "red_api": red_api,
-      "ops_api": ops_api,
+      "runtime": runtime,
+      "red_api": AsyncGazelleAPI(red_api),
+      "ops_api": AsyncGazelleAPI(ops_api),
       "injector": None,
+      "output_index": None,
     }
   )
 
   yield webserver_app
 
+  runtime.close()
+
 
 @pytest.fixture()
 def client(app):
@@ -86,6 +95,22 @@ class TestWebserverWebhook(SetupTeardown):
       assert response.status_code == 201
       assert response.json == {"status": "success", "message": "/tmp/output/OPS/foo [OPS].torrent"}
 
+  def test_uses_resident_output_index(self, app, client, infohash):
+    copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{infohash}.torrent")
+    app.config["output_index"] = OutputIndex("/tmp/output")
+
+    with requests_mock.Mocker() as m, patch("src.scanner.scan_files_of_extension") as mock_scan:
+      m.get(re.compile("action=torrent"), json=self.TORRENT_SUCCESS_RESPONSE)
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      first_response = client.post("/api/webhook", data={"infohash": infohash})
+      second_response = client.post("/api/webhook", data={"infohash": infohash})
+
+      assert first_response.status_code == 201
+      assert second_response.json == {"status": "success", "message": "/tmp/output/OPS/foo [OPS].torrent"}
+      assert mock_scan.call_count == 0
+      assert "/tmp/output/OPS/foo [OPS].torrent" in app.config["output_index"].values()
+
   def test_raises_error_if_torrent_not_found(self, client, infohash):
     copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{infohash}.torrent")
 
@@ -107,3 +132,16 @@ class TestWebserverWebhook(SetupTeardown):
       response = client.post("/api/webhook", data={"infohash": infohash})
       assert response.status_code == 500
       assert response.json == {"status": "error", "message": "An unknown error occurred in the API response from OPS"}
+
+  def test_returns_service_unavailable_if_tracker_is_down(self, app, client, infohash):
+    copy_and_mkdir(get_torrent_path("red_source"), f"/tmp/input/{infohash}.torrent")
+    circuit_breaker = app.config["ops_api"].api.circuit_breaker
+    for _ in range(circuit_breaker.failure_threshold):
+      circuit_breaker.record_failure()
+
+    with requests_mock.Mocker() as m:
+      m.get(re.compile("action=index"), json=self.ANNOUNCE_SUCCESS_RESPONSE)
+
+      response = client.post("/api/webhook", data={"infohash": infohash})
+      assert response.status_code == 503
+      assert response.json["message"].startswith("OPS is unavailable")